@@ -0,0 +1,129 @@
+"""
+Access-log sampling: which http_request lines ObservabilityMiddleware writes, decided after the response.
+
+Always kept (sample_rate 1): status >= 400, requests the rate limiter refused (including the 302
+redirects of login and upload), and requests slower than the route's threshold (ACCESS_LOG_SLOW_MS, overridden per route
+template by ACCESS_LOG_SLOW_MS_BY_ROUTE). Other requests: the first ACCESS_LOG_MIN_PER_ROUTE per route
+in each summary window are kept, so quiet routes stay fully visible; after that they are sampled at
+ACCESS_LOG_SAMPLE_RATE. Kept lines carry log_reason and sample_rate (weight a sampled line by 1/rate).
+
+Every ACCESS_LOG_SUMMARY_SECONDS, run_access_log_summaries() logs one http_request_summary line per
+(method, route) seen in the window: counts by outcome, lines kept, and latency p50/p95/p99/max from a
+bounded reservoir. All state lives on the event loop thread; no locks.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+
+import structlog
+
+from app.config import settings
+
+logger = structlog.get_logger(__name__)
+
+_RESERVOIR_SIZE = 512
+_MAX_ROUTES = 500
+_OTHER_ROUTE = "other"
+
+
+class _RouteWindow:
+    __slots__ = ("count", "errors", "rate_limited", "slow", "logged", "durations_ms", "max_ms")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.slow = 0
+        self.logged = 0
+        self.durations_ms: list[float] = []
+        self.max_ms = 0.0
+
+    def observe(self, duration_ms: float) -> None:
+        self.count += 1
+        if duration_ms > self.max_ms:
+            self.max_ms = duration_ms
+        if len(self.durations_ms) < _RESERVOIR_SIZE:
+            self.durations_ms.append(duration_ms)
+        else:
+            # Reservoir sampling keeps a uniform sample of the window for the quantiles.
+            i = random.randrange(self.count)
+            if i < _RESERVOIR_SIZE:
+                self.durations_ms[i] = duration_ms
+
+
+def _quantile(sorted_values: list[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class AccessLogSampler:
+    def __init__(self) -> None:
+        self._windows: dict[tuple[str, str], _RouteWindow] = {}
+
+    def _window(self, method: str, route: str) -> _RouteWindow:
+        key = (method, route)
+        window = self._windows.get(key)
+        if window is None:
+            if len(self._windows) >= _MAX_ROUTES:
+                key = (method, _OTHER_ROUTE)
+                window = self._windows.get(key)
+            if window is None:
+                window = self._windows[key] = _RouteWindow()
+        return window
+
+    def decide(self, *, method: str, route: str, status_code: int, duration_ms: float, rate_limited: bool) -> tuple[str, float] | None:
+        """(log_reason, sample_rate) when the line should be written, None to drop it."""
+        window = self._window(method, route)
+        window.observe(duration_ms)
+        if rate_limited:
+            window.rate_limited += 1
+            decision = ("rate_limited", 1.0)
+        elif status_code >= 400:
+            window.errors += 1
+            decision = ("error", 1.0)
+        elif duration_ms >= settings.ACCESS_LOG_SLOW_MS_BY_ROUTE.get(route, settings.ACCESS_LOG_SLOW_MS):
+            window.slow += 1
+            decision = ("slow", 1.0)
+        elif window.count <= settings.ACCESS_LOG_MIN_PER_ROUTE:
+            decision = ("baseline", 1.0)
+        else:
+            rate = settings.ACCESS_LOG_SAMPLE_RATE
+            if rate < 1.0 and random.random() >= rate:
+                return None
+            decision = ("sampled", rate)
+        window.logged += 1
+        return decision
+
+    def drain_summaries(self) -> list[dict]:
+        windows, self._windows = self._windows, {}
+        summaries = []
+        for (method, route), window in windows.items():
+            durations = sorted(window.durations_ms)
+            summaries.append(
+                {
+                    "method": method,
+                    "route": route,
+                    "count": window.count,
+                    "errors": window.errors,
+                    "rate_limited": window.rate_limited,
+                    "slow": window.slow,
+                    "logged": window.logged,
+                    "p50_ms": round(_quantile(durations, 0.50), 2),
+                    "p95_ms": round(_quantile(durations, 0.95), 2),
+                    "p99_ms": round(_quantile(durations, 0.99), 2),
+                    "max_ms": round(window.max_ms, 2),
+                }
+            )
+        return summaries
+
+
+access_log_sampler = AccessLogSampler()
+
+
+async def run_access_log_summaries() -> None:
+    """Lifespan task: one http_request_summary line per route per window."""
+    while True:
+        await asyncio.sleep(settings.ACCESS_LOG_SUMMARY_SECONDS)
+        for summary in access_log_sampler.drain_summaries():
+            logger.info("http_request_summary", window_s=settings.ACCESS_LOG_SUMMARY_SECONDS, **summary)
@@ -0,0 +1,209 @@
+"""
+Negotiated response compression (zstd, br, gzip) as pure ASGI middleware.
+
+The encoding is the first of COMPRESSION_ENCODINGS (server preference, fastest-to-decode first) that
+the client's Accept-Encoding allows with q > 0. Only compressible types are touched (JSON, NDJSON,
+HTML, text, JavaScript, SVG); responses that already carry Content-Encoding, 204/304, HEAD and range
+responses pass through. Complete bodies smaller than COMPRESSION_MIN_BYTES are sent as-is, and so is
+a compressed body that came out no smaller. Streamed bodies (more_body) are compressed chunk by chunk
+with a flush after each, so a streaming client still sees every chunk as soon as it is produced.
+
+Levels favour CPU over ratio because every body is compressed on the request path: zstd 3, brotli 4,
+gzip 6 by default. brotli and zstandard are optional imports; a missing codec is simply not offered.
+Bytes in and out per encoding: http_compression_bytes_total{encoding, direction}.
+"""
+
+from __future__ import annotations
+
+import zlib
+from typing import Protocol
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+from app.metrics import record_compression
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional codec
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional codec
+    zstandard = None
+
+_COMPRESSIBLE_PREFIXES = ("text/", "application/json", "application/x-ndjson", "application/javascript", "image/svg+xml")
+_COMPRESSIBLE_SUFFIXES = ("+json", "+xml")
+
+
+class _Encoder(Protocol):
+    def compress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+    def finish(self) -> bytes: ...
+
+
+class _GzipEncoder:
+    def __init__(self) -> None:
+        self._z = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._z.compress(data)
+
+    def flush(self) -> bytes:
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._z.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    def __init__(self) -> None:
+        self._b = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._b.process(data)
+
+    def flush(self) -> bytes:
+        return self._b.flush()
+
+    def finish(self) -> bytes:
+        return self._b.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self) -> None:
+        self._z = zstandard.ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._z.compress(data)
+
+    def flush(self) -> bytes:
+        return self._z.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._z.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+_ENCODERS: dict[str, type] = {"gzip": _GzipEncoder}
+if brotli is not None:
+    _ENCODERS["br"] = _BrotliEncoder
+if zstandard is not None:
+    _ENCODERS["zstd"] = _ZstdEncoder
+
+
+def available_encodings() -> list[str]:
+    return [name for name in settings.COMPRESSION_ENCODINGS if name in _ENCODERS]
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    """Server-preferred encoding the client accepts, or None for identity."""
+    if not accept_encoding:
+        return None
+    accepted: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name.strip().lower()] = q
+    wildcard = accepted.get("*", 0.0)
+    for name in available_encodings():
+        if accepted.get(name, wildcard) > 0:
+            return name
+    return None
+
+
+def compress_body(encoding: str, body: bytes) -> bytes:
+    encoder = _ENCODERS[encoding]()
+    return encoder.compress(body) + encoder.finish()
+
+
+def _compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return media_type.startswith(_COMPRESSIBLE_PREFIXES) or media_type.endswith(_COMPRESSIBLE_SUFFIXES)
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        encoding = negotiate_encoding(request_headers.get("accept-encoding"))
+        if encoding is None or "range" in request_headers:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+        encoder: _Encoder | None = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message.get("headers", []))
+                status = message["status"]
+                if (
+                    status in (204, 304)
+                    or status < 200
+                    or "content-encoding" in headers
+                    or not _compressible(headers.get("content-type", ""))
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body: bytes = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            assert start is not None
+            if encoder is None and not more_body:
+                # Whole body in one message: compress only when it is worth it.
+                if len(body) >= settings.COMPRESSION_MIN_BYTES:
+                    compressed = compress_body(encoding, body)
+                    if len(compressed) < len(body):
+                        record_compression(encoding, len(body), len(compressed))
+                        _mark_encoded(start, encoding, len(compressed))
+                        await send(start)
+                        await send({"type": "http.response.body", "body": compressed})
+                        return
+                MutableHeaders(scope=start).add_vary_header("Accept-Encoding")
+                await send(start)
+                await send(message)
+                return
+
+            if encoder is None:
+                encoder = _ENCODERS[encoding]()
+                _mark_encoded(start, encoding, None)
+                await send(start)
+            chunk = encoder.compress(body) + (encoder.flush() if more_body else encoder.finish())
+            record_compression(encoding, len(body), len(chunk))
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def _mark_encoded(start: Message, encoding: str, length: int | None) -> None:
+    headers = MutableHeaders(scope=start)
+    headers["Content-Encoding"] = encoding
+    headers.add_vary_header("Accept-Encoding")
+    if length is None:
+        del headers["Content-Length"]
+    else:
+        headers["Content-Length"] = str(length)
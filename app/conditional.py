@@ -0,0 +1,79 @@
+"""
+Conditional GET for responses derived from the invoices table (dashboard, its rows fragment, GET /invoices).
+
+Validators come from the caller's invoice data version (latest created_at + row count, under the
+same RLS scope as the page) plus whatever else the body depends on (page, user, CSRF token,
+template). Only requests that carry a validator (is_conditional) query the version up front, to
+answer 304 without listing; the rest derive it from the page they list. ETags are weak: the body is semantically identical, not byte-identical
+across compression codings. If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2), which
+matters because Last-Modified cannot see deletions and ETag can (the count changes).
+
+Invoices are insert-only in this app; an in-place UPDATE of an old row would not change the version.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.services.invoice_service import InvoiceDataVersion
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def invoice_etag(version: InvoiceDataVersion, *parts: object) -> str:
+    raw = repr((version["latest_created_at"], version["count"], *parts)).encode()
+    return f'W/"{hashlib.sha256(raw).hexdigest()[:32]}"'
+
+
+def last_modified(version: InvoiceDataVersion) -> str | None:
+    value = version["latest_created_at"]
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return format_datetime(dt.astimezone(timezone.utc), usegmt=True)
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_conditional(request: Request) -> bool:
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def is_not_modified(request: Request, etag: str, modified: str | None) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        wanted = _opaque(etag)
+        return any(_opaque(tag) == wanted for tag in if_none_match.split(","))
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since or not modified:
+        return False
+    try:
+        return parsedate_to_datetime(modified) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+
+def validator_headers(etag: str, modified: str | None) -> dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if modified:
+        headers["Last-Modified"] = modified
+    return headers
+
+
+def not_modified(etag: str, modified: str | None) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag, modified))
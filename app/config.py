@@ -1,11 +1,14 @@
 import logging
 from typing import Literal
 
-from pydantic import Field, field_validator
+from pydantic import Field, field_validator, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 WebAuthProvider = Literal["legacy", "supabase"]
 LogFormat = Literal["text", "json"]
+TracingExporter = Literal["otlp", "console", "file"]
+JsonRenderer = Literal["orjson", "stdlib"]
+SessionBackend = Literal["cookie", "redis"]
 
 class Settings(BaseSettings):
     """
@@ -89,6 +92,49 @@ class Settings(BaseSettings):
         default="rl:v1",
         description="Prefix for Redis rate-limit keys.",
     )
+    RATE_LIMIT_MEMORY_MAX_KEYS: int = Field(
+        default=100_000,
+        ge=100,
+        description="Max client/action pairs tracked by the in-process limiter; least recently seen are evicted.",
+    )
+    RATE_LIMIT_MEMORY_SHARDS: int = Field(
+        default=16,
+        ge=1,
+        le=1024,
+        description="Independently locked shards for the in-process limiter state.",
+    )
+    RATE_LIMIT_MEMORY_SWEEP_SECONDS: int = Field(
+        default=60,
+        ge=1,
+        description="Interval of the background sweep that drops idle in-process limiter entries.",
+    )
+    RATE_LIMIT_LEASE_FRACTION: float = Field(
+        default=0.1,
+        gt=0,
+        le=1,
+        description=(
+            "Non-strict limits lease this fraction of the limit (at least RATE_LIMIT_LEASE_MIN_TOKENS) from Redis "
+            "per round trip and spend it locally."
+        ),
+    )
+    RATE_LIMIT_LEASE_MIN_TOKENS: int = Field(
+        default=2,
+        ge=1,
+        description=(
+            "Smallest lease, capped at the limit itself. Limits whose lease would be under 2 tokens are checked "
+            "against Redis on every request (set 1 to lease only where the fraction alone yields 2+)."
+        ),
+    )
+    RATE_LIMIT_LEASE_MAX_SECONDS: float = Field(
+        default=5.0,
+        gt=0,
+        description="Max lifetime of a local lease; unspent tokens are then given back to Redis (bounds staleness).",
+    )
+    RATE_LIMIT_REDIS_RETRY_SECONDS: float = Field(
+        default=5.0,
+        gt=0,
+        description="After a Redis error, limit locally for this long before trying Redis again.",
+    )
     RATE_LIMIT_TRUST_X_FORWARDED_FOR: bool = Field(
         default=False,
         description="If True, use first X-Forwarded-For hop as client IP (set True behind a trusted reverse proxy).",
@@ -148,7 +194,7 @@ class Settings(BaseSettings):
             return None
         return value
 
-    @field_validator("METRICS_BEARER_TOKEN", mode="before")
+    @field_validator("METRICS_BEARER_TOKEN", "TRACING_OTLP_ENDPOINT", "SUPABASE_JWT_SECRET", "SUPABASE_JWKS_URL", mode="before")
     @classmethod
     def empty_metrics_bearer_to_none(cls, value: object) -> object:
         if value == "":
@@ -163,6 +209,24 @@ class Settings(BaseSettings):
         default="text",
         description="text = human-readable console; json = one JSON object per line (log aggregators).",
     )
+    LOG_JSON_RENDERER: JsonRenderer = Field(
+        default="orjson",
+        description="Serializer for LOG_FORMAT=json: orjson (fast, compact) or stdlib json.",
+    )
+    LOG_QUEUE_ENABLED: bool = Field(
+        default=True,
+        description="Write log lines from a background thread via a bounded queue instead of blocking the caller on stdout.",
+    )
+    LOG_QUEUE_MAX_LINES: int = Field(
+        default=10000,
+        ge=1,
+        description="Log queue bound; lines beyond it are dropped and counted (log_lines_dropped_total).",
+    )
+    LOG_QUEUE_BATCH_LINES: int = Field(
+        default=256,
+        ge=1,
+        description="Most lines the log writer thread joins into a single stdout write.",
+    )
     OBSERVABILITY_METRICS_ENABLED: bool = Field(
         default=False,
         description="Expose Prometheus metrics at GET /metrics (enable in private networks or behind auth).",
@@ -178,6 +242,72 @@ class Settings(BaseSettings):
         default=True,
         description="Emit one structured log line per HTTP request (method, path, status, duration_ms, correlation_id).",
     )
+    TRACING_ENABLED: bool = Field(
+        default=False,
+        description="Record OpenTelemetry spans (HTTP server, session, rate limit, pipeline stages, LLM, PostgREST/httpx).",
+    )
+    TRACING_EXPORTER: TracingExporter = Field(
+        default="otlp",
+        description="otlp = OTLP/HTTP to a collector; console = stdout; file = JSON lines in TRACING_FILE_PATH (offline testing).",
+    )
+    TRACING_OTLP_ENDPOINT: str | None = Field(
+        default=None,
+        description="OTLP/HTTP traces URL (e.g. http://otel-collector:4318/v1/traces). Unset: OTEL_EXPORTER_OTLP_* env vars / localhost.",
+    )
+    TRACING_FILE_PATH: str = Field(
+        default="traces.jsonl",
+        description="Span output file for TRACING_EXPORTER=file.",
+    )
+    TRACING_SAMPLE_RATIO: float = Field(
+        default=1.0,
+        ge=0.0,
+        le=1.0,
+        description="Fraction of new traces sampled; requests carrying a traceparent follow the caller's decision.",
+    )
+    TRACING_SERVICE_NAME: str = Field(
+        default="email-invoice-automation",
+        description="service.name resource attribute on exported spans.",
+    )
+    PROFILER_ENABLED: bool = Field(
+        default=False,
+        description="Expose GET /admin/profile (stack-sampling profiler; also requires METRICS_BEARER_TOKEN). One session per worker.",
+    )
+    PROFILER_MAX_SECONDS: float = Field(
+        default=60.0,
+        gt=0,
+        description="Upper bound on one profiling session; longer requests are clamped.",
+    )
+    PROFILER_SAMPLE_HZ: int = Field(
+        default=100,
+        ge=1,
+        le=1000,
+        description="Stack samples per second while a profiling session runs.",
+    )
+    ACCESS_LOG_SAMPLE_RATE: float = Field(
+        default=1.0,
+        ge=0.0,
+        le=1.0,
+        description="Fraction of ordinary (fast, < 400, not rate-limited) requests written to the access log once a route's baseline is met.",
+    )
+    ACCESS_LOG_MIN_PER_ROUTE: int = Field(
+        default=10,
+        ge=0,
+        description="Ordinary requests per route logged unsampled in each summary window (keeps quiet routes visible).",
+    )
+    ACCESS_LOG_SLOW_MS: float = Field(
+        default=1000.0,
+        gt=0,
+        description="Requests at or above this duration are always logged (log_reason=slow).",
+    )
+    ACCESS_LOG_SLOW_MS_BY_ROUTE: dict[str, float] = Field(
+        default_factory=dict,
+        description='Per-route slow thresholds by route template, JSON, e.g. {"/upload": 5000, "/invoices": 300}.',
+    )
+    ACCESS_LOG_SUMMARY_SECONDS: int = Field(
+        default=60,
+        ge=0,
+        description="Interval for http_request_summary lines (per-route counts and latency quantiles); 0 disables them.",
+    )
     APP_DEBUG: bool = Field(
         default=False,
         description="If true, 422 validation responses include field-level errors (local dev only). Never enable in production.",
@@ -189,7 +319,185 @@ class Settings(BaseSettings):
     API_KEY_CACHE_SECONDS: int = Field(
         default=30,
         ge=0,
-        description="TTL for caching machine_api_keys rows from Supabase (service role). Set 0 to reload every request.",
+        description=(
+            "TTL for the machine_api_keys index (service role). Expired indexes keep serving while a background "
+            "reload runs (stale-while-revalidate). Set 0 to reload on every request."
+        ),
+    )
+    API_KEY_INVALIDATION_CHANNEL: str = Field(
+        default="machine_api_keys:invalidate",
+        description="Redis pub/sub channel; any message makes every worker delta-reload its API key index.",
+    )
+    API_KEY_DELTA_OVERLAP_SECONDS: float = Field(
+        default=30.0,
+        ge=0,
+        description=(
+            "Delta key reloads re-read rows updated this long before the watermark, so a change whose transaction "
+            "started before a reload but committed after it is not skipped (keep above your longest key-admin transaction)."
+        ),
+    )
+    API_KEY_NEGATIVE_CACHE_SECONDS: int = Field(
+        default=60,
+        ge=1,
+        description="Remember unknown API key digests this long; repeats are rejected without index work or reloads.",
+    )
+    API_KEY_NEGATIVE_CACHE_MAX_ENTRIES: int = Field(
+        default=10_000,
+        ge=100,
+        description="Cap on remembered unknown API key digests (oldest evicted first).",
+    )
+    API_KEY_MISS_REFRESH_SECONDS: int = Field(
+        default=10,
+        ge=1,
+        description="A first-time unknown key triggers a background index reload when the index is at least this old.",
+    )
+    MACHINE_AUDIT_FLUSH_INTERVAL_MS: int = Field(
+        default=1000,
+        ge=50,
+        description="Background flush interval for buffered machine_api_audit rows.",
+    )
+    MACHINE_AUDIT_BATCH_SIZE: int = Field(
+        default=200,
+        ge=1,
+        le=5000,
+        description="Flush early once this many audit rows are buffered (also the bulk insert size).",
+    )
+    MACHINE_AUDIT_BUFFER_MAX: int = Field(
+        default=10_000,
+        ge=100,
+        description="Max buffered audit rows per worker; beyond this new rows are dropped and counted.",
+    )
+    API_KEY_TOUCH_DEBOUNCE_SECONDS: int = Field(
+        default=60,
+        ge=0,
+        description="At most one machine_api_keys.last_used_at update per key per interval.",
+    )
+    API_KEY_DEFAULT_RATE_LIMIT_PER_SECOND: int = Field(
+        default=10,
+        ge=0,
+        description="Machine requests/sec per API key (or the legacy shared secret) unless the key row overrides it; 0 = unlimited.",
+    )
+    API_KEY_DEFAULT_LLM_EXTRACTIONS_PER_DAY: int = Field(
+        default=500,
+        ge=0,
+        description="LLM extractions per rolling 24h per API key unless the key row overrides it; 0 = unlimited.",
+    )
+    LLM_USAGE_FLUSH_SECONDS: int = Field(
+        default=60,
+        ge=1,
+        description="How often per-caller LLM token totals are appended to public.llm_token_usage.",
+    )
+    LLM_USAGE_MAX_PRINCIPALS: int = Field(
+        default=10_000,
+        ge=1,
+        description="Distinct callers tracked per flush window; further callers are summed as 'overflow'.",
+    )
+    IDEMPOTENCY_TTL_SECONDS: int = Field(
+        default=24 * 3600,
+        ge=60,
+        description="How long a completed machine POST response is replayed for the same Idempotency-Key.",
+    )
+    IDEMPOTENCY_PENDING_TTL_SECONDS: int = Field(
+        default=300,
+        ge=10,
+        description="Lease on an in-flight Idempotency-Key; retries during it get 409 instead of a second parse.",
+    )
+    IDEMPOTENCY_REDIS_KEY_PREFIX: str = Field(
+        default="idem:v1",
+        description="Prefix for Redis idempotency records (shares REDIS_URL with rate limits).",
+    )
+    IDEMPOTENCY_MEMORY_MAX_ENTRIES: int = Field(
+        default=10_000,
+        ge=100,
+        description="Cap on in-process idempotency records when Redis is not configured (oldest evicted first).",
+    )
+    SUPABASE_JWT_SECRET: str | None = Field(
+        default=None,
+        description="Project JWT secret (legacy HS256 signing) for verifying dashboard access tokens locally. Server-side only.",
+    )
+    SUPABASE_JWKS_URL: str | None = Field(
+        default=None,
+        description="JWKS for asymmetric JWT signing keys; default {SUPABASE_URL}/auth/v1/.well-known/jwks.json.",
+    )
+    SUPABASE_JWKS_CACHE_SECONDS: int = Field(
+        default=600,
+        ge=30,
+        description="How long fetched JWKS keys are trusted before refetching (unknown key ids refetch sooner).",
+    )
+    SESSION_TOKEN_REFRESH_MARGIN_SECONDS: int = Field(
+        default=120,
+        ge=0,
+        description="Refresh the dashboard session's Supabase access token when it expires within this many seconds.",
+    )
+    SESSION_TOKEN_LEEWAY_SECONDS: int = Field(
+        default=10,
+        ge=0,
+        description="A token this close to expiry whose refresh failed is treated as expired (clock skew / in-flight margin).",
+    )
+    SESSION_BACKEND: SessionBackend = Field(
+        default="cookie",
+        description="cookie = whole session in the signed cookie; redis = opaque id cookie, session stored in Redis (needs REDIS_URL).",
+    )
+    SESSION_REDIS_KEY_PREFIX: str = Field(
+        default="session:v1",
+        description="Prefix for Redis session records (SESSION_BACKEND=redis; shares REDIS_URL with rate limits).",
+    )
+    SESSION_STORE_SKIP_PATHS: list[str] = Field(
+        default=["/health", "/metrics", "/admin", "/invoices", "/process-mock-email", "/api"],
+        description="Path prefixes that skip cookie-session decoding (SESSION_BACKEND=cookie; the redis backend loads sessions on demand) (JSON list).",
+    )
+    COMPRESSION_ENABLED: bool = Field(
+        default=True,
+        description="Compress JSON / HTML / text responses with the best encoding the client accepts (zstd, br, gzip).",
+    )
+    COMPRESSION_MIN_BYTES: int = Field(
+        default=1024,
+        ge=0,
+        description="Complete response bodies smaller than this are sent uncompressed (streamed bodies are always compressed).",
+    )
+    COMPRESSION_ENCODINGS: list[Literal["zstd", "br", "gzip"]] = Field(
+        default=["zstd", "br", "gzip"],
+        description="Encodings offered, in server preference order (JSON list).",
+    )
+    COMPRESSION_ZSTD_LEVEL: int = Field(default=3, ge=1, le=22, description="zstd level for responses.")
+    COMPRESSION_BROTLI_QUALITY: int = Field(default=4, ge=0, le=11, description="Brotli quality for responses.")
+    COMPRESSION_GZIP_LEVEL: int = Field(default=6, ge=1, le=9, description="gzip level for responses.")
+    HTTP_CLIENT_HTTP2: bool = Field(
+        default=True,
+        description="Negotiate HTTP/2 on the shared outbound httpx client (Supabase Auth); falls back to HTTP/1.1.",
+    )
+    HTTP_CLIENT_MAX_CONNECTIONS: int = Field(
+        default=50,
+        ge=1,
+        description="Connection cap for the shared outbound httpx client per worker.",
+    )
+    HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS: int = Field(
+        default=10,
+        ge=0,
+        description="Idle keep-alive connections the shared client keeps per worker.",
+    )
+    HTTP_CLIENT_KEEPALIVE_EXPIRY_SECONDS: float = Field(
+        default=120.0,
+        ge=0,
+        description="Idle time before a pooled connection is closed.",
+    )
+    HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS: float = Field(
+        default=5.0,
+        gt=0,
+        description="Outbound connect timeout (DNS + TCP + TLS).",
+    )
+    HTTP_CLIENT_TIMEOUT_SECONDS: float = Field(
+        default=20.0,
+        gt=0,
+        description="Outbound read / write / pool-acquire timeout.",
+    )
+    HTTP_CLIENT_WARMUP_SECONDS: int = Field(
+        default=0,
+        ge=0,
+        description=(
+            "When > 0, ping Supabase Auth /health at startup and at this interval to keep a warm connection "
+            "(keep it below HTTP_CLIENT_KEEPALIVE_EXPIRY_SECONDS); 0 disables."
+        ),
     )
     INVOICE_LIST_DEFAULT_LIMIT: int = Field(
         default=50,
@@ -203,6 +511,40 @@ class Settings(BaseSettings):
         le=500,
         description="Maximum allowed limit query param for GET /invoices and dashboard page_size.",
     )
+    CONTENT_HASH_BATCH_MAX: int = Field(
+        default=1000,
+        ge=1,
+        description="Most hashes one POST /invoices/by-hash may check.",
+    )
+    CHANGE_FEED_MAX_WAIT_SECONDS: float = Field(
+        default=25.0,
+        ge=0,
+        description="Longest long-poll GET /invoices/changes?wait= may hold (keep under proxy idle timeouts).",
+    )
+    CHANGE_FEED_RECHECK_SECONDS: float = Field(
+        default=10.0,
+        gt=0,
+        description="A waiting change-feed request re-queries at least this often, even without a notification.",
+    )
+    CHANGE_FEED_SETTLE_SECONDS: float = Field(
+        default=2.0,
+        ge=0,
+        description="Rows younger than this are held back from the change feed so in-flight inserts cannot be skipped.",
+    )
+    CHANGE_FEED_MAX_WAITERS: int = Field(
+        default=1000,
+        ge=0,
+        description="Long-polls held per worker; beyond this, GET /invoices/changes answers immediately.",
+    )
+    CHANGE_FEED_CHANNEL: str = Field(
+        default="invoices:changes:v1",
+        description="Redis pub/sub channel announcing new invoices to long-polling workers.",
+    )
+    INVOICE_STREAM_MAX_LIMIT: int = Field(
+        default=10_000,
+        ge=1,
+        description="Maximum limit for GET /invoices streamed as NDJSON (rows are never held in memory together).",
+    )
 
     @field_validator("LOG_LEVEL", mode="before")
     @classmethod
@@ -214,6 +556,12 @@ class Settings(BaseSettings):
             return upper
         return "INFO"
 
+    @model_validator(mode="after")
+    def redis_sessions_need_redis(self) -> "Settings":
+        if self.SESSION_BACKEND == "redis" and not self.REDIS_URL:
+            raise ValueError("SESSION_BACKEND=redis requires REDIS_URL")
+        return self
+
     model_config = SettingsConfigDict(
         env_file=".env",
         extra="ignore"
@@ -1,9 +1,34 @@
+import base64
 import secrets
 
 from starlette.requests import Request
 
 
-def get_or_create_csrf_token(request: Request) -> str:
+def _xor(a: bytes, b: bytes) -> bytes:
+    return bytes(x ^ y for x, y in zip(a, b))
+
+
+def _mask(secret: str) -> str:
+    # A fresh one-time pad per render: the page never repeats the token's bytes, so a compressed
+    # response cannot be used to guess it byte by byte (BREACH). Every masked form stays valid.
+    raw = secret.encode("ascii")
+    pad = secrets.token_bytes(len(raw))
+    return base64.urlsafe_b64encode(pad + _xor(pad, raw)).decode("ascii").rstrip("=")
+
+
+def _unmask(token: bytes) -> bytes | None:
+    try:
+        raw = base64.urlsafe_b64decode(token + b"=" * (-len(token) % 4))
+    except ValueError:
+        return None
+    half = len(raw) // 2
+    if not half or len(raw) % 2:
+        return None
+    return _xor(raw[:half], raw[half:])
+
+
+def csrf_secret(request: Request) -> str:
+    """The session's CSRF secret (created on first use); never rendered as is."""
     existing = request.session.get("_csrf_token")
     if isinstance(existing, str) and len(existing) >= 32:
         return existing
@@ -12,10 +37,20 @@ def get_or_create_csrf_token(request: Request) -> str:
     return token
 
 
+def get_or_create_csrf_token(request: Request) -> str:
+    """Token to embed in a form: the session secret, masked differently on every call."""
+    return _mask(csrf_secret(request))
+
+
 def verify_csrf_token(request: Request, submitted: str | None) -> bool:
     if not submitted:
         return False
     expected = request.session.get("_csrf_token")
     if not isinstance(expected, str):
         return False
-    return secrets.compare_digest(submitted, expected)
+    submitted_raw, expected_raw = submitted.encode("utf-8"), expected.encode("ascii")
+    # Unmasked tokens are still accepted from pages rendered before masking was introduced.
+    if secrets.compare_digest(submitted_raw, expected_raw):
+        return True
+    unmasked = _unmask(submitted_raw)
+    return unmasked is not None and secrets.compare_digest(unmasked, expected_raw)
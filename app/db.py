@@ -58,4 +58,9 @@ def get_supabase_for_api() -> Client:
     return create_anon_client()
 
 
+def api_key_for_machine_routes() -> str:
+    """The key behind get_supabase_for_api(), for direct PostgREST calls (streamed GET /invoices)."""
+    return settings.SUPABASE_SERVICE_ROLE_KEY or settings.SUPABASE_ANON_KEY
+
+
 supabase = create_anon_client()
@@ -112,9 +112,10 @@ def register_exception_handlers(app: FastAPI) -> None:
             return JSONResponse(_json_safe_payload(GENERIC_SERVER_JSON, request), status_code=exc.status_code)
 
         detail = exc.detail
+        headers = getattr(exc, "headers", None)
         if isinstance(detail, str):
-            return JSONResponse({"detail": detail}, status_code=exc.status_code)
-        return JSONResponse({"detail": detail}, status_code=exc.status_code)
+            return JSONResponse({"detail": detail}, status_code=exc.status_code, headers=headers)
+        return JSONResponse({"detail": detail}, status_code=exc.status_code, headers=headers)
 
     @app.exception_handler(Exception)
     async def unhandled_exception_handler(request: Request, exc: Exception) -> JSONResponse | HTMLResponse | RedirectResponse:
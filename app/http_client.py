@@ -0,0 +1,111 @@
+"""
+Shared outbound httpx.AsyncClient (Supabase Auth today; any new async outbound HTTP should use it).
+
+One pool per worker: keep-alive connections (HTTP/2 when the server offers it) are reused across
+logins and logouts instead of paying DNS + TCP + TLS on every call. lifespan closes it on shutdown.
+The client is bound to the event loop that created it; a call from another loop (TestClient starts
+one per request) gets a fresh client.
+
+Metrics: http_client_requests_total{host, connection} (new vs reused), http_client_connect_duration_seconds
+{host, phase} (tcp, tls) from httpcore trace events, and http_client_pool_connections{state} after
+each request.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+
+import httpx
+import structlog
+
+from app.config import settings
+from app.metrics import record_http_client_connect, record_http_client_pool, record_http_client_request
+
+logger = structlog.get_logger(__name__)
+
+_client: httpx.AsyncClient | None = None
+_client_loop: asyncio.AbstractEventLoop | None = None
+
+_PHASES = {"connection.connect_tcp": "tcp", "connection.start_tls": "tls"}
+
+
+def _pool_connections(client: httpx.AsyncClient) -> list:
+    # httpx has no public pool stats; read httpcore's pool behind the default transport.
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    return list(getattr(pool, "connections", None) or ())
+
+
+async def _observe_request(request: httpx.Request) -> None:
+    started: dict[str, float] = {}
+    opened = False
+
+    async def trace(event: str, _info: dict) -> None:
+        nonlocal opened
+        name, _, stage = event.rpartition(".")
+        phase = _PHASES.get(name)
+        if phase is None:
+            return
+        if stage == "started":
+            started[phase] = time.perf_counter()
+        elif stage == "complete" and phase in started:
+            opened = True
+            record_http_client_connect(request.url.host, phase, time.perf_counter() - started.pop(phase))
+
+    def connection_kind() -> str:
+        return "new" if opened else "reused"
+
+    request.extensions["trace"] = trace
+    request.extensions["app_connection_kind"] = connection_kind
+
+
+async def _observe_response(response: httpx.Response) -> None:
+    kind = response.request.extensions.get("app_connection_kind")
+    record_http_client_request(response.request.url.host, kind() if kind else "unknown")
+    if _client is not None:
+        connections = _pool_connections(_client)
+        idle = sum(1 for c in connections if c.is_idle())
+        record_http_client_pool(active=len(connections) - idle, idle=idle)
+
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=settings.HTTP_CLIENT_HTTP2,
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(settings.HTTP_CLIENT_TIMEOUT_SECONDS, connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS),
+        event_hooks={"request": [_observe_request], "response": [_observe_response]},
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop or _client.is_closed:
+        _client = _build_client()
+        _client_loop = loop
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client, _client_loop
+    client, _client, _client_loop = _client, None, None
+    if client is not None:
+        await client.aclose()
+
+
+async def run_http_client_warmup() -> None:
+    """
+    Lifespan task (HTTP_CLIENT_WARMUP_SECONDS > 0): GET Supabase Auth /health now and on every interval,
+    so the first login after an idle night reuses a warm connection instead of paying DNS + TLS.
+    """
+    url = f"{settings.SUPABASE_URL.rstrip('/')}/auth/v1/health"
+    while True:
+        try:
+            await get_http_client().get(url, headers={"apikey": settings.SUPABASE_ANON_KEY})
+        except httpx.HTTPError as exc:
+            logger.warning("http_client_warmup_failed", error=str(exc))
+        await asyncio.sleep(settings.HTTP_CLIENT_WARMUP_SECONDS)
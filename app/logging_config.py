@@ -1,20 +1,136 @@
 """
 Structured logging: JSON lines for production aggregators, human-readable text locally.
 Call configure_logging() once at process startup (before other app imports log).
+
+With LOG_QUEUE_ENABLED (default), rendered lines go to a bounded in-memory queue and a writer thread
+writes them to stdout in batches, so a slow stdout (container runtime backpressure) never blocks the
+event loop. When the queue is full, new lines are dropped and counted in log_lines_dropped_total.
+lifespan calls flush_logging() on shutdown; an atexit hook drains whatever is left.
 """
 
 from __future__ import annotations
 
+import atexit
 import logging
+import os
 import sys
+import threading
+from collections import deque
+from typing import Any, TextIO
 
+import orjson
 import structlog
 
+from app.metrics import record_log_lines_dropped
+
 _configured = False
+_sink: QueueLogSink | None = None
+
+
+class QueueLogSink:
+    """Bounded line queue drained by one daemon writer thread (one write + flush per batch)."""
+
+    def __init__(self, stream: TextIO, *, max_lines: int, batch_lines: int) -> None:
+        self.stream = stream
+        self.max_lines = max_lines
+        self.batch_lines = batch_lines
+        self.dropped = 0
+        self._lines: deque[str] = deque()
+        self._cond = threading.Condition()
+        self._writing = False
+        self._thread: threading.Thread | None = None
+        self._pid = 0
+        self._lock = threading.Lock()
+
+    def _ensure_writer(self) -> None:
+        # Per process: a writer started before a fork (gunicorn --preload) does not exist in the child.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            pid = os.getpid()
+            if self._pid == pid:
+                return
+            if self._pid:
+                # Forked child: the parent's writer still owns the lines it queued before the fork.
+                self._lines.clear()
+            self._cond = threading.Condition()
+            self._writing = False
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+            self._pid = pid
+
+    def put(self, line: str) -> None:
+        self._ensure_writer()
+        with self._cond:
+            if len(self._lines) >= self.max_lines:
+                self.dropped += 1
+                full = True
+            else:
+                self._lines.append(line)
+                full = False
+                if len(self._lines) == 1:
+                    self._cond.notify_all()
+        if full:
+            record_log_lines_dropped(1)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._lines:
+                    self._cond.wait()
+                n = min(len(self._lines), self.batch_lines)
+                batch = [self._lines.popleft() for _ in range(n)]
+                self._writing = True
+            try:
+                self.stream.write("\n".join(batch) + "\n")
+                self.stream.flush()
+            except Exception:
+                # Nowhere left to report a broken stdout; count the lines as dropped.
+                with self._cond:
+                    self.dropped += len(batch)
+                record_log_lines_dropped(len(batch))
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every queued line is written; False if the writer did not catch up in time."""
+        if self._pid != os.getpid():
+            return True
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._lines and not self._writing, timeout)
+
+
+class QueueLogger:
+    """structlog logger whose every level method enqueues the rendered line."""
+
+    def __init__(self, sink: QueueLogSink) -> None:
+        self._sink = sink
+
+    def msg(self, message: str) -> None:
+        self._sink.put(message)
+
+    log = debug = info = warn = warning = error = critical = exception = fatal = msg
+
+
+def _orjson_dumps(obj: Any, **kwargs: Any) -> str:
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS, **kwargs).decode()
+
+
+def _json_renderer(kind: str) -> structlog.processors.JSONRenderer:
+    if kind == "orjson":
+        return structlog.processors.JSONRenderer(serializer=_orjson_dumps)
+    return structlog.processors.JSONRenderer()
+
+
+def flush_logging(timeout: float = 5.0) -> None:
+    if _sink is not None:
+        _sink.flush(timeout)
 
 
 def configure_logging() -> None:
-    global _configured
+    global _configured, _sink
     if _configured:
         return
     from app.config import settings
@@ -31,15 +147,25 @@ def configure_logging() -> None:
         structlog.processors.format_exc_info,
     ]
     if settings.LOG_FORMAT == "json":
-        processors = shared + [structlog.processors.JSONRenderer()]
+        processors = shared + [_json_renderer(settings.LOG_JSON_RENDERER)]
     else:
         processors = shared + [structlog.dev.ConsoleRenderer(colors=sys.stderr.isatty())]
 
+    if settings.LOG_QUEUE_ENABLED:
+        _sink = QueueLogSink(sys.stdout, max_lines=settings.LOG_QUEUE_MAX_LINES, batch_lines=settings.LOG_QUEUE_BATCH_LINES)
+        atexit.register(flush_logging)
+        sink = _sink
+
+        def logger_factory(*_args: Any) -> QueueLogger:
+            return QueueLogger(sink)
+    else:
+        logger_factory = structlog.PrintLoggerFactory(file=sys.stdout)
+
     structlog.configure(
         processors=processors,
         wrapper_class=structlog.make_filtering_bound_logger(level),
         context_class=dict,
-        logger_factory=structlog.PrintLoggerFactory(file=sys.stdout),
+        logger_factory=logger_factory,
         cache_logger_on_first_use=True,
     )
     _configured = True
@@ -1,50 +1,101 @@
+import asyncio
 import os
+import time
 from contextlib import asynccontextmanager
 
+import orjson
 import redis.asyncio as redis_async
 import structlog
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from app.logging_config import configure_logging
+from app.logging_config import configure_logging, flush_logging
 
 configure_logging()
 
+from app.tracing import configure_tracing, shutdown_tracing
+
+configure_tracing()
+
 import secrets
 
 logger = structlog.get_logger(__name__)
 
-from fastapi import FastAPI, Depends, Request, Form, File, UploadFile, HTTPException, Query, Header
-from fastapi.responses import HTMLResponse, RedirectResponse
-from starlette.responses import Response
+from fastapi import Body, FastAPI, Depends, Request, Form, File, UploadFile, HTTPException, Query, Header
+from fastapi import Path as PathParam
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse
+from starlette.responses import Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from starlette.middleware.sessions import SessionMiddleware
-from app.security_headers import CspNonceMiddleware, SecurityHeadersMiddleware
+from app.security_headers import SecurityHeadersMiddleware
 from app.observability import ObservabilityMiddleware
+from app.session_store import CookieSessionMiddleware, RedisSessionMiddleware, load_session
+from app.compression import CompressionMiddleware
+from app.responses import FastJSONResponse
 from pathlib import Path
-from app.csrf import get_or_create_csrf_token, verify_csrf_token
-from app.services.api_key_auth import require_machine_scopes
+from app.csrf import csrf_secret, get_or_create_csrf_token, verify_csrf_token
+from app.conditional import (
+    invoice_etag,
+    is_conditional,
+    is_not_modified,
+    last_modified,
+    not_modified,
+    validator_headers,
+)
+from app.services.api_key_auth import (
+    charge_llm_extraction,
+    machine_principal,
+    require_machine_scopes,
+    run_api_key_invalidation_listener,
+    schedule_api_key_refresh,
+)
 from app.config import settings
-from app.db import get_supabase_for_api, get_supabase_for_request
+from app.db import api_key_for_machine_routes, get_supabase_for_api, get_supabase_for_request
 from app.services.supabase_web_auth import sign_in_with_email_password, sign_out_with_access_token
+from app.services.web_session import ensure_web_session
 from app.services.email_parser import (
+    parse_invoice_bytes,
     parse_mock_email,
     parse_eml_invoice,
     parse_msg_invoice,
     parse_pdf_invoice,
 )
-from app.services.invoice_service import hash_bytes, save_invoice, list_invoices
+from app.services.audit_writer import audit_writer
+from app.services.llm_usage import llm_usage, set_llm_principal
+from app.services.invoice_changes import invoice_change_notifier, list_invoice_changes, run_invoice_change_listener
+from app.services.invoice_stream import InvoiceStreamError, open_invoice_row_stream
+from app.services.invoice_service import (
+    InvoiceDataVersion,
+    find_invoices_by_content_hash,
+    get_invoice_data_version,
+    get_latest_invoice_created_at,
+    invoice_data_version_from_page,
+    hash_bytes,
+    list_invoices,
+    save_invoice,
+)
+from app.services.idempotency import (
+    begin_idempotent_request,
+    complete_idempotent_request,
+    idempotency_key_from_request,
+    release_idempotent_request,
+    request_fingerprint,
+)
 from app.services.upload_security import (
     build_safe_temp_path,
+    extension_from_content_type,
     extension_from_upload_filename,
+    read_stream_with_size_limit,
     read_upload_with_size_limit,
     reconcile_extension,
     run_optional_antivirus_scan,
     sniff_content_kind,
 )
-from app.rate_limit import check_rate_limited
-from app.metrics import render_metrics_payload
+from app.rate_limit import check_rate_limit, run_rate_limit_sweeper
+from app.access_log import run_access_log_summaries
+from app.http_client import close_http_client, run_http_client_warmup
+from app.metrics import mark_worker_dead, record_change_feed_poll, record_pipeline_bytes, render_metrics_payload, time_stage
+from app.profiler import ProfilerBusy, sample_stacks, to_collapsed, to_speedscope
 from app.error_handlers import register_exception_handlers
 
 
@@ -85,26 +136,65 @@ async def lifespan(app: FastAPI):
         app.state.redis = redis_client
     else:
         app.state.redis = None
+    background_tasks: list[asyncio.Task] = [asyncio.create_task(run_rate_limit_sweeper())]
+    if settings.OBSERVABILITY_ACCESS_LOG and settings.ACCESS_LOG_SUMMARY_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(run_access_log_summaries()))
+    if settings.HTTP_CLIENT_WARMUP_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(run_http_client_warmup()))
+    if settings.SUPABASE_SERVICE_ROLE_KEY:
+        schedule_api_key_refresh()
+        background_tasks.append(asyncio.create_task(audit_writer.run()))
+        background_tasks.append(asyncio.create_task(llm_usage.run()))
+        if redis_client is not None:
+            background_tasks.append(asyncio.create_task(run_api_key_invalidation_listener(redis_client)))
+    if redis_client is not None:
+        background_tasks.append(asyncio.create_task(run_invoice_change_listener(redis_client)))
     yield
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    if settings.SUPABASE_SERVICE_ROLE_KEY:
+        await audit_writer.aclose()
+        await llm_usage.aclose()
     if redis_client is not None:
         await redis_client.aclose()
+    await close_http_client()
+    shutdown_tracing()
+    mark_worker_dead(os.getpid())
+    flush_logging()
 
 
 templates = Jinja2Templates(directory="app/templates")
-app = FastAPI(title="Email Invoice Automation Demo", lifespan=lifespan)
-
-app.add_middleware(
-    SessionMiddleware,
-    secret_key=settings.SESSION_SECRET,
-    max_age=settings.SESSION_MAX_AGE_SECONDS,
-    same_site=settings.SESSION_COOKIE_SAMESITE,
-    https_only=settings.SESSION_COOKIE_SECURE,
-)
-if settings.SECURITY_HEADERS_ENABLED:
-    app.add_middleware(SecurityHeadersMiddleware)
+# Deploys that change a template must not be answered with 304 for pages cached from the old one.
+_TEMPLATES_TAG = hash_bytes(
+    b"".join(p.read_bytes() for p in sorted(Path("app/templates").glob("*.html")))
+)[:16]
+app = FastAPI(title="Email Invoice Automation Demo", lifespan=lifespan, default_response_class=FastJSONResponse)
+
+if settings.COMPRESSION_ENABLED:
+    # Innermost: every outer middleware (session cookie, metrics, security headers) sees the encoded response.
+    app.add_middleware(CompressionMiddleware)
+
+if settings.SESSION_BACKEND == "redis":
+    app.add_middleware(
+        RedisSessionMiddleware,
+        max_age=settings.SESSION_MAX_AGE_SECONDS,
+        same_site=settings.SESSION_COOKIE_SAMESITE,
+        https_only=settings.SESSION_COOKIE_SECURE,
+        key_prefix=settings.SESSION_REDIS_KEY_PREFIX,
+    )
+else:
+    app.add_middleware(
+        CookieSessionMiddleware,
+        secret_key=settings.SESSION_SECRET,
+        max_age=settings.SESSION_MAX_AGE_SECONDS,
+        same_site=settings.SESSION_COOKIE_SAMESITE,
+        https_only=settings.SESSION_COOKIE_SECURE,
+    )
 app.add_middleware(ObservabilityMiddleware)
 if settings.SECURITY_HEADERS_ENABLED:
-    app.add_middleware(CspNonceMiddleware)
+    # Outermost: the CSP nonce must be on request.state before any route renders.
+    app.add_middleware(SecurityHeadersMiddleware)
 register_exception_handlers(app)
 
 LOGIN_RATE_LIMIT_MAX_REQUESTS = 5
@@ -116,6 +206,7 @@ LOGIN_ERROR_MESSAGES = {
     "invalid_credentials": "Invalid credentials. Please try again.",
     "rate_limited": "Too many login attempts. Please wait a minute and try again.",
     "csrf_invalid": "Security check failed. Please refresh the page and try again.",
+    "session_expired": "Your session has expired. Please sign in again.",
     "server_error": "Something went wrong. Please try again later.",
 }
 
@@ -151,13 +242,16 @@ def invoice_user_id_for_row(request: Request) -> str | None:
     return str(uid) if uid else None
 
 
-def require_auth(request: Request) -> bool:
-    """
-    Session-based auth: legacy shared password flag, or Supabase user id after Auth login.
-    """
-    if settings.WEB_AUTH_PROVIDER == "legacy":
-        return bool(request.session.get("authenticated"))
-    return bool(request.session.get("auth_user_id"))
+def _announce_saved(request: Request, result: dict) -> None:
+    """Wake change-feed long-polls (GET /invoices/changes) when a save created a row."""
+    if result["status"] == "created":
+        invoice_change_notifier.notify(getattr(request.app.state, "redis", None))
+
+
+def web_llm_principal(request: Request) -> str:
+    """LLM usage attribution for UI routes: Supabase user id, or the shared legacy login."""
+    uid = invoice_user_id_for_row(request)
+    return f"user:{uid}" if uid else "web"
 
 
 @app.get("/health")
@@ -187,20 +281,57 @@ async def health(request: Request):
 @app.get("/metrics")
 async def prometheus_metrics(
     authorization: str | None = Header(None, alias="Authorization"),
+    accept: str | None = Header(None),
 ):
     if not settings.OBSERVABILITY_METRICS_ENABLED:
         raise HTTPException(status_code=404, detail="Not found")
-    expected = settings.METRICS_BEARER_TOKEN
-    if expected:
-        if not authorization or not authorization.lower().startswith("bearer "):
-            raise HTTPException(status_code=401, detail="Unauthorized")
-        got = authorization[7:].strip()
-        if len(got) != len(expected) or not secrets.compare_digest(got, expected):
-            raise HTTPException(status_code=401, detail="Unauthorized")
-    body, media_type = render_metrics_payload()
+    if settings.METRICS_BEARER_TOKEN:
+        _require_metrics_bearer(authorization)
+    body, media_type = render_metrics_payload(accept)
     return Response(content=body, media_type=media_type)
 
 
+def _require_metrics_bearer(authorization: str | None) -> None:
+    expected = settings.METRICS_BEARER_TOKEN or ""
+    if not authorization or not authorization.lower().startswith("bearer "):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    got = authorization[7:].strip()
+    if len(got) != len(expected) or not secrets.compare_digest(got, expected):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+
+@app.get("/admin/profile")
+async def admin_profile(
+    seconds: float = Query(10.0, gt=0),
+    format: str = Query("collapsed", pattern="^(collapsed|speedscope)$"),
+    route: str | None = Query(None, max_length=256),
+    authorization: str | None = Header(None, alias="Authorization"),
+):
+    """
+    Sample this worker's Python stacks for `seconds` (capped at PROFILER_MAX_SECONDS) and return
+    collapsed stacks or speedscope JSON. `route` (e.g. /upload) keeps only samples taken while
+    serving that route. Requires PROFILER_ENABLED and the METRICS_BEARER_TOKEN Bearer token;
+    with several workers, the one that accepts the connection is profiled.
+    """
+    if not settings.PROFILER_ENABLED or not settings.METRICS_BEARER_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+    _require_metrics_bearer(authorization)
+    duration = min(seconds, settings.PROFILER_MAX_SECONDS)
+    hz = settings.PROFILER_SAMPLE_HZ
+    try:
+        stacks, ticks = await asyncio.to_thread(sample_stacks, seconds=duration, hz=hz, route=route)
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profiling session is already running")
+    logger.info("profiler_session", seconds=duration, hz=hz, route=route, ticks=ticks, stacks=len(stacks), format=format)
+    name = f"pid {os.getpid()} {route or 'all'} {duration:g}s"
+    if format == "speedscope":
+        return JSONResponse(
+            to_speedscope(stacks, hz=hz, name=name),
+            headers={"Content-Disposition": 'attachment; filename="profile.speedscope.json"'},
+        )
+    return PlainTextResponse(to_collapsed(stacks))
+
+
 @app.post("/process-mock-email")
 async def process_mock_email(
     request: Request,
@@ -211,32 +342,257 @@ async def process_mock_email(
     extract invoice fields, and save them to the database.
     Machine auth: Bearer / X-API-Key (DB keys) or legacy X-App-Password when enabled.
     """
-    path = Path("examples/sample_invoice_email.txt")
-    raw = path.read_bytes()
-    data = parse_mock_email(str(path))
+    idem = idempotency_key_from_request(request)
+    principal = machine_principal(request)
+    fingerprint = ""
+    if idem:
+        fingerprint = request_fingerprint(request, await request.body())
+        outcome = await begin_idempotent_request(request, principal=principal, key=idem, fingerprint=fingerprint)
+        if outcome.state == "replay":
+            return JSONResponse(
+                outcome.body,
+                status_code=outcome.status_code,
+                headers={"Idempotent-Replayed": "true"},
+            )
+        if outcome.state == "conflict":
+            raise HTTPException(
+                status_code=409,
+                detail="Idempotency-Key was already used for a different request",
+            )
+        if outcome.state == "in_progress":
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still being processed",
+            )
+
+    try:
+        await charge_llm_extraction(request)
+        path = Path("examples/sample_invoice_email.txt")
+        raw = path.read_bytes()
+        record_pipeline_bytes("txt", len(raw))
+        with time_stage("parse", kind="txt"):
+            data = parse_mock_email(str(path))
 
-    # At this point, parse_mock_email already returns "invoice_date" as an ISO string
-    # so we do NOT call .isoformat() here. If you ever change the parser to return
-    # a datetime object, you can add a type check and convert accordingly.
-    # Example:
-    #   if isinstance(data.get("invoice_date"), (date, datetime)):
-    #       data["invoice_date"] = data["invoice_date"].isoformat()
+        # At this point, parse_mock_email already returns "invoice_date" as an ISO string
+        # so we do NOT call .isoformat() here. If you ever change the parser to return
+        # a datetime object, you can add a type check and convert accordingly.
+        # Example:
+        #   if isinstance(data.get("invoice_date"), (date, datetime)):
+        #       data["invoice_date"] = data["invoice_date"].isoformat()
 
-    db = get_supabase_for_api()
-    raw_idem = request.headers.get("Idempotency-Key") or request.headers.get("X-Idempotency-Key")
-    idem = raw_idem.strip() if isinstance(raw_idem, str) and raw_idem.strip() else None
-    result = save_invoice(
-        data,
-        client=db,
-        user_id=None,
-        source_content_hash=hash_bytes(raw),
-        idempotency_key=idem,
+        db = get_supabase_for_api()
+        with time_stage("save", kind="txt"):
+            result = save_invoice(
+                data,
+                client=db,
+                user_id=None,
+                source_content_hash=hash_bytes(raw),
+                idempotency_key=idem,
+            )
+        _announce_saved(request, result)
+    except BaseException:
+        if idem:
+            await release_idempotent_request(request, principal=principal, key=idem)
+        raise
+    payload = {"status": result["status"], "id": result["id"], "invoice": result["invoice"]}
+    if idem:
+        await complete_idempotent_request(
+            request,
+            principal=principal,
+            key=idem,
+            fingerprint=fingerprint,
+            status_code=200,
+            body=payload,
+        )
+    return payload
+
+
+_RAW_UPLOAD_ERROR_STATUS = {
+    "unsupported": 415,
+    "invalid_file_type": 415,
+    "file_too_large": 413,
+    "empty_file": 400,
+    "av_rejected": 422,
+    "parse_failed": 422,
+}
+
+
+def _raw_upload_error(code: str) -> HTTPException:
+    # av_unavailable / av_timeout / av_misconfigured: the scanner, not the document, is at fault.
+    return HTTPException(status_code=_RAW_UPLOAD_ERROR_STATUS.get(code, 503), detail=code)
+
+
+def _scan_raw_upload(content: bytes, ext: str) -> str | None:
+    """Optional AV scan for an in-memory body; the scanner needs a path, so spool only when it will run."""
+    if not settings.UPLOAD_AV_SCAN_ENABLED or (settings.UPLOAD_AV_SCAN_PDF_ONLY and ext != "pdf"):
+        return None
+    file_path = build_safe_temp_path(ext)
+    try:
+        with open(file_path, "wb") as f:
+            f.write(content)
+        return run_optional_antivirus_scan(
+            file_path=file_path,
+            file_extension=ext,
+            enabled=True,
+            pdf_only=settings.UPLOAD_AV_SCAN_PDF_ONLY,
+            command_template=settings.UPLOAD_AV_SCAN_COMMAND,
+            timeout_seconds=settings.UPLOAD_AV_SCAN_TIMEOUT_SECONDS,
+        )
+    finally:
+        try:
+            os.unlink(file_path)
+        except OSError:
+            pass
+
+
+@app.post("/api/invoices")
+async def ingest_invoice(
+    request: Request,
+    content_type: str | None = Header(None),
+    content_length: int | None = Header(None),
+    _: None = Depends(require_machine_scopes("invoices:write")),
+):
+    """
+    Ingest one invoice document sent as the raw request body, no multipart: Content-Type
+    application/pdf, message/rfc822 (.eml), application/vnd.ms-outlook (.msg) or text/plain.
+    The body is read in chunks under MAX_UPLOAD_FILE_BYTES, hashed and sniffed as it arrives, and
+    parsed from memory. 201 when created, 200 when it was a duplicate; honors Idempotency-Key.
+    Machine auth: Bearer / X-API-Key (DB keys) or legacy X-App-Password when enabled.
+    """
+    declared_ext, type_error = extension_from_content_type(content_type)
+    if type_error:
+        raise _raw_upload_error(type_error)
+    if content_length is not None and content_length > settings.MAX_UPLOAD_FILE_BYTES:
+        raise _raw_upload_error("file_too_large")
+
+    with time_stage("read", kind=declared_ext):
+        upload, read_error = await read_stream_with_size_limit(
+            request.stream(),
+            settings.MAX_UPLOAD_FILE_BYTES,
+            declared_ext=declared_ext,
+        )
+    if read_error:
+        raise _raw_upload_error(read_error)
+    record_pipeline_bytes(upload.ext, len(upload.content))
+
+    idem = idempotency_key_from_request(request)
+    principal = machine_principal(request)
+    fingerprint = ""
+    if idem:
+        # The body's SHA-256 stands in for the body itself: same fingerprint, no second pass.
+        fingerprint = request_fingerprint(request, upload.sha256.encode("ascii"))
+        outcome = await begin_idempotent_request(request, principal=principal, key=idem, fingerprint=fingerprint)
+        if outcome.state == "replay":
+            return JSONResponse(
+                outcome.body,
+                status_code=outcome.status_code,
+                headers={"Idempotent-Replayed": "true"},
+            )
+        if outcome.state == "conflict":
+            raise HTTPException(
+                status_code=409,
+                detail="Idempotency-Key was already used for a different request",
+            )
+        if outcome.state == "in_progress":
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still being processed",
+            )
+
+    try:
+        with time_stage("av_scan", kind=upload.ext):
+            av_error = await asyncio.to_thread(_scan_raw_upload, upload.content, upload.ext)
+        if av_error:
+            raise _raw_upload_error(av_error)
+        await charge_llm_extraction(request)
+        try:
+            with time_stage("parse", kind=upload.ext):
+                data = await asyncio.to_thread(parse_invoice_bytes, upload.content, upload.ext)
+        except Exception as exc:
+            raise _raw_upload_error("parse_failed") from exc
+
+        try:
+            with time_stage("save", kind=upload.ext):
+                result = save_invoice(
+                    data,
+                    client=get_supabase_for_api(),
+                    user_id=None,
+                    source_content_hash=upload.sha256,
+                    idempotency_key=idem,
+                )
+        except Exception as exc:
+            _log_invoice_save_error("api_invoices", exc)
+            raise HTTPException(status_code=500, detail="save_failed") from exc
+        _announce_saved(request, result)
+    except BaseException:
+        if idem:
+            await release_idempotent_request(request, principal=principal, key=idem)
+        raise
+    status_code = 200 if result["status"] == "duplicate" else 201
+    payload = {"status": result["status"], "id": result["id"], "sha256": upload.sha256, "invoice": result["invoice"]}
+    if idem:
+        await complete_idempotent_request(
+            request,
+            principal=principal,
+            key=idem,
+            fingerprint=fingerprint,
+            status_code=status_code,
+            body=payload,
+        )
+    return FastJSONResponse(payload, status_code=status_code)
+
+
+def _invoice_list_headers(version: InvoiceDataVersion, page: int, limit: int, ndjson: bool) -> dict[str, str]:
+    # JSON and NDJSON share the URL (and differ in the ETag), so caches must key on Accept.
+    etag = invoice_etag(version, "invoices", page, limit, ndjson)
+    return {**validator_headers(etag, last_modified(version)), "Vary": "Accept"}
+
+
+async def _stream_invoices_ndjson(
+    *, db, page: int, limit: int, offset: int, version: InvoiceDataVersion | None
+) -> StreamingResponse:
+    try:
+        stream = await open_invoice_row_stream(api_key=api_key_for_machine_routes(), limit=limit, offset=offset)
+    except InvoiceStreamError as exc:
+        logger.warning("invoice_stream_failed", error=str(exc))
+        raise HTTPException(status_code=502, detail="Invoice listing failed upstream") from exc
+    if version is None:
+        try:
+            # The stream's Content-Range already carries the exact count; only the newest row is missing.
+            if stream.total is not None:
+                version = {"latest_created_at": get_latest_invoice_created_at(client=db), "count": stream.total}
+            else:
+                version = get_invoice_data_version(client=db)
+        except BaseException:
+            await stream.aclose()
+            raise
+
+    async def body():
+        sent = 0
+        try:
+            try:
+                async for rows in stream.batches():
+                    sent += len(rows)
+                    yield b"".join(orjson.dumps(row) + b"\n" for row in rows)
+                done = stream.total is not None and offset + sent >= stream.total
+                meta = {"total": stream.total, "page": page, "limit": limit, "offset": offset, "count": sent}
+                meta["next_page"] = None if done or sent < limit else page + 1
+            except InvoiceStreamError as exc:
+                # Status 200 is already sent: report the truncation in-band. No _meta line = truncated.
+                logger.warning("invoice_stream_failed", error=str(exc), rows_sent=sent)
+                meta = {"error": "upstream_stream_failed", "count": sent}
+            yield orjson.dumps({"_meta": meta}) + b"\n"
+        finally:
+            await stream.aclose()
+
+    return StreamingResponse(
+        body(), media_type="application/x-ndjson", headers=_invoice_list_headers(version, page, limit, True)
     )
-    return {"status": result["status"], "id": result["id"], "invoice": result["invoice"]}
 
 
 @app.get("/invoices")
 async def get_invoices(
+    request: Request,
     page: int = Query(1, ge=1),
     limit: int | None = Query(None, ge=1),
     _: None = Depends(require_machine_scopes("invoices:read")),
@@ -244,19 +600,118 @@ async def get_invoices(
     """
     Return invoices as JSON with pagination (total count included).
     Machine auth: Bearer / X-API-Key or legacy X-App-Password when enabled.
+    ETag / Last-Modified from the invoice data version; If-None-Match hits return 304 without listing.
+    Vary: Accept, since JSON and NDJSON share this URL.
+    Accept: application/x-ndjson streams one row per line (limit up to INVOICE_STREAM_MAX_LIMIT)
+    followed by a {"_meta": ...} line with total and next_page.
     """
+    ndjson = "application/x-ndjson" in request.headers.get("accept", "")
     db = get_supabase_for_api()
     lim = limit if limit is not None else settings.INVOICE_LIST_DEFAULT_LIMIT
-    lim = min(lim, settings.INVOICE_LIST_MAX_LIMIT)
+    lim = min(lim, settings.INVOICE_STREAM_MAX_LIMIT if ndjson else settings.INVOICE_LIST_MAX_LIMIT)
     offset = (page - 1) * lim
+    version = get_invoice_data_version(client=db) if is_conditional(request) else None
+    if version is not None:
+        headers = _invoice_list_headers(version, page, lim, ndjson)
+        if is_not_modified(request, headers["ETag"], headers.get("Last-Modified")):
+            return Response(status_code=304, headers=headers)
+    if ndjson:
+        return await _stream_invoices_ndjson(db=db, page=page, limit=lim, offset=offset, version=version)
     page_data = list_invoices(client=db, limit=lim, offset=offset)
-    return {
-        "invoices": page_data["items"],
-        "total": page_data["total"],
-        "page": page,
-        "limit": page_data["limit"],
-        "offset": page_data["offset"],
-    }
+    if version is None:
+        version = invoice_data_version_from_page(page_data, client=db)
+    # PostgREST rows are already JSON-native: render them directly, no jsonable_encoder walk.
+    return FastJSONResponse(
+        {
+            "invoices": page_data["items"],
+            "total": page_data["total"],
+            "page": page,
+            "limit": page_data["limit"],
+            "offset": page_data["offset"],
+        },
+        headers=_invoice_list_headers(version, page, lim, ndjson),
+    )
+
+
+_SHA256_PATTERN = r"^[0-9a-fA-F]{64}$"
+
+
+@app.api_route("/invoices/by-hash/{sha256}", methods=["GET", "HEAD"])
+async def get_invoice_by_hash(
+    sha256: str = PathParam(..., pattern=_SHA256_PATTERN),
+    _: None = Depends(require_machine_scopes("invoices:read")),
+):
+    """
+    Does an invoice with this source_content_hash (SHA-256 hex of the document bytes) already exist?
+    200 with its id, or 404. HEAD for the status alone. Hash the file client-side and skip the upload
+    when this says it is already saved. Same dedupe scope as machine saves.
+    Machine auth: Bearer / X-API-Key or legacy X-App-Password when enabled.
+    """
+    digest = sha256.lower()
+    found = find_invoices_by_content_hash(get_supabase_for_api(), user_id=None, hashes=[digest]).get(digest)
+    if found is None:
+        return FastJSONResponse({"sha256": digest, "exists": False}, status_code=404)
+    return FastJSONResponse({"sha256": digest, "exists": True, **found})
+
+
+@app.post("/invoices/by-hash")
+async def check_invoice_hashes(
+    sha256: list[str] = Body(..., embed=True),
+    _: None = Depends(require_machine_scopes("invoices:read")),
+):
+    """
+    Batch pre-check: body {"sha256": [...]} (up to CONTENT_HASH_BATCH_MAX). Returns {"existing":
+    {hash: {id, created_at}}, "missing": [hash, ...]} so a re-sync uploads only the missing documents.
+    Machine auth: Bearer / X-API-Key or legacy X-App-Password when enabled.
+    """
+    if len(sha256) > settings.CONTENT_HASH_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {settings.CONTENT_HASH_BATCH_MAX} hashes per request")
+    digests = [h.lower() for h in sha256]
+    invalid = [h for h in digests if len(h) != 64 or any(c not in "0123456789abcdef" for c in h)]
+    if invalid:
+        raise HTTPException(status_code=422, detail={"message": "Not SHA-256 hex digests", "invalid": invalid[:10]})
+    existing = find_invoices_by_content_hash(get_supabase_for_api(), user_id=None, hashes=digests)
+    missing = [h for h in dict.fromkeys(digests) if h not in existing]
+    return FastJSONResponse({"existing": existing, "missing": missing})
+
+
+@app.get("/invoices/changes")
+async def get_invoice_changes(
+    request: Request,
+    cursor: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1),
+    wait: float = Query(0, ge=0),
+    _: None = Depends(require_machine_scopes("invoices:read")),
+):
+    """
+    Invoices created after `cursor` (their change_seq), oldest first, and the cursor for the next call.
+    With `wait` (seconds, up to CHANGE_FEED_MAX_WAIT_SECONDS) and nothing new, the request is held
+    until an invoice is created or the wait ends, so idle integrators cost one open connection.
+    Machine auth: Bearer / X-API-Key or legacy X-App-Password when enabled.
+    """
+    db = get_supabase_for_api()
+    lim = min(limit or settings.INVOICE_LIST_DEFAULT_LIMIT, settings.INVOICE_LIST_MAX_LIMIT)
+    wait = min(wait, settings.CHANGE_FEED_MAX_WAIT_SECONDS)
+    if invoice_change_notifier.waiters >= settings.CHANGE_FEED_MAX_WAITERS:
+        wait = 0
+    deadline = time.monotonic() + wait
+    # Off the event loop: a long-poll may query several times.
+    rows = await asyncio.to_thread(list_invoice_changes, client=db, after=cursor, limit=lim)
+    outcome = "immediate"
+    while not rows:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or await request.is_disconnected():
+            outcome = "timeout" if wait > 0 else outcome
+            break
+        woken = await invoice_change_notifier.wait(min(remaining, settings.CHANGE_FEED_RECHECK_SECONDS))
+        if woken:
+            # The new row is held back until it has settled; query once it is visible.
+            await asyncio.sleep(min(settings.CHANGE_FEED_SETTLE_SECONDS, max(0.0, deadline - time.monotonic())))
+        rows = await asyncio.to_thread(list_invoice_changes, client=db, after=cursor, limit=lim)
+        outcome = "woken" if woken else "recheck"
+    record_change_feed_poll(outcome)
+    next_cursor = int(rows[-1]["change_seq"]) if rows else cursor
+    return FastJSONResponse({"changes": rows, "cursor": next_cursor, "has_more": len(rows) == lim})
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -264,6 +719,7 @@ async def login_page(request: Request):
     """
     Render the login page.
     """
+    await load_session(request)
     error_code = request.query_params.get("error")
     error_message = LOGIN_ERROR_MESSAGES.get(error_code)
     csrf_token = get_or_create_csrf_token(request)
@@ -291,15 +747,18 @@ async def login(
     Login: legacy shared password, or Supabase Auth email/password (see WEB_AUTH_PROVIDER).
     CSRF token required on all POST logins.
     """
+    await load_session(request)
     if not verify_csrf_token(request, csrf_token):
         return RedirectResponse("/?error=csrf_invalid", status_code=302)
 
-    if await check_rate_limited(
+    rate = await check_rate_limit(
         request,
         action="login",
         max_requests=LOGIN_RATE_LIMIT_MAX_REQUESTS,
         window_seconds=LOGIN_RATE_LIMIT_WINDOW_SECONDS,
-    ):
+        strict=True,
+    )
+    if rate.limited:
         return RedirectResponse("/?error=rate_limited", status_code=302)
 
     if settings.WEB_AUTH_PROVIDER == "legacy":
@@ -328,14 +787,44 @@ async def login(
     return RedirectResponse("/dashboard", status_code=302)
 
 
+def _dashboard_page_params(request: Request) -> tuple[int, int]:
+    try:
+        page = max(1, int(request.query_params.get("page") or 1))
+    except ValueError:
+        page = 1
+    try:
+        page_size = int(request.query_params.get("page_size") or settings.INVOICE_LIST_DEFAULT_LIMIT)
+    except ValueError:
+        page_size = settings.INVOICE_LIST_DEFAULT_LIMIT
+    return page, min(max(page_size, 1), settings.INVOICE_LIST_MAX_LIMIT)
+
+
+def _conditional_version(request: Request, db) -> InvoiceDataVersion | None:
+    """The data version, when the request has validators to check (else the listing supplies it)."""
+    if not is_conditional(request):
+        return None
+    try:
+        return get_invoice_data_version(client=db)
+    except Exception:
+        return None
+
+
+def _dashboard_validators(request: Request, version: InvoiceDataVersion, *parts: object) -> tuple[str, str | None]:
+    """(ETag, Last-Modified) for a dashboard view."""
+    etag = invoice_etag(version, invoice_user_id_for_row(request), _TEMPLATES_TAG, *parts)
+    return etag, last_modified(version)
+
+
 @app.get("/dashboard", response_class=HTMLResponse)
 async def dashboard_page(request: Request):
     """
     Render the dashboard with all saved invoices.
     Requires the user to be authenticated via session.
+    Returns 304 when the browser's ETag still matches the user's invoice data version.
     """
-    if not require_auth(request):
-        return RedirectResponse("/?error=auth_required", status_code=302)
+    denied = await ensure_web_session(request)
+    if denied:
+        return RedirectResponse(f"/?error={denied}", status_code=302)
 
     error_code = request.query_params.get("error")
     success_code = request.query_params.get("success")
@@ -347,26 +836,29 @@ async def dashboard_page(request: Request):
     else:
         success_message = None
     db = get_supabase_for_request(request)
-    try:
-        page = max(1, int(request.query_params.get("page") or 1))
-    except ValueError:
-        page = 1
-    try:
-        page_size = int(request.query_params.get("page_size") or settings.INVOICE_LIST_DEFAULT_LIMIT)
-    except ValueError:
-        page_size = settings.INVOICE_LIST_DEFAULT_LIMIT
-    page_size = min(max(page_size, 1), settings.INVOICE_LIST_MAX_LIMIT)
+    page, page_size = _dashboard_page_params(request)
     offset = (page - 1) * page_size
+    csrf_token = get_or_create_csrf_token(request)
+    # The CSRF secret (not its per-render mask) and query string (flash messages) shape the page, so its validator.
+    parts = ("dashboard", csrf_secret(request), str(request.query_params))
+    version = _conditional_version(request, db)
+    if version is not None:
+        validators = _dashboard_validators(request, version, *parts)
+        if is_not_modified(request, *validators):
+            return not_modified(*validators)
     try:
         page_result = list_invoices(client=db, limit=page_size, offset=offset)
         invoices = page_result["items"]
         invoice_total = page_result["total"]
+        validators = _dashboard_validators(
+            request, version or invoice_data_version_from_page(page_result, client=db), *parts
+        )
     except Exception:
         invoices = []
         invoice_total = 0
+        validators = None
     has_prev = page > 1
     has_next = offset + len(invoices) < invoice_total
-    csrf_token = get_or_create_csrf_token(request)
     return templates.TemplateResponse(
         request=request,
         name="dashboard.html",
@@ -384,6 +876,40 @@ async def dashboard_page(request: Request):
             "web_auth_provider": settings.WEB_AUTH_PROVIDER,
             "csp_nonce": getattr(request.state, "csp_nonce", None),
         },
+        headers=validator_headers(*validators) if validators is not None else None,
+    )
+
+
+@app.get("/dashboard/invoice-rows", response_class=HTMLResponse)
+async def dashboard_invoice_rows(request: Request):
+    """
+    Only the invoice table rows for the dashboard's current page (same page / page_size params),
+    for in-place refresh. Total count in X-Invoice-Total; ETag / 304 like the full page.
+    """
+    denied = await ensure_web_session(request)
+    if denied:
+        return PlainTextResponse(denied, status_code=401)
+    db = get_supabase_for_request(request)
+    page, page_size = _dashboard_page_params(request)
+    parts = ("rows", page, page_size)
+    version = _conditional_version(request, db)
+    if version is not None:
+        validators = _dashboard_validators(request, version, *parts)
+        if is_not_modified(request, *validators):
+            return not_modified(*validators)
+    try:
+        page_result = list_invoices(client=db, limit=page_size, offset=(page - 1) * page_size)
+        validators = _dashboard_validators(
+            request, version or invoice_data_version_from_page(page_result, client=db), *parts
+        )
+    except Exception:
+        return PlainTextResponse("invoices_unavailable", status_code=503)
+    headers = {"X-Invoice-Total": str(page_result["total"]), **validator_headers(*validators)}
+    return templates.TemplateResponse(
+        request=request,
+        name="_invoice_rows.html",
+        context={"invoices": page_result["items"]},
+        headers=headers,
     )
 
 
@@ -392,8 +918,10 @@ async def process_ui(request: Request):
     """
     Process the sample mock email from the UI and redirect back to the dashboard.
     """
-    if not require_auth(request):
-        return RedirectResponse("/?error=auth_required", status_code=302)
+    denied = await ensure_web_session(request)
+    if denied:
+        return RedirectResponse(f"/?error={denied}", status_code=302)
+    set_llm_principal(web_llm_principal(request))
 
     db = get_supabase_for_request(request)
     uid = invoice_user_id_for_row(request)
@@ -402,20 +930,24 @@ async def process_ui(request: Request):
         raw = sample_path.read_bytes()
     except OSError:
         return RedirectResponse("/dashboard?error=parse_failed", status_code=302)
+    record_pipeline_bytes("txt", len(raw))
     try:
-        data = parse_mock_email(str(sample_path))
+        with time_stage("parse", kind="txt"):
+            data = parse_mock_email(str(sample_path))
     except Exception:
         return RedirectResponse("/dashboard?error=parse_failed", status_code=302)
     try:
-        result = save_invoice(
-            data,
-            client=db,
-            user_id=uid,
-            source_content_hash=hash_bytes(raw),
-        )
+        with time_stage("save", kind="txt"):
+            result = save_invoice(
+                data,
+                client=db,
+                user_id=uid,
+                source_content_hash=hash_bytes(raw),
+            )
     except Exception as exc:
         _log_invoice_save_error("process_ui", exc)
         return RedirectResponse("/dashboard?error=save_failed", status_code=302)
+    _announce_saved(request, result)
     if result["status"] == "duplicate":
         return RedirectResponse("/dashboard?success=deduped", status_code=302)
     return RedirectResponse("/dashboard?success=uploaded", status_code=302)
@@ -431,72 +963,83 @@ async def upload_invoice(
     Upload an invoice email file (.txt, .eml, .msg, .pdf),
     parse it using the appropriate parser, and save to the database.
     """
-    if not require_auth(request):
-        return RedirectResponse("/?error=auth_required", status_code=302)
+    denied = await ensure_web_session(request)
+    if denied:
+        return RedirectResponse(f"/?error={denied}", status_code=302)
     if not verify_csrf_token(request, csrf_token):
         return RedirectResponse("/dashboard?error=csrf_invalid", status_code=302)
-    if await check_rate_limited(
+    set_llm_principal(web_llm_principal(request))
+    rate = await check_rate_limit(
         request,
         action="upload_invoice",
         max_requests=UPLOAD_RATE_LIMIT_MAX_REQUESTS,
         window_seconds=UPLOAD_RATE_LIMIT_WINDOW_SECONDS,
-    ):
+    )
+    if rate.limited:
         return RedirectResponse("/dashboard?error=rate_limited", status_code=302)
     declared_ext, name_error = extension_from_upload_filename(file.filename)
     if name_error:
         return RedirectResponse(f"/dashboard?error={name_error}", status_code=302)
 
-    content, read_error = await read_upload_with_size_limit(file, settings.MAX_UPLOAD_FILE_BYTES)
+    with time_stage("read", kind=declared_ext):
+        content, read_error = await read_upload_with_size_limit(file, settings.MAX_UPLOAD_FILE_BYTES)
     if read_error:
         return RedirectResponse(f"/dashboard?error={read_error}", status_code=302)
+    record_pipeline_bytes(declared_ext, len(content))
 
-    sniffed = sniff_content_kind(content)
-    canonical_ext, kind_error = reconcile_extension(declared_ext=declared_ext, sniffed=sniffed)
+    with time_stage("sniff", kind=declared_ext):
+        sniffed = sniff_content_kind(content)
+        canonical_ext, kind_error = reconcile_extension(declared_ext=declared_ext, sniffed=sniffed)
     if kind_error:
         return RedirectResponse(f"/dashboard?error={kind_error}", status_code=302)
 
     file_path = build_safe_temp_path(canonical_ext)
     try:
-        with open(file_path, "wb") as f:
-            f.write(content)
+        with time_stage("spool", kind=canonical_ext):
+            with open(file_path, "wb") as f:
+                f.write(content)
 
-        av_error = run_optional_antivirus_scan(
-            file_path=file_path,
-            file_extension=canonical_ext,
-            enabled=settings.UPLOAD_AV_SCAN_ENABLED,
-            pdf_only=settings.UPLOAD_AV_SCAN_PDF_ONLY,
-            command_template=settings.UPLOAD_AV_SCAN_COMMAND,
-            timeout_seconds=settings.UPLOAD_AV_SCAN_TIMEOUT_SECONDS,
-        )
+        with time_stage("av_scan", kind=canonical_ext):
+            av_error = run_optional_antivirus_scan(
+                file_path=file_path,
+                file_extension=canonical_ext,
+                enabled=settings.UPLOAD_AV_SCAN_ENABLED,
+                pdf_only=settings.UPLOAD_AV_SCAN_PDF_ONLY,
+                command_template=settings.UPLOAD_AV_SCAN_COMMAND,
+                timeout_seconds=settings.UPLOAD_AV_SCAN_TIMEOUT_SECONDS,
+            )
         if av_error:
             return RedirectResponse(f"/dashboard?error={av_error}", status_code=302)
 
         try:
-            if canonical_ext == "txt":
-                data = parse_mock_email(file_path)
-            elif canonical_ext == "eml":
-                data = parse_eml_invoice(file_path)
-            elif canonical_ext == "msg":
-                data = parse_msg_invoice(file_path)
-            elif canonical_ext == "pdf":
-                data = parse_pdf_invoice(file_path)
-            else:
-                return RedirectResponse("/dashboard?error=unsupported", status_code=302)
+            with time_stage("parse", kind=canonical_ext):
+                if canonical_ext == "txt":
+                    data = parse_mock_email(file_path)
+                elif canonical_ext == "eml":
+                    data = parse_eml_invoice(file_path)
+                elif canonical_ext == "msg":
+                    data = parse_msg_invoice(file_path)
+                elif canonical_ext == "pdf":
+                    data = parse_pdf_invoice(file_path)
+                else:
+                    return RedirectResponse("/dashboard?error=unsupported", status_code=302)
         except Exception:
             return RedirectResponse("/dashboard?error=parse_failed", status_code=302)
 
         db = get_supabase_for_request(request)
         uid = invoice_user_id_for_row(request)
         try:
-            result = save_invoice(
-                data,
-                client=db,
-                user_id=uid,
-                source_content_hash=hash_bytes(content),
-            )
+            with time_stage("save", kind=canonical_ext):
+                result = save_invoice(
+                    data,
+                    client=db,
+                    user_id=uid,
+                    source_content_hash=hash_bytes(content),
+                )
         except Exception as exc:
             _log_invoice_save_error("upload_invoice", exc)
             return RedirectResponse("/dashboard?error=save_failed", status_code=302)
+        _announce_saved(request, result)
         if result["status"] == "duplicate":
             return RedirectResponse("/dashboard?success=deduped", status_code=302)
         return RedirectResponse("/dashboard?success=uploaded", status_code=302)
@@ -512,6 +1055,7 @@ async def logout(request: Request):
     """
     Clear the session and redirect back to the login page.
     """
+    await load_session(request)
     if settings.WEB_AUTH_PROVIDER == "supabase":
         access_token = request.session.get("supabase_access_token")
         if isinstance(access_token, str) and access_token:
@@ -1,11 +1,30 @@
 """
 Prometheus metrics: request counts (by status class) and latency histograms.
 Scrape GET /metrics when OBSERVABILITY_METRICS_ENABLED=true (protect the endpoint in production).
+
+Multiple workers (uvicorn --workers N, gunicorn): export PROMETHEUS_MULTIPROC_DIR (an empty, writable
+directory, ideally tmpfs) before the server starts. prometheus_client then keeps every metric in
+per-process mmap files there, and /metrics aggregates all workers through MultiProcessCollector.
+Gauges declare how workers combine (multiprocess_mode); the live* modes drop a worker's values
+once mark_worker_dead(pid) runs (lifespan shutdown, gunicorn child_exit in gunicorn.conf.py).
+
+With TRACING_ENABLED, latency histograms carry trace_id exemplars; they are served to scrapers that
+ask for OpenMetrics (Accept: application/openmetrics-text) and are not kept in multiprocess mode.
 """
 
 from __future__ import annotations
 
-from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.openmetrics import exposition as openmetrics
+
+from app.tracing import trace_exemplar, tracer
 
 REQUEST_LATENCY = Histogram(
     "http_server_request_duration_seconds",
@@ -20,6 +39,165 @@ REQUEST_TOTAL = Counter(
     ("method", "route", "status_class"),
 )
 
+PIPELINE_STAGE_LATENCY = Histogram(
+    "invoice_pipeline_stage_duration_seconds",
+    "Time spent per invoice pipeline stage (nested: parse includes text_extract and llm; save includes dedupe_lookup and insert)",
+    ("stage", "kind"),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+PIPELINE_BYTES = Counter(
+    "invoice_pipeline_bytes_total",
+    "Bytes of invoice content read into the pipeline",
+    ("kind",),
+)
+
+PARSE_FALLBACKS = Counter(
+    "invoice_parse_fallbacks_total",
+    "Parses that fell back to regex-only extraction; reason = LLM outcome (refusal, schema_error, timeout, ...)",
+    ("kind", "reason"),
+)
+
+DEDUPE_OUTCOMES = Counter(
+    "invoice_save_outcomes_total",
+    "save_invoice results: created, or duplicate matched by idempotency_key, content_hash, invoice_ref or insert_conflict",
+    ("outcome",),
+)
+
+LLM_REQUESTS = Counter(
+    "llm_requests_total",
+    "LLM extraction calls by outcome (ok, refusal, schema_error, content_filter, timeout, rate_limited, api_error, error)",
+    ("deployment", "outcome"),
+)
+
+LLM_LATENCY = Histogram(
+    "llm_request_duration_seconds",
+    "LLM extraction call duration including SDK retries",
+    ("deployment",),
+    buckets=(0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0, 60.0),
+)
+
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens reported by the LLM API (compare against the deployment TPM quota)",
+    ("deployment", "type"),
+)
+
+LLM_RETRIES = Counter(
+    "llm_retries_total",
+    "Retries the OpenAI SDK made before a call returned (429 / 5xx / timeouts)",
+    ("deployment",),
+)
+
+API_KEY_CACHE_VERSION = Gauge(
+    "machine_api_key_cache_version",
+    "Version of this worker's machine API key index (bumped on every applied reload or delta)",
+    multiprocess_mode="livemax",
+)
+
+API_KEY_CACHE_ENTRIES = Gauge(
+    "machine_api_key_cache_entries",
+    "Active machine API keys in this worker's index",
+    multiprocess_mode="livemax",
+)
+
+API_KEY_CACHE_RELOADED_AT = Gauge(
+    "machine_api_key_cache_last_reload_timestamp_seconds",
+    "Unix time of the last key index reload (oldest live worker); cache age = time() - this value",
+    multiprocess_mode="livemin",
+)
+
+API_KEY_CACHE_RELOADS = Counter(
+    "machine_api_key_cache_reloads_total",
+    "Machine API key index reloads",
+    ("mode",),
+)
+
+MACHINE_AUDIT_EVENTS = Counter(
+    "machine_api_audit_events_total",
+    "Machine API audit rows by outcome (written, failed, dropped when the buffer is full)",
+    ("outcome",),
+)
+
+MACHINE_QUOTA_REJECTIONS = Counter(
+    "machine_api_quota_rejections_total",
+    "Machine API requests refused with 429 by per-key quotas",
+    ("quota",),
+)
+
+RATE_LIMIT_CHECKS = Counter(
+    "rate_limit_checks_total",
+    "Rate-limit decisions by source (lease = local leased quota, redis = round trip, memory = local fallback)",
+    ("source",),
+)
+
+RATE_LIMIT_MEMORY_CLIENTS = Gauge(
+    "rate_limit_memory_tracked_clients",
+    "Client/action pairs held by the in-process rate limiter (as of the last sweep, summed over workers)",
+    multiprocess_mode="livesum",
+)
+
+RATE_LIMIT_MEMORY_BYTES_PER_CLIENT = Gauge(
+    "rate_limit_memory_bytes_per_client",
+    "Approximate bytes per tracked client in the in-process rate limiter (entry + ring buffer + key)",
+    multiprocess_mode="livemax",
+)
+
+RATE_LIMIT_MEMORY_SWEPT = Counter(
+    "rate_limit_memory_swept_total",
+    "Idle clients dropped from the in-process rate limiter by the sweeper",
+)
+
+
+HTTP_CLIENT_REQUESTS = Counter(
+    "http_client_requests_total",
+    "Outbound requests through the shared httpx client, by whether they opened a connection or reused a pooled one",
+    ("host", "connection"),
+)
+
+HTTP_CLIENT_CONNECT_LATENCY = Histogram(
+    "http_client_connect_duration_seconds",
+    "Time to open outbound connections (phase = tcp incl. DNS, or tls handshake)",
+    ("host", "phase"),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+HTTP_CLIENT_POOL_CONNECTIONS = Gauge(
+    "http_client_pool_connections",
+    "Connections in the shared httpx client pool (as of the last request), by state",
+    ("state",),
+    multiprocess_mode="livesum",
+)
+
+WEB_SESSION_CHECKS = Counter(
+    "web_session_checks_total",
+    "Dashboard session token checks (valid, unverified, refreshed, refresh_failed, expired, invalid)",
+    ("outcome",),
+)
+
+SESSION_STORE_OPERATIONS = Counter(
+    "session_store_operations_total",
+    "Redis session store calls by op (load, save, delete) and outcome (hit, miss, ok, error)",
+    ("op", "outcome"),
+)
+
+COMPRESSION_BYTES = Counter(
+    "http_compression_bytes_total",
+    "Response body bytes through CompressionMiddleware by encoding, before (in) and after (out) compression",
+    ("encoding", "direction"),
+)
+
+CHANGE_FEED_POLLS = Counter(
+    "invoice_change_feed_polls_total",
+    "GET /invoices/changes answers by how they ended (immediate, woken, recheck, timeout)",
+    ("outcome",),
+)
+
+LOG_LINES_DROPPED = Counter(
+    "log_lines_dropped_total",
+    "Log lines discarded because the log queue was full (stdout slower than the log rate) or the write failed",
+)
+
 
 def http_status_class(status_code: int) -> str:
     if status_code < 200:
@@ -36,8 +214,146 @@ def http_status_class(status_code: int) -> str:
 def record_http_request(*, method: str, route: str, status_code: int, duration_s: float) -> None:
     cls = http_status_class(status_code)
     REQUEST_TOTAL.labels(method=method, route=route, status_class=cls).inc()
-    REQUEST_LATENCY.labels(method=method, route=route).observe(duration_s)
+    REQUEST_LATENCY.labels(method=method, route=route).observe(duration_s, trace_exemplar())
+
+
+_pipeline_kind: ContextVar[str] = ContextVar("invoice_pipeline_kind", default="unknown")
+
+
+def current_pipeline_kind() -> str:
+    return _pipeline_kind.get()
+
+
+@contextmanager
+def time_stage(stage: str, *, kind: str | None = None) -> Iterator[None]:
+    """
+    Observe the block's wall time in invoice_pipeline_stage_duration_seconds{stage, kind} and trace
+    it as an invoice.<stage> span. Passing kind (txt/eml/msg/pdf) also labels stages nested inside
+    the block, so service code (parsers, save_invoice) can time itself without knowing the file kind.
+    Usable as a decorator on sync functions.
+    """
+    token = _pipeline_kind.set(kind) if kind is not None else None
+    start = time.perf_counter()
+    try:
+        with tracer.start_as_current_span(f"invoice.{stage}", attributes={"invoice.kind": _pipeline_kind.get()}):
+            try:
+                yield
+            finally:
+                PIPELINE_STAGE_LATENCY.labels(stage=stage, kind=_pipeline_kind.get()).observe(
+                    time.perf_counter() - start, trace_exemplar()
+                )
+    finally:
+        if token is not None:
+            _pipeline_kind.reset(token)
+
+
+def record_pipeline_bytes(kind: str, size: int) -> None:
+    PIPELINE_BYTES.labels(kind=kind).inc(size)
+
+
+def record_parse_fallback(reason: str) -> None:
+    PARSE_FALLBACKS.labels(kind=_pipeline_kind.get(), reason=reason).inc()
+
+
+def record_save_outcome(outcome: str) -> None:
+    DEDUPE_OUTCOMES.labels(outcome=outcome).inc()
+
+
+def record_llm_call(
+    *,
+    deployment: str,
+    outcome: str,
+    duration_s: float,
+    prompt_tokens: int,
+    completion_tokens: int,
+    retries: int,
+) -> None:
+    LLM_REQUESTS.labels(deployment=deployment, outcome=outcome).inc()
+    LLM_LATENCY.labels(deployment=deployment).observe(duration_s, trace_exemplar())
+    if prompt_tokens:
+        LLM_TOKENS.labels(deployment=deployment, type="prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(deployment=deployment, type="completion").inc(completion_tokens)
+    if retries:
+        LLM_RETRIES.labels(deployment=deployment).inc(retries)
+
+
+def record_api_key_cache_state(*, mode: str, version: int, entries: int, reloaded_at: float) -> None:
+    API_KEY_CACHE_RELOADS.labels(mode=mode).inc()
+    API_KEY_CACHE_VERSION.set(version)
+    API_KEY_CACHE_ENTRIES.set(entries)
+    API_KEY_CACHE_RELOADED_AT.set(reloaded_at)
+
+
+def record_machine_audit_events(outcome: str, count: int) -> None:
+    MACHINE_AUDIT_EVENTS.labels(outcome=outcome).inc(count)
+
+
+def record_machine_quota_rejection(quota: str) -> None:
+    MACHINE_QUOTA_REJECTIONS.labels(quota=quota).inc()
+
+
+def record_rate_limit_check(source: str) -> None:
+    RATE_LIMIT_CHECKS.labels(source=source).inc()
+
+
+def record_rate_limit_memory(*, clients: int, bytes_total: int, swept: int) -> None:
+    RATE_LIMIT_MEMORY_CLIENTS.set(clients)
+    RATE_LIMIT_MEMORY_BYTES_PER_CLIENT.set(bytes_total / clients if clients else 0)
+    RATE_LIMIT_MEMORY_SWEPT.inc(swept)
+
+
+def record_http_client_request(host: str, connection: str) -> None:
+    HTTP_CLIENT_REQUESTS.labels(host=host, connection=connection).inc()
+
+
+def record_http_client_connect(host: str, phase: str, duration_s: float) -> None:
+    HTTP_CLIENT_CONNECT_LATENCY.labels(host=host, phase=phase).observe(duration_s)
+
+
+def record_http_client_pool(*, active: int, idle: int) -> None:
+    HTTP_CLIENT_POOL_CONNECTIONS.labels(state="active").set(active)
+    HTTP_CLIENT_POOL_CONNECTIONS.labels(state="idle").set(idle)
+
+
+def record_web_session_check(outcome: str) -> None:
+    WEB_SESSION_CHECKS.labels(outcome=outcome).inc()
+
+
+def record_session_store_operation(op: str, outcome: str) -> None:
+    SESSION_STORE_OPERATIONS.labels(op=op, outcome=outcome).inc()
+
+
+def record_compression(encoding: str, bytes_in: int, bytes_out: int) -> None:
+    COMPRESSION_BYTES.labels(encoding=encoding, direction="in").inc(bytes_in)
+    COMPRESSION_BYTES.labels(encoding=encoding, direction="out").inc(bytes_out)
+
+
+def record_change_feed_poll(outcome: str) -> None:
+    CHANGE_FEED_POLLS.labels(outcome=outcome).inc()
+
+
+def record_log_lines_dropped(count: int) -> None:
+    LOG_LINES_DROPPED.inc(count)
+
+
+def multiprocess_dir() -> str | None:
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR") or None
+
+
+def mark_worker_dead(pid: int) -> None:
+    """Drop a worker's live* gauge files (its counters and histograms stay in the aggregate)."""
+    if multiprocess_dir():
+        multiprocess.mark_process_dead(pid)
 
 
-def render_metrics_payload() -> tuple[bytes, str]:
+def render_metrics_payload(accept: str | None = None) -> tuple[bytes, str]:
+    if multiprocess_dir():
+        # Fresh registry per scrape: MultiProcessCollector reads every worker's files at collect time.
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    if accept and "application/openmetrics-text" in accept:
+        # Only the OpenMetrics format carries exemplars.
+        return openmetrics.generate_latest(REGISTRY), openmetrics.CONTENT_TYPE_LATEST
     return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,5 +1,6 @@
 """
-Correlation IDs (X-Request-ID), request-scoped structlog context, access logs, Prometheus hooks.
+Correlation IDs (X-Request-ID), request-scoped structlog context, access logs, Prometheus hooks,
+and the per-request server span (app/tracing.py).
 """
 
 from __future__ import annotations
@@ -8,11 +9,17 @@ import time
 import uuid
 
 import structlog
-from starlette.middleware.base import BaseHTTPMiddleware
+from opentelemetry import propagate
+from opentelemetry.trace import Span, SpanKind, Status, StatusCode
 from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from app.access_log import access_log_sampler
 from app.config import settings
 from app.metrics import record_http_request
+from app.rate_limit import RateLimitDecision, rate_limit_headers
+from app.services.audit_writer import record_machine_request
+from app.tracing import current_trace_id, tracer
 
 logger = structlog.get_logger(__name__)
 
@@ -27,31 +34,96 @@ def route_label(request: Request) -> str:
     return p if len(p) <= 128 else p[:128]
 
 
-class ObservabilityMiddleware(BaseHTTPMiddleware):
+def _correlation_id(scope: Scope) -> str:
+    for name, value in scope.get("headers") or ():
+        if name in (b"x-request-id", b"x-correlation-id"):
+            cid = value.decode("latin-1").strip()
+            if cid:
+                return cid
+    return str(uuid.uuid4())
+
+
+def _trace_carrier(scope: Scope) -> dict[str, str]:
+    return {
+        name.decode("latin-1"): value.decode("latin-1")
+        for name, value in scope.get("headers") or ()
+        if name in (b"traceparent", b"tracestate")
+    }
+
+
+class ObservabilityMiddleware:
     """
     Assigns correlation_id (from X-Request-ID / X-Correlation-ID or new UUID),
-    binds structlog contextvars, logs access, records Prometheus metrics.
+    binds structlog contextvars, logs access, records Prometheus metrics, queues machine API audit rows,
+    and emits RateLimit-* headers for routes that consulted the limiter. Everything downstream runs
+    inside an HTTP server span (continuing an incoming traceparent); logs carry its trace_id.
+
+    Pure ASGI: headers are appended to http.response.start, so streaming bodies pass through unbuffered.
     """
 
-    async def dispatch(self, request: Request, call_next):
-        header_cid = request.headers.get("x-request-id") or request.headers.get("x-correlation-id")
-        correlation_id = header_cid.strip() if header_cid and header_cid.strip() else str(uuid.uuid4())
-        request.state.correlation_id = correlation_id
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with tracer.start_as_current_span(
+            scope["method"],  # renamed to "METHOD /route/template" once routing has matched
+            context=propagate.extract(_trace_carrier(scope)),
+            kind=SpanKind.SERVER,
+            attributes={"http.request.method": scope["method"], "url.path": scope["path"]},
+            record_exception=False,
+            set_status_on_exception=False,
+        ) as span:
+            await self._handle(scope, receive, send, span)
+
+    async def _handle(self, scope: Scope, receive: Receive, send: Send, span: Span) -> None:
+        correlation_id = _correlation_id(scope)
+        state = scope.setdefault("state", {})
+        state["correlation_id"] = correlation_id
         structlog.contextvars.clear_contextvars()
         structlog.contextvars.bind_contextvars(correlation_id=correlation_id)
+        trace_id = current_trace_id()
+        if trace_id:
+            structlog.contextvars.bind_contextvars(trace_id=trace_id)
+        span.set_attribute("app.correlation_id", correlation_id)
+        request = Request(scope)
+        cid_header = (b"x-request-id", correlation_id.encode("latin-1"))
+        status_code = 500
+
+        async def send_with_headers(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", ()))
+                rate = state.get("rate_limit")
+                if rate is not None:
+                    # A 429 raised with the same headers (HTTPException(headers=...)) must not get them twice.
+                    extra = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in rate_limit_headers(rate).items()]
+                    names = {name for name, _ in extra}
+                    headers = [h for h in headers if h[0].lower() not in names]
+                    headers.extend(extra)
+                headers.append(cid_header)
+                message["headers"] = headers
+            await send(message)
 
         start = time.perf_counter()
-        status_code = 500
         try:
-            response = await call_next(request)
-            status_code = response.status_code
-            response.headers["X-Request-ID"] = correlation_id
-        except Exception:
+            await self.app(scope, receive, send_with_headers)
+        except Exception as exc:
             duration_s = time.perf_counter() - start
+            route = route_label(request)
+            span.update_name(f"{request.method} {route}")
+            span.set_attributes({"http.route": route, "http.response.status_code": 500})
+            span.record_exception(exc)
+            span.set_status(Status(StatusCode.ERROR, type(exc).__name__))
+            record_machine_request(request, 500)
             if settings.OBSERVABILITY_METRICS_ENABLED:
                 record_http_request(
                     method=request.method,
-                    route=route_label(request),
+                    route=route,
                     status_code=500,
                     duration_s=duration_s,
                 )
@@ -65,24 +137,45 @@ class ObservabilityMiddleware(BaseHTTPMiddleware):
             raise
 
         duration_s = time.perf_counter() - start
+        route = route_label(request)
+        span.update_name(f"{request.method} {route}")
+        span.set_attributes({"http.route": route, "http.response.status_code": status_code})
+        if status_code >= 500:
+            span.set_status(Status(StatusCode.ERROR))
+        record_machine_request(request, status_code)
         if settings.OBSERVABILITY_METRICS_ENABLED:
             record_http_request(
                 method=request.method,
-                route=route_label(request),
+                route=route,
                 status_code=status_code,
                 duration_s=duration_s,
             )
         if settings.OBSERVABILITY_ACCESS_LOG:
-            fields = {
-                "method": request.method,
-                "path": request.url.path,
-                "route": route_label(request),
-                "status_code": status_code,
-                "duration_ms": round(duration_s * 1000, 2),
-            }
-            if status_code >= 500:
-                logger.warning("http_request", **fields)
-            else:
-                logger.info("http_request", **fields)
+            self._log_access(request, route, status_code, duration_s, state.get("rate_limit"))
         structlog.contextvars.clear_contextvars()
-        return response
+
+    @staticmethod
+    def _log_access(request: Request, route: str, status_code: int, duration_s: float, rate: RateLimitDecision | None) -> None:
+        duration_ms = round(duration_s * 1000, 2)
+        kept = access_log_sampler.decide(
+            method=request.method,
+            route=route,
+            status_code=status_code,
+            duration_ms=duration_ms,
+            rate_limited=rate is not None and rate.limited,
+        )
+        if kept is None:
+            return
+        fields = {
+            "method": request.method,
+            "path": request.url.path,
+            "route": route,
+            "status_code": status_code,
+            "duration_ms": duration_ms,
+            "log_reason": kept[0],
+            "sample_rate": kept[1],
+        }
+        if status_code >= 500:
+            logger.warning("http_request", **fields)
+        else:
+            logger.info("http_request", **fields)
@@ -0,0 +1,135 @@
+"""
+On-demand stack-sampling profiler for a running worker (GET /admin/profile).
+
+A thread-pool thread snapshots every other thread's Python stack with sys._current_frames() at
+PROFILER_SAMPLE_HZ for the requested number of seconds; nothing is hooked into the interpreter, so
+the cost is the sampler's own GIL time (a few percent at 100 Hz) and only while a session runs.
+One session per process: a second request gets ProfilerBusy (409).
+
+Route filter: only samples taken while a request for that route is on the stack, i.e. the
+event-loop thread inside ObservabilityMiddleware for a matching request. Work such a request hands
+to a thread pool (PDF text extraction, save_invoice) is not attributed to it; profile unfiltered
+to see worker threads.
+
+Output: collapsed stacks ("thread;outer;inner count" lines, for flamegraph.pl / speedscope /
+inferno) or speedscope's JSON file format.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType, FrameType
+
+from app.observability import ObservabilityMiddleware
+
+_REQUEST_CODE = ObservabilityMiddleware._handle.__code__
+_SESSION_LOCK = threading.Lock()
+
+Stack = tuple[str, ...]
+
+
+class ProfilerBusy(RuntimeError):
+    """Another profiling session is already running in this process."""
+
+
+def _frame_label(code: CodeType, cache: dict[CodeType, str]) -> str:
+    label = cache.get(code)
+    if label is None:
+        path = code.co_filename
+        marker = path.rfind("site-packages" + os.sep)
+        if marker >= 0:
+            path = path[marker + len("site-packages") + 1 :]
+        elif path.startswith(os.getcwd()):
+            path = os.path.relpath(path)
+        name = getattr(code, "co_qualname", code.co_name)
+        label = cache[code] = f"{name} ({path}:{code.co_firstlineno})"
+    return label
+
+
+def _request_route(frame: FrameType) -> str | None:
+    scope = frame.f_locals.get("scope")
+    if not isinstance(scope, dict):
+        return None
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path if isinstance(path, str) else scope.get("path")
+
+
+def sample_stacks(*, seconds: float, hz: int, route: str | None = None) -> tuple[Counter[Stack], int]:
+    """Sample all other threads for `seconds`; returns (collapsed stack counts, sampling ticks)."""
+    if not _SESSION_LOCK.acquire(blocking=False):
+        raise ProfilerBusy("a profiling session is already running")
+    try:
+        own = threading.get_ident()
+        interval = 1.0 / hz
+        labels: dict[CodeType, str] = {}
+        stacks: Counter[Stack] = Counter()
+        ticks = 0
+        deadline = time.monotonic() + seconds
+        next_tick = time.monotonic()
+        while next_tick < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                codes: list[CodeType] = []
+                matched = route is None
+                f: FrameType | None = frame
+                while f is not None:
+                    if not matched and f.f_code is _REQUEST_CODE:
+                        matched = _request_route(f) == route
+                    codes.append(f.f_code)
+                    f = f.f_back
+                if matched:
+                    stack = (names.get(ident, f"thread-{ident}"),) + tuple(_frame_label(c, labels) for c in reversed(codes))
+                    stacks[stack] += 1
+            frame = f = None  # don't pin sampled frames between ticks
+            ticks += 1
+            next_tick += interval
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+        return stacks, ticks
+    finally:
+        _SESSION_LOCK.release()
+
+
+def to_collapsed(stacks: Counter[Stack]) -> str:
+    return "".join(f"{';'.join(stack)} {count}\n" for stack, count in stacks.most_common())
+
+
+def to_speedscope(stacks: Counter[Stack], *, hz: int, name: str) -> dict:
+    """speedscope "sampled" profile (https://www.speedscope.app/file-format-schema.json), weights in seconds."""
+    frames: list[dict] = []
+    index: dict[str, int] = {}
+    samples: list[list[int]] = []
+    weights: list[float] = []
+    for stack, count in stacks.most_common():
+        row = []
+        for label in stack:
+            i = index.get(label)
+            if i is None:
+                i = index[label] = len(frames)
+                frames.append({"name": label})
+            row.append(i)
+        samples.append(row)
+        weights.append(count / hz)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "email-invoice-automation",
+        "shared": {"frames": frames},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }
+        ],
+    }
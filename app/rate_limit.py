@@ -2,25 +2,131 @@
 Distributed rate limiting (Redis) with in-process fallback.
 
 Set REDIS_URL for shared counters across workers/replicas (Render, Kubernetes, etc.).
-Without Redis, uses the previous deque+Lock implementation (per-process only).
+Redis uses a sliding-window log in one Lua script (EVALSHA: a single round trip, atomic, TTL always set).
+
+Two tiers: strict checks (login) go to Redis on every request. Other limits, once a key is hot (its
+third check within a lease lifetime), lease a chunk of the window (RATE_LIMIT_LEASE_FRACTION of the
+limit, at least RATE_LIMIT_LEASE_MIN_TOKENS) per round trip and spend it locally, prefetching the
+next chunk in the background when the lease runs low; a full window is also cached locally so abusive
+clients are refused without a round trip. Leased slots are already counted in Redis and are spent
+oldest first; a lease expires no later than its oldest slot leaves the Redis window, so every
+admission is still counted there and replicas cannot jointly exceed the limit. Slots still unspent
+when a lease expires (or is evicted) are removed from the Redis window again (ZREM), so long windows
+such as daily quotas are charged only for what was used.
+
+When Redis errors, a circuit breaker limits locally for RATE_LIMIT_REDIS_RETRY_SECONDS before trying
+again (logged once per outage, not per request). The local tier is a bounded, sharded in-process store
+(per-process only; see app/rate_limit_store.py).
 """
 
 from __future__ import annotations
 
+import asyncio
+import math
+import secrets
 import time
-from collections import deque
-from threading import Lock
+import weakref
+from collections import OrderedDict, deque
+from dataclasses import dataclass
 
 import redis.asyncio as redis_async
 import structlog
 from fastapi import Request
 
 from app.config import settings
+from app.metrics import record_rate_limit_check, record_rate_limit_memory
+from app.rate_limit_store import ShardedWindowStore
+from app.tracing import tracer
 
 log = structlog.get_logger(__name__)
 
-_LOCK = Lock()
-_MEMORY_STATE: dict[str, deque[float]] = {}
+_MEMORY_STORE = ShardedWindowStore(
+    max_keys=settings.RATE_LIMIT_MEMORY_MAX_KEYS,
+    shards=settings.RATE_LIMIT_MEMORY_SHARDS,
+)
+
+# KEYS[1] = zset of request timestamps (ms); ARGV = window_ms, limit, unique member suffix, tokens wanted.
+# Grants up to `wanted` slots (fewer if the window is nearly full), named <suffix>:1..granted so a lease
+# can give unspent ones back. Server TIME keeps replicas with skewed clocks consistent.
+# Returns {granted, remaining, reset_ms}.
+SLIDING_WINDOW_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local count = redis.call('ZCARD', KEYS[1])
+local granted = math.min(tonumber(ARGV[4]), limit - count)
+if granted > 0 then
+    for i = 1, granted do
+        redis.call('ZADD', KEYS[1], now, ARGV[3] .. ':' .. i)
+    end
+    redis.call('PEXPIRE', KEYS[1], window)
+    count = count + granted
+else
+    granted = 0
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+local reset = window
+if oldest[2] then
+    reset = tonumber(oldest[2]) + window - now
+end
+return {granted, limit - count, reset}
+"""
+
+_SCRIPTS: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+# Redis checks a key takes one slot at a time before it leases: most keys (a login or an upload now and
+# then) are seen once or twice, and a lease plus its release would cost them more round trips, not fewer.
+_LEASE_AFTER_CHECKS = 2
+
+# Circuit breaker: monotonic time before which Redis is not tried (0.0 = closed).
+_redis_retry_at = 0.0
+
+
+@dataclass
+class _Lease:
+    """Quota already counted in Redis and spent locally by this worker."""
+
+    redis: redis_async.Redis
+    members: deque[str]  # unspent slots by member name in the Redis window, oldest first
+    remaining: int
+    reset_at: float
+    expires_at: float
+    checks: int = 0  # checks Redis decided for this key during the lease; see _LEASE_AFTER_CHECKS
+    refill: asyncio.Task | None = None
+    timer: asyncio.TimerHandle | None = None
+
+    @property
+    def tokens(self) -> int:
+        return len(self.members)
+
+
+_LEASES: OrderedDict[str, _Lease] = OrderedDict()
+_RELEASES: set[asyncio.Task] = set()
+
+
+@dataclass(frozen=True)
+class RateLimitDecision:
+    """Outcome of one limiter check; reset_seconds = time until the oldest counted request leaves the window."""
+
+    limited: bool
+    limit: int
+    remaining: int
+    reset_seconds: float
+
+
+def rate_limit_headers(decision: RateLimitDecision) -> dict[str, str]:
+    """RateLimit-* fields (IETF httpapi draft) plus Retry-After when the request was limited."""
+    reset = max(0, math.ceil(decision.reset_seconds))
+    headers = {
+        "RateLimit-Limit": str(decision.limit),
+        "RateLimit-Remaining": str(max(0, decision.remaining)),
+        "RateLimit-Reset": str(reset),
+    }
+    if decision.limited:
+        headers["Retry-After"] = str(max(1, reset))
+    return headers
 
 
 def get_client_ip(request: Request) -> str:
@@ -34,54 +140,302 @@ def get_client_ip(request: Request) -> str:
     return client.host or "unknown"
 
 
-def _memory_is_limited(client_ip: str, action: str, max_requests: int, window_seconds: int) -> bool:
-    now = time.monotonic()
-    state_key = f"{action}:{client_ip}"
-    with _LOCK:
-        request_times = _MEMORY_STATE.get(state_key)
-        if request_times is None:
-            request_times = deque()
-            _MEMORY_STATE[state_key] = request_times
-        while request_times and now - request_times[0] > window_seconds:
-            request_times.popleft()
-        if len(request_times) >= max_requests:
-            return True
-        request_times.append(now)
-    return False
-
-
-async def _redis_is_limited(
+def _memory_check(client_ip: str, action: str, max_requests: int, window_seconds: int) -> RateLimitDecision:
+    limited, remaining, reset = _MEMORY_STORE.hit(
+        f"{action}:{client_ip}",
+        limit=max_requests,
+        window_seconds=window_seconds,
+    )
+    return RateLimitDecision(limited=limited, limit=max_requests, remaining=remaining, reset_seconds=reset)
+
+
+async def run_rate_limit_sweeper() -> None:
+    """Lifespan task: drop idle in-memory limiter entries and publish store size metrics."""
+    while True:
+        await asyncio.sleep(settings.RATE_LIMIT_MEMORY_SWEEP_SECONDS)
+        removed = _MEMORY_STORE.sweep()
+        if settings.OBSERVABILITY_METRICS_ENABLED:
+            stats = _MEMORY_STORE.stats()
+            record_rate_limit_memory(clients=stats.clients, bytes_total=stats.bytes_total, swept=removed)
+
+
+def _redis_key(key: str) -> str:
+    return f"{settings.RATE_LIMIT_REDIS_KEY_PREFIX}:sw:{key}"
+
+
+def _sliding_window_script(redis_client: redis_async.Redis):
+    script = _SCRIPTS.get(redis_client)
+    if script is None:
+        # AsyncScript sends EVALSHA and only falls back to SCRIPT LOAD on NOSCRIPT (first call / Redis restart).
+        script = redis_client.register_script(SLIDING_WINDOW_LUA)
+        _SCRIPTS[redis_client] = script
+    return script
+
+
+async def _redis_grant(
+    redis_client: redis_async.Redis,
+    key: str,
+    max_requests: int,
+    window_seconds: int,
+    wanted: int,
+) -> tuple[list[str], int, float]:
+    """Returns (granted member names, remaining, reset_seconds) for `wanted` slots of the window at `key`."""
+    script = _sliding_window_script(redis_client)
+    suffix = secrets.token_hex(8)
+    granted, remaining, reset_ms = await script(
+        keys=[_redis_key(key)],
+        args=[window_seconds * 1000, max_requests, suffix, wanted],
+    )
+    return [f"{suffix}:{i}" for i in range(1, int(granted) + 1)], int(remaining), int(reset_ms) / 1000
+
+
+async def _redis_check(
     redis_client: redis_async.Redis,
     client_ip: str,
     action: str,
     max_requests: int,
     window_seconds: int,
-) -> bool:
-    key = f"{settings.RATE_LIMIT_REDIS_KEY_PREFIX}:{action}:{client_ip}"
-    count = await redis_client.incr(key)
-    if count == 1:
-        await redis_client.expire(key, window_seconds)
-    return count > max_requests
+) -> RateLimitDecision:
+    members, remaining, reset = await _redis_grant(
+        redis_client, f"{action}:{client_ip}", max_requests, window_seconds, 1
+    )
+    return RateLimitDecision(limited=not members, limit=max_requests, remaining=remaining, reset_seconds=reset)
+
+
+def _redis_usable() -> bool:
+    return time.monotonic() >= _redis_retry_at
+
+
+def _redis_failed(action: str) -> None:
+    global _redis_retry_at
+    if _redis_retry_at == 0.0:
+        log.warning(
+            "rate_limit_redis_unavailable",
+            action=action,
+            retry_in_seconds=settings.RATE_LIMIT_REDIS_RETRY_SECONDS,
+            exc_info=True,
+        )
+    _redis_retry_at = time.monotonic() + settings.RATE_LIMIT_REDIS_RETRY_SECONDS
+
+
+def _redis_succeeded() -> None:
+    global _redis_retry_at
+    if _redis_retry_at != 0.0:
+        log.info("rate_limit_redis_recovered")
+        _redis_retry_at = 0.0
+
+
+async def _return_slots(redis_client: redis_async.Redis, key: str, members: list[str]) -> None:
+    try:
+        await redis_client.zrem(_redis_key(key), *members)
+    except Exception:
+        # Not fatal: the slots still leave the window when it slides past them.
+        log.debug("rate_limit_lease_release_failed", key=key, exc_info=True)
+
+
+def _drop_lease(key: str, lease: _Lease) -> None:
+    """Forget an expired or evicted lease and give its unspent slots back to the Redis window."""
+    if _LEASES.get(key) is lease:
+        del _LEASES[key]
+    if lease.timer is not None:
+        lease.timer.cancel()
+        lease.timer = None
+    members, lease.members = list(lease.members), deque()
+    if members:
+        task = asyncio.get_running_loop().create_task(_return_slots(lease.redis, key, members))
+        _RELEASES.add(task)
+        task.add_done_callback(_RELEASES.discard)
+
+
+def _lease_timer(key: str, lease: _Lease) -> None:
+    # Expire idle leases too: otherwise their slots stay counted until the next request for the key.
+    lease.timer = None
+    if _LEASES.get(key) is not lease:
+        return
+    delay = lease.expires_at - time.monotonic()
+    if delay > 0:
+        lease.timer = asyncio.get_running_loop().call_later(delay, _lease_timer, key, lease)
+    else:
+        _drop_lease(key, lease)
+
+
+def _absorb_grant(
+    redis_client: redis_async.Redis,
+    key: str,
+    members: list[str],
+    remaining: int,
+    reset: float,
+    window_seconds: int,
+    asked_at: float,
+) -> _Lease:
+    now = time.monotonic()
+    lease = _LEASES.get(key)
+    if lease is not None and now >= lease.expires_at:
+        _drop_lease(key, lease)
+        lease = None
+    if lease is None:
+        # A full window is cached until it resets; no lease lives past RATE_LIMIT_LEASE_MAX_SECONDS.
+        ttl = window_seconds if members else reset
+        lease = _Lease(
+            redis=redis_client,
+            members=deque(),
+            remaining=remaining,
+            reset_at=now + reset,
+            expires_at=now + min(ttl, settings.RATE_LIMIT_LEASE_MAX_SECONDS),
+        )
+        _LEASES[key] = lease
+        while len(_LEASES) > settings.RATE_LIMIT_MEMORY_MAX_KEYS:
+            _drop_lease(*next(iter(_LEASES.items())))
+        lease.timer = asyncio.get_running_loop().call_later(lease.expires_at - now, _lease_timer, key, lease)
+    if members:
+        # Redis scored these slots at or after asked_at, so they stay in its window until at least
+        # asked_at + window_seconds. Refills never extend the lease past its oldest slot.
+        lease.members.extend(members)
+        lease.expires_at = min(lease.expires_at, asked_at + window_seconds)
+    lease.remaining = remaining
+    lease.reset_at = now + reset
+    return lease
+
+
+def _spend_lease(key: str, max_requests: int) -> RateLimitDecision | None:
+    """Decide from the local lease alone, or None when Redis has to be asked."""
+    lease = _LEASES.get(key)
+    now = time.monotonic()
+    if lease is None:
+        return None
+    if now >= lease.expires_at:
+        _drop_lease(key, lease)
+        return None
+    _LEASES.move_to_end(key)
+    reset = max(0.0, lease.reset_at - now)
+    if lease.members:
+        lease.members.popleft()
+        return RateLimitDecision(
+            limited=False,
+            limit=max_requests,
+            remaining=lease.tokens + lease.remaining,
+            reset_seconds=reset,
+        )
+    if lease.remaining <= 0 and lease.refill is None:
+        return RateLimitDecision(limited=True, limit=max_requests, remaining=0, reset_seconds=reset)
+    return None
+
+
+async def _refill_lease(
+    redis_client: redis_async.Redis,
+    key: str,
+    action: str,
+    max_requests: int,
+    window_seconds: int,
+    chunk: int,
+) -> None:
+    asked_at = time.monotonic()
+    try:
+        members, remaining, reset = await _redis_grant(redis_client, key, max_requests, window_seconds, chunk)
+    except Exception:
+        _redis_failed(action)
+        return
+    finally:
+        lease = _LEASES.get(key)
+        if lease is not None:
+            lease.refill = None
+    _redis_succeeded()
+    _absorb_grant(redis_client, key, members, remaining, reset, window_seconds, asked_at)
+
+
+def _maybe_prefetch(
+    redis_client: redis_async.Redis,
+    key: str,
+    action: str,
+    max_requests: int,
+    window_seconds: int,
+    chunk: int,
+) -> None:
+    lease = _LEASES.get(key)
+    if lease is None or lease.refill is not None or lease.tokens > chunk // 2:
+        return
+    if lease.checks <= _LEASE_AFTER_CHECKS:
+        return  # not leasing yet (its first chunk comes from the check after _LEASE_AFTER_CHECKS)
+    if lease.remaining <= 0 or not _redis_usable():
+        return
+    lease.refill = asyncio.create_task(
+        _refill_lease(redis_client, key, action, max_requests, window_seconds, chunk)
+    )
+
+
+async def _leased_check(
+    redis_client: redis_async.Redis,
+    key: str,
+    max_requests: int,
+    window_seconds: int,
+    chunk: int,
+) -> RateLimitDecision:
+    lease = _LEASES.get(key)
+    wanted = chunk if lease is not None and lease.checks >= _LEASE_AFTER_CHECKS else 1
+    asked_at = time.monotonic()
+    members, remaining, reset = await _redis_grant(redis_client, key, max_requests, window_seconds, wanted)
+    lease = _absorb_grant(redis_client, key, members, remaining, reset, window_seconds, asked_at)
+    lease.checks += 1
+    if not lease.members:
+        return RateLimitDecision(limited=True, limit=max_requests, remaining=0, reset_seconds=reset)
+    lease.members.popleft()
+    return RateLimitDecision(
+        limited=False,
+        limit=max_requests,
+        remaining=lease.tokens + lease.remaining,
+        reset_seconds=reset,
+    )
+
+
+def _lease_chunk(max_requests: int) -> int:
+    # A floor so small limits (uploads: 10 per 300 s, machine keys: 10 rps) still lease; under 2 means no lease.
+    wanted = math.ceil(max_requests * settings.RATE_LIMIT_LEASE_FRACTION)
+    return min(max_requests, max(settings.RATE_LIMIT_LEASE_MIN_TOKENS, wanted))
 
 
-async def check_rate_limited(
+async def check_rate_limit(
     request: Request,
     *,
     action: str,
     max_requests: int,
     window_seconds: int,
-) -> bool:
-    client_ip = get_client_ip(request)
-    redis_client = getattr(request.app.state, "redis", None)
-    if redis_client is not None:
-        try:
-            return await _redis_is_limited(redis_client, client_ip, action, max_requests, window_seconds)
-        except Exception:
-            log.warning(
-                "rate_limit_redis_fallback",
-                action=action,
-                client_ip=client_ip,
-                exc_info=True,
-            )
-            return _memory_is_limited(client_ip, action, max_requests, window_seconds)
-    return _memory_is_limited(client_ip, action, max_requests, window_seconds)
+    strict: bool = False,
+    identity: str | None = None,
+) -> RateLimitDecision:
+    """
+    Count this request against `action` for `identity` (default: the client IP) over a sliding
+    window of `window_seconds`. strict=True asks Redis on every call instead of spending a local lease (use for login).
+    The decision is stored on request.state.rate_limit; ObservabilityMiddleware turns it into
+    RateLimit-* / Retry-After response headers, so callers only branch on `.limited`.
+    """
+    with tracer.start_as_current_span("rate_limit.check", attributes={"rate_limit.action": action}) as span:
+        client_ip = identity or get_client_ip(request)
+        key = f"{action}:{client_ip}"
+        redis_client = getattr(request.app.state, "redis", None)
+        chunk = 0 if strict else _lease_chunk(max_requests)
+        decision: RateLimitDecision | None = None
+        source = "redis"
+        if redis_client is not None:
+            if chunk >= 2:
+                decision = _spend_lease(key, max_requests)
+                source = "lease"
+            if decision is None and _redis_usable():
+                source = "redis"
+                try:
+                    if chunk >= 2:
+                        decision = await _leased_check(redis_client, key, max_requests, window_seconds, chunk)
+                    else:
+                        decision = await _redis_check(redis_client, client_ip, action, max_requests, window_seconds)
+                except Exception:
+                    _redis_failed(action)
+                else:
+                    _redis_succeeded()
+            if decision is not None and chunk >= 2:
+                _maybe_prefetch(redis_client, key, action, max_requests, window_seconds, chunk)
+        if decision is None:
+            source = "memory"
+            decision = _memory_check(client_ip, action, max_requests, window_seconds)
+        span.set_attributes({"rate_limit.source": source, "rate_limit.limited": decision.limited})
+    record_rate_limit_check(source)
+    request.state.rate_limit = decision
+    return decision
@@ -0,0 +1,121 @@
+"""
+In-process sliding-window state for the rate limiter (no Redis, or Redis unreachable).
+
+Keys are spread over independently locked shards, each an LRU capped at max_keys / shards, so a
+scan from many IPs evicts the least recently seen clients instead of growing without bound.
+Each client is one slotted object holding a fixed-size ring buffer of timestamps (array of
+doubles sized to the limit) rather than a deque of float objects. A periodic sweep drops clients
+whose newest request has left the window.
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+
+
+class _WindowLog:
+    """Ring buffer of the last `capacity` request times (time.monotonic()) for one client/action."""
+
+    __slots__ = ("times", "head", "count", "window")
+
+    def __init__(self, capacity: int, window: float) -> None:
+        self.times = array("d", bytes(8 * capacity))
+        self.head = 0
+        self.count = 0
+        self.window = window
+
+    def _expire(self, now: float) -> None:
+        capacity = len(self.times)
+        while self.count and now - self.times[self.head] > self.window:
+            self.head = (self.head + 1) % capacity
+            self.count -= 1
+
+    def hit(self, now: float) -> tuple[bool, int, float]:
+        """Count one request unless full. Returns (limited, remaining, seconds until the oldest entry expires)."""
+        self._expire(now)
+        capacity = len(self.times)
+        limited = self.count >= capacity
+        if not limited:
+            self.times[(self.head + self.count) % capacity] = now
+            self.count += 1
+        reset = self.window - (now - self.times[self.head]) if self.count else self.window
+        return limited, capacity - self.count, reset
+
+    def newest(self) -> float:
+        if not self.count:
+            return float("-inf")
+        return self.times[(self.head + self.count - 1) % len(self.times)]
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self.times)
+
+
+@dataclass(frozen=True)
+class StoreStats:
+    clients: int
+    bytes_total: int
+
+
+class _Shard:
+    __slots__ = ("lock", "entries")
+
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.entries: OrderedDict[str, _WindowLog] = OrderedDict()
+
+
+class ShardedWindowStore:
+    def __init__(self, *, max_keys: int, shards: int) -> None:
+        self.shards = [_Shard() for _ in range(max(1, shards))]
+        self.max_keys_per_shard = max(1, max_keys // len(self.shards))
+
+    def _shard(self, key: str) -> _Shard:
+        return self.shards[hash(key) % len(self.shards)]
+
+    def hit(self, key: str, *, limit: int, window_seconds: float, now: float | None = None) -> tuple[bool, int, float]:
+        now = time.monotonic() if now is None else now
+        shard = self._shard(key)
+        with shard.lock:
+            log = shard.entries.get(key)
+            if log is None or len(log.times) != limit or log.window != window_seconds:
+                log = _WindowLog(limit, window_seconds)
+                shard.entries[key] = log
+                while len(shard.entries) > self.max_keys_per_shard:
+                    shard.entries.popitem(last=False)
+            else:
+                shard.entries.move_to_end(key)
+            return log.hit(now)
+
+    def sweep(self, now: float | None = None) -> int:
+        """Drop clients with no request inside their window. Locks one shard at a time."""
+        now = time.monotonic() if now is None else now
+        removed = 0
+        for shard in self.shards:
+            with shard.lock:
+                idle = [k for k, log in shard.entries.items() if now - log.newest() > log.window]
+                for k in idle:
+                    del shard.entries[k]
+                removed += len(idle)
+        return removed
+
+    def stats(self) -> StoreStats:
+        clients = 0
+        total = 0
+        for shard in self.shards:
+            with shard.lock:
+                clients += len(shard.entries)
+                total += sum(log.nbytes() + sys.getsizeof(k) for k, log in shard.entries.items())
+        return StoreStats(clients=clients, bytes_total=total)
+
+    def clear(self) -> None:
+        for shard in self.shards:
+            with shard.lock:
+                shard.entries.clear()
+
+    def __len__(self) -> int:
+        return sum(len(shard.entries) for shard in self.shards)
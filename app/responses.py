@@ -0,0 +1,22 @@
+"""
+orjson-backed JSON responses.
+
+FastJSONResponse is the app's default response class. A route that returns a plain dict still goes
+through FastAPI's jsonable_encoder walk before rendering; routes whose data is already JSON-native
+(PostgREST rows, our own dicts) return FastJSONResponse(...) directly to skip that walk, and orjson
+renders the body several times faster than the stdlib json module. Types orjson does not know
+natively (Decimal, sets, pydantic models) go through jsonable_encoder only for that value.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=jsonable_encoder, option=orjson.OPT_NON_STR_KEYS)
@@ -6,9 +6,9 @@ TLS termination remains at the reverse proxy; HSTS is only sent when explicitly
 from __future__ import annotations
 
 import secrets
+from functools import lru_cache
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from app.config import settings
 
@@ -45,49 +45,87 @@ def build_csp_with_script_nonce(nonce: str) -> str:
     )
 
 
-class CspNonceMiddleware(BaseHTTPMiddleware):
+def _config_key() -> tuple:
+    return (
+        settings.SECURITY_X_FRAME_OPTIONS,
+        settings.SECURITY_REFERRER_POLICY,
+        settings.SECURITY_PERMISSIONS_POLICY,
+        settings.SECURITY_CSP,
+        settings.SECURITY_CSP_USE_NONCES,
+        settings.SECURITY_CSP_UPGRADE_INSECURE,
+        settings.SECURITY_ENABLE_HSTS,
+        settings.SECURITY_HSTS_MAX_AGE,
+        settings.SECURITY_HSTS_INCLUDE_SUBDOMAINS,
+        settings.SECURITY_HSTS_PRELOAD,
+        settings.SECURITY_CROSS_ORIGIN_OPENER_POLICY,
+    )
+
+
+def _finish_csp(csp: str) -> str:
+    if settings.SECURITY_CSP_UPGRADE_INSECURE and "upgrade-insecure-requests" not in csp:
+        return f"{csp}; upgrade-insecure-requests"
+    return csp
+
+
+@lru_cache(maxsize=8)
+def _static_headers(_key: tuple) -> tuple[tuple[bytes, bytes], ...]:
+    """Encoded header pairs that do not vary per request (keyed by the settings they derive from)."""
+    headers = {
+        "x-content-type-options": "nosniff",
+        "x-frame-options": settings.SECURITY_X_FRAME_OPTIONS,
+        "referrer-policy": settings.SECURITY_REFERRER_POLICY,
+        "permissions-policy": settings.SECURITY_PERMISSIONS_POLICY,
+    }
+    if settings.SECURITY_CSP:
+        headers["content-security-policy"] = _finish_csp(settings.SECURITY_CSP)
+    elif not settings.SECURITY_CSP_USE_NONCES:
+        headers["content-security-policy"] = _finish_csp(DEFAULT_CSP)
+    if settings.SECURITY_ENABLE_HSTS:
+        hsts = f"max-age={settings.SECURITY_HSTS_MAX_AGE}"
+        if settings.SECURITY_HSTS_INCLUDE_SUBDOMAINS:
+            hsts = f"{hsts}; includeSubDomains"
+        if settings.SECURITY_HSTS_PRELOAD:
+            hsts = f"{hsts}; preload"
+        headers["strict-transport-security"] = hsts
+    if settings.SECURITY_CROSS_ORIGIN_OPENER_POLICY:
+        headers["cross-origin-opener-policy"] = settings.SECURITY_CROSS_ORIGIN_OPENER_POLICY
+    return tuple((k.encode("latin-1"), v.encode("latin-1")) for k, v in headers.items())
+
+
+class SecurityHeadersMiddleware:
     """
-    Outermost middleware: set request.state.csp_nonce before HTML routes render.
-    Ignored when SECURITY_CSP override is set (operator owns the full policy).
+    Pure ASGI (no BaseHTTPMiddleware task/stream wrapping): sets request.state.csp_nonce before the
+    route runs (nonce CSP mode, ignored when the SECURITY_CSP override is set) and appends the security
+    headers to http.response.start. Headers a route already set are replaced, not duplicated.
     """
 
-    async def dispatch(self, request: Request, call_next):
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.SECURITY_HEADERS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        static = _static_headers(_config_key())
+        extra = static
         if settings.SECURITY_CSP_USE_NONCES and not settings.SECURITY_CSP:
-            request.state.csp_nonce = secrets.token_urlsafe(16)
-        return await call_next(request)
-
-
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        response = await call_next(request)
-        if not settings.SECURITY_HEADERS_ENABLED:
-            return response
-
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = settings.SECURITY_X_FRAME_OPTIONS
-        response.headers["Referrer-Policy"] = settings.SECURITY_REFERRER_POLICY
-        response.headers["Permissions-Policy"] = settings.SECURITY_PERMISSIONS_POLICY
-
-        if settings.SECURITY_CSP:
-            csp = settings.SECURITY_CSP
-        elif settings.SECURITY_CSP_USE_NONCES:
-            nonce = getattr(request.state, "csp_nonce", None)
-            csp = build_csp_with_script_nonce(nonce) if nonce else DEFAULT_CSP
-        else:
-            csp = DEFAULT_CSP
-        if settings.SECURITY_CSP_UPGRADE_INSECURE and "upgrade-insecure-requests" not in csp:
-            csp = f"{csp}; upgrade-insecure-requests"
-        response.headers["Content-Security-Policy"] = csp
-
-        if settings.SECURITY_ENABLE_HSTS:
-            hsts = f"max-age={settings.SECURITY_HSTS_MAX_AGE}"
-            if settings.SECURITY_HSTS_INCLUDE_SUBDOMAINS:
-                hsts = f"{hsts}; includeSubDomains"
-            if settings.SECURITY_HSTS_PRELOAD:
-                hsts = f"{hsts}; preload"
-            response.headers["Strict-Transport-Security"] = hsts
-
-        if settings.SECURITY_CROSS_ORIGIN_OPENER_POLICY:
-            response.headers["Cross-Origin-Opener-Policy"] = settings.SECURITY_CROSS_ORIGIN_OPENER_POLICY
-
-        return response
+            nonce = secrets.token_urlsafe(16)
+            scope.setdefault("state", {})["csp_nonce"] = nonce
+            csp = _finish_csp(build_csp_with_script_nonce(nonce))
+            extra = (*static, (b"content-security-policy", csp.encode("latin-1")))
+        names = {name for name, _ in extra}
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = [h for h in message.get("headers", ()) if h[0].lower() not in names]
+                if message["status"] == 304 and extra is not static:
+                    # The browser reuses its cached page, whose inline scripts carry the cached
+                    # response's nonce; omitting CSP here keeps that response's policy in force.
+                    headers.extend(static)
+                else:
+                    headers.extend(extra)
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
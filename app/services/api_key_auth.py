@@ -1,72 +1,339 @@
 """
 Machine API authentication: Bearer / X-API-Key with DB-backed keys + scopes,
-optional legacy X-App-Password, and audit rows (service_role required for keys).
+optional legacy X-App-Password, and audit rows (service_role required for keys; see audit_writer).
 """
 
 from __future__ import annotations
 
+import asyncio
 import hashlib
 import hmac
 import time
-from datetime import datetime, timezone
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta, timezone
+
+import redis.asyncio as redis_async
 import structlog
 from fastapi import Header, HTTPException, Request, status
 from supabase import Client
 
 from app.config import settings
 from app.db import create_service_role_client
+from app.metrics import record_api_key_cache_state, record_machine_quota_rejection
+from app.rate_limit import check_rate_limit, rate_limit_headers
+from app.services.llm_usage import set_llm_principal
 
 logger = structlog.get_logger(__name__)
 
-_key_cache: tuple[float, list[dict]] = (0.0, [])
+_KEY_PAGE_SIZE = 1000
+_KEY_COLUMNS = "id,name,key_hash,scopes"
+_KEY_COLUMNS_VERSIONED = (
+    "id,name,key_hash,scopes,revoked_at,updated_at,rate_limit_per_second,llm_extractions_per_day"
+)
+
+
+@dataclass(frozen=True)
+class ApiKeyIndex:
+    """
+    Active keys indexed by key_hash (SHA-256 hex of the secret). Replaced wholesale on every reload
+    (copy-on-write), so readers never see a half-applied delta.
+
+    version: bumped each time a reload or delta changes the index (per process).
+    watermark: max machine_api_keys.updated_at seen; None disables delta reloads (pre-migration schema).
+    """
+
+    loaded_at: float
+    by_digest: dict[str, dict]
+    by_id: dict[str, str] = field(default_factory=dict)
+    version: int = 0
+    watermark: str | None = None
+
+
+_key_index: ApiKeyIndex | None = None
+_refresh_task: asyncio.Task | None = None
+_pending_refresh: str | None = None
+_negative_cache: OrderedDict[str, float] = OrderedDict()
 
 
 def hash_api_secret(plaintext: str) -> str:
     return hashlib.sha256(plaintext.encode("utf-8")).hexdigest()
 
 
+def _fetch_key_pages(client: Client, *, columns: str, active_only: bool, since: str | None = None) -> list[dict]:
+    # PostgREST caps a single response (max-rows, 1000 on Supabase); page through large key tables.
+    rows: list[dict] = []
+    offset = 0
+    while True:
+        q = client.table("machine_api_keys").select(columns)
+        if active_only:
+            q = q.is_("revoked_at", "null")
+        if since is not None:
+            # gte, not gt: rows committed with the same timestamp as the watermark must not be skipped.
+            q = q.gte("updated_at", since)
+        res = q.order("id").range(offset, offset + _KEY_PAGE_SIZE - 1).execute()
+        page = res.data or []
+        rows.extend(page)
+        if len(page) < _KEY_PAGE_SIZE:
+            return rows
+        offset += _KEY_PAGE_SIZE
+
+
 def _fetch_active_keys(client: Client) -> list[dict]:
-    res = (
-        client.table("machine_api_keys")
-        .select("id,name,key_hash,scopes")
-        .is_("revoked_at", "null")
-        .execute()
+    return _fetch_key_pages(client, columns=_KEY_COLUMNS, active_only=True)
+
+
+def _parse_timestamp(value: object) -> datetime | None:
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+
+def _max_watermark(rows: list[dict], current: str | None) -> str | None:
+    # Compare as datetimes: offsets and fractional-second precision vary, so string order is not time order.
+    stamps = [r["updated_at"] for r in rows if _parse_timestamp(r.get("updated_at")) is not None]
+    if current:
+        stamps.append(current)
+    return max(stamps, key=_parse_timestamp) if stamps else current
+
+
+def _delta_since(watermark: str) -> str:
+    """
+    Lower bound for a delta reload. updated_at is now(), the transaction start, so a revocation can
+    commit after a reload already moved the watermark past its timestamp; re-reading the last
+    API_KEY_DELTA_OVERLAP_SECONDS picks it up (re-applied rows leave the index unchanged).
+    """
+    parsed = _parse_timestamp(watermark)
+    if parsed is None:
+        return watermark
+    return (parsed - timedelta(seconds=settings.API_KEY_DELTA_OVERLAP_SECONDS)).isoformat()
+
+
+def _index_row(by_digest: dict[str, dict], by_id: dict[str, str], row: dict) -> None:
+    stored = row.get("key_hash")
+    if isinstance(stored, str) and stored:
+        digest = stored.strip().lower()
+        by_digest[digest] = row
+        if row.get("id") is not None:
+            by_id[str(row["id"])] = digest
+
+
+def _build_key_index(rows: list[dict], loaded_at: float, *, version: int = 0, watermark: str | None = None) -> ApiKeyIndex:
+    by_digest: dict[str, dict] = {}
+    by_id: dict[str, str] = {}
+    for row in rows:
+        _index_row(by_digest, by_id, row)
+    return ApiKeyIndex(loaded_at=loaded_at, by_digest=by_digest, by_id=by_id, version=version, watermark=watermark)
+
+
+def _apply_key_delta(index: ApiKeyIndex, rows: list[dict], loaded_at: float) -> ApiKeyIndex:
+    by_digest = dict(index.by_digest)
+    by_id = dict(index.by_id)
+    changed = False
+    for row in rows:
+        kid = str(row.get("id"))
+        old_digest = by_id.pop(kid, None)
+        old_row = by_digest.pop(old_digest, None) if old_digest is not None else None
+        if row.get("revoked_at") is None:
+            _index_row(by_digest, by_id, row)
+        changed = changed or old_row != (row if row.get("revoked_at") is None else None)
+    return ApiKeyIndex(
+        loaded_at=loaded_at,
+        by_digest=by_digest,
+        by_id=by_id,
+        version=index.version + (1 if changed else 0),
+        watermark=_max_watermark(rows, index.watermark),
     )
-    return res.data or []
 
 
-def get_active_api_keys_cached() -> list[dict]:
-    global _key_cache
-    if not settings.SUPABASE_SERVICE_ROLE_KEY:
-        return []
-    now = time.monotonic()
-    ttl = settings.API_KEY_CACHE_SECONDS
-    if ttl > 0 and now - _key_cache[0] < ttl and _key_cache[1]:
-        return _key_cache[1]
+def _load_key_rows() -> tuple[list[dict], bool]:
+    """
+    Full load. Returns (rows, versioned); versioned is False before the updated_at and quota migrations
+    are applied (keys then get the default quotas).
+    """
+    client = create_service_role_client()
+    try:
+        return _fetch_key_pages(client, columns=_KEY_COLUMNS_VERSIONED, active_only=True), True
+    except Exception as exc:
+        logger.info("machine_api_keys_unversioned_schema", error=str(exc))
+        return _fetch_active_keys(client), False
+
+
+def _load_key_delta(since: str) -> list[dict]:
+    client = create_service_role_client()
+    return _fetch_key_pages(client, columns=_KEY_COLUMNS_VERSIONED, active_only=False, since=since)
+
+
+async def _reload_key_index(*, delta: bool = False) -> ApiKeyIndex:
+    global _key_index
+    previous = _key_index
+    mode = "delta" if delta and previous is not None and previous.watermark else "full"
     try:
-        client = create_service_role_client()
-        rows = _fetch_active_keys(client)
+        if mode == "delta":
+            rows = await asyncio.to_thread(_load_key_delta, _delta_since(previous.watermark))
+            index = _apply_key_delta(previous, rows, time.monotonic())
+        else:
+            rows, versioned = await asyncio.to_thread(_load_key_rows)
+            index = _build_key_index(
+                rows,
+                time.monotonic(),
+                version=(previous.version + 1) if previous is not None else 1,
+                watermark=_max_watermark(rows, None) if versioned else None,
+            )
     except Exception as exc:
-        logger.warning("machine_api_keys_load_failed", error=str(exc))
-        rows = []
-    _key_cache = (now, rows)
-    return rows
+        logger.warning("machine_api_keys_load_failed", mode=mode, error=str(exc))
+        # Keep serving the last good index; retry after another TTL instead of on every request.
+        if previous is not None:
+            index = replace(previous, loaded_at=time.monotonic())
+        else:
+            index = _build_key_index([], time.monotonic())
+    _key_index = index
+    for digest in [d for d in _negative_cache if d in index.by_digest]:
+        del _negative_cache[digest]
+    if settings.OBSERVABILITY_METRICS_ENABLED:
+        record_api_key_cache_state(
+            mode=mode,
+            version=index.version,
+            entries=len(index.by_digest),
+            reloaded_at=time.time(),
+        )
+    return index
+
 
+async def _run_refreshes(delta: bool) -> ApiKeyIndex:
+    global _pending_refresh
+    index = await _reload_key_index(delta=delta)
+    # Requests that arrived mid-reload may describe changes the finished query did not see.
+    while _pending_refresh is not None:
+        mode, _pending_refresh = _pending_refresh, None
+        index = await _reload_key_index(delta=mode == "delta")
+    return index
 
-def verify_api_key_plain(plaintext: str) -> dict | None:
+
+def schedule_api_key_refresh(*, delta: bool = False) -> asyncio.Task:
+    """
+    Start a background reload unless one is already in flight (single-flight); returns the task.
+    A request made while a reload runs is queued and applied right after it (full wins over delta).
+    """
+    global _refresh_task, _pending_refresh
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.get_running_loop().create_task(_run_refreshes(delta))
+    elif not delta or _pending_refresh == "full":
+        _pending_refresh = "full"
+    else:
+        _pending_refresh = "delta"
+    return _refresh_task
+
+
+async def get_api_key_index() -> ApiKeyIndex:
+    """
+    Stale-while-revalidate: an expired index is still served while a background task reloads it,
+    so requests only wait on Supabase for the very first load in a process (or when TTL is 0).
+    """
+    if not settings.SUPABASE_SERVICE_ROLE_KEY:
+        return ApiKeyIndex(loaded_at=time.monotonic(), by_digest={})
+    ttl = settings.API_KEY_CACHE_SECONDS
+    index = _key_index
+    if index is None or ttl == 0:
+        return await asyncio.shield(schedule_api_key_refresh())
+    if time.monotonic() - index.loaded_at >= ttl:
+        schedule_api_key_refresh()
+    return index
+
+
+def _negative_cache_hit(digest: str, now: float) -> bool:
+    expires_at = _negative_cache.get(digest)
+    if expires_at is None:
+        return False
+    if expires_at <= now:
+        del _negative_cache[digest]
+        return False
+    return True
+
+
+def _remember_unknown_digest(digest: str, now: float) -> None:
+    _negative_cache[digest] = now + settings.API_KEY_NEGATIVE_CACHE_SECONDS
+    _negative_cache.move_to_end(digest)
+    while len(_negative_cache) > settings.API_KEY_NEGATIVE_CACHE_MAX_ENTRIES:
+        _negative_cache.popitem(last=False)
+
+
+async def verify_api_key_plain(plaintext: str) -> dict | None:
+    """
+    O(1) lookup of sha256(secret) in the key index. Only the digest is compared, so lookup timing
+    reveals nothing usable about stored secrets. Unknown digests are remembered for
+    API_KEY_NEGATIVE_CACHE_SECONDS: repeats are rejected without touching the index, and a first miss
+    on an index older than API_KEY_MISS_REFRESH_SECONDS triggers one background reload (new keys
+    become usable without waiting for the full TTL, while credential stuffing cannot force reloads).
+    """
     if not plaintext:
         return None
     digest = hash_api_secret(plaintext)
-    for row in get_active_api_keys_cached():
-        stored = row.get("key_hash")
-        if isinstance(stored, str) and hmac.compare_digest(stored, digest):
-            return row
+    now = time.monotonic()
+    if _negative_cache_hit(digest, now):
+        return None
+    index = await get_api_key_index()
+    row = index.by_digest.get(digest)
+    if row is not None:
+        return row
+    _remember_unknown_digest(digest, now)
+    if settings.SUPABASE_SERVICE_ROLE_KEY and now - index.loaded_at >= settings.API_KEY_MISS_REFRESH_SECONDS:
+        schedule_api_key_refresh(delta=True)
     return None
 
 
 def invalidate_api_key_cache() -> None:
-    global _key_cache
-    _key_cache = (0.0, [])
+    """
+    Drop this process's index. Other workers reload on API_KEY_INVALIDATION_CHANNEL (the revoke runbook
+    in DEPLOYMENT.md publishes to it) or once their index is older than API_KEY_CACHE_SECONDS.
+    """
+    global _key_index
+    _key_index = None
+    _negative_cache.clear()
+
+
+async def publish_api_key_invalidation(redis_client: redis_async.Redis) -> int:
+    """
+    Tell every worker/replica subscribed to API_KEY_INVALIDATION_CHANNEL to apply a delta reload
+    (step two of the revoke runbook in DEPLOYMENT.md, after inserting, revoking or re-scoping
+    machine_api_keys). Returns the subscriber count. Equivalent from a shell: redis-cli PUBLISH <channel> reload
+    """
+    return int(await redis_client.publish(settings.API_KEY_INVALIDATION_CHANNEL, "reload"))
+
+
+async def run_api_key_invalidation_listener(redis_client: redis_async.Redis) -> None:
+    """
+    Lifespan task: delta-reload the key index on every invalidation message. Reconnects with backoff;
+    after each (re)subscribe a delta reload catches anything published while disconnected.
+    """
+    backoff = 1.0
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(settings.API_KEY_INVALIDATION_CHANNEL)
+            backoff = 1.0
+            if settings.SUPABASE_SERVICE_ROLE_KEY and _key_index is not None:
+                schedule_api_key_refresh(delta=True)
+            async for message in pubsub.listen():
+                if message.get("type") != "message" or not settings.SUPABASE_SERVICE_ROLE_KEY:
+                    continue
+                logger.info("machine_api_keys_invalidated", channel=settings.API_KEY_INVALIDATION_CHANNEL)
+                schedule_api_key_refresh(delta=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("machine_api_keys_listener_error", error=str(exc), retry_in_s=backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
 
 
 def _scopes_sufficient(granted: list[str], required: tuple[str, ...]) -> bool:
@@ -76,42 +343,69 @@ def _scopes_sufficient(granted: list[str], required: tuple[str, ...]) -> bool:
     return all(s in g for s in required)
 
 
-def audit_machine_request(
-    *,
-    service: Client,
-    api_key_id: str | None,
-    legacy_auth: bool,
+def machine_principal(request: Request) -> str:
+    """Stable identity for per-caller state (idempotency records): API key id, or the legacy shared secret."""
+    kid = getattr(request.state, "machine_api_key_id", None)
+    return f"key:{kid}" if kid else "legacy"
+
+
+def _key_quota(row: dict, column: str, default: int) -> int:
+    value = row.get(column)
+    return default if value is None else int(value)
+
+
+async def _enforce_quota(
     request: Request,
-    status_code: int,
+    *,
+    quota: str,
+    subject: str,
+    limit: int,
+    window_seconds: int,
+    strict: bool = False,
 ) -> None:
-    try:
-        ip = request.client.host if request.client else ""
-        service.table("machine_api_audit").insert(
-            {
-                "api_key_id": api_key_id,
-                "legacy_auth": legacy_auth,
-                "route": request.url.path,
-                "method": request.method,
-                "client_ip": ip or None,
-                "status_code": status_code,
-            }
-        ).execute()
-    except Exception as exc:
-        logger.warning("machine_api_audit_insert_failed", error=str(exc))
+    if limit <= 0:
+        return
+    decision = await check_rate_limit(
+        request,
+        action=f"machine_{quota}",
+        max_requests=limit,
+        window_seconds=window_seconds,
+        strict=strict,
+        identity=subject,
+    )
+    if decision.limited:
+        record_machine_quota_rejection(quota)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="API key quota exceeded",
+            headers=rate_limit_headers(decision),
+        )
 
 
-def touch_api_key_used(service: Client, api_key_id: str) -> None:
-    try:
-        ts = datetime.now(timezone.utc).isoformat()
-        service.table("machine_api_keys").update({"last_used_at": ts}).eq("id", api_key_id).execute()
-    except Exception as exc:
-        logger.warning("machine_api_key_touch_failed", api_key_id=api_key_id, error=str(exc))
+async def charge_llm_extraction(request: Request) -> None:
+    """
+    Count one extraction against the caller's extractions/day quota (429 when spent). Routes call this
+    right before parsing, after Idempotency-Key replays and request validation, so only requests that
+    actually reach the LLM are charged. Strict: a daily window is not worth leasing.
+    """
+    await _enforce_quota(
+        request,
+        quota="llm_extractions",
+        subject=machine_principal(request),
+        limit=request.state.machine_llm_extractions_per_day,
+        window_seconds=86400,
+        strict=True,
+    )
 
 
 def require_machine_scopes(*required_scopes: str):
     """
     FastAPI dependency: Bearer <secret> or X-API-Key, or legacy X-App-Password (if enabled).
     Scopes: invoices:read, invoices:write, invoices:admin (implies all).
+
+    Quotas per key (row columns, else API_KEY_DEFAULT_*; the legacy secret shares one bucket):
+    requests/sec here on every machine route; extractions/day via charge_llm_extraction().
+    Exceeding either returns 429 with RateLimit-* and Retry-After.
     """
 
     async def _dependency(
@@ -148,7 +442,7 @@ def require_machine_scopes(*required_scopes: str):
                 }
                 legacy = True
             else:
-                matched = verify_api_key_plain(token)
+                matched = await verify_api_key_plain(token)
 
         if not matched:
             raise HTTPException(
@@ -163,24 +457,25 @@ def require_machine_scopes(*required_scopes: str):
                 detail="Insufficient API key scope",
             )
 
-        if not settings.SUPABASE_SERVICE_ROLE_KEY:
-            return
-
-        try:
-            service = create_service_role_client()
-        except Exception:
-            return
-
         kid = matched.get("id")
         kid_str = str(kid) if kid else None
-        audit_machine_request(
-            service=service,
-            api_key_id=kid_str,
-            legacy_auth=legacy,
-            request=request,
-            status_code=200,
+        request.state.machine_api_key_id = kid_str
+        request.state.machine_auth_legacy = legacy
+
+        # Audit row (with the real status) is queued by ObservabilityMiddleware after the handler runs.
+        request.state.machine_audit = bool(settings.SUPABASE_SERVICE_ROLE_KEY)
+
+        subject = machine_principal(request)
+        set_llm_principal(subject)
+        await _enforce_quota(
+            request,
+            quota="requests",
+            subject=subject,
+            limit=_key_quota(matched, "rate_limit_per_second", settings.API_KEY_DEFAULT_RATE_LIMIT_PER_SECOND),
+            window_seconds=1,
+        )
+        request.state.machine_llm_extractions_per_day = _key_quota(
+            matched, "llm_extractions_per_day", settings.API_KEY_DEFAULT_LLM_EXTRACTIONS_PER_DAY
         )
-        if kid_str and not legacy:
-            touch_api_key_used(service, kid_str)
 
     return _dependency
@@ -0,0 +1,143 @@
+"""
+Off-path audit for machine API requests: rows for machine_api_audit and last_used_at touches are
+buffered in memory and written in bulk by a background task, so no API call waits on Supabase for them.
+
+require_machine_scopes marks the request; ObservabilityMiddleware calls record_machine_request once the
+real response status is known. The buffer is bounded: when Supabase is slow or down, new events are
+dropped (and counted) instead of growing memory. Events still buffered at shutdown are flushed in lifespan.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import structlog
+from starlette.requests import Request
+from supabase import Client
+
+from app.config import settings
+from app.db import create_service_role_client
+from app.metrics import record_machine_audit_events
+
+logger = structlog.get_logger(__name__)
+
+
+class MachineAuditWriter:
+    """Bounded buffer + periodic bulk insert (every flush_interval_s or batch_size rows, whichever first)."""
+
+    def __init__(
+        self,
+        *,
+        max_buffer: int,
+        batch_size: int,
+        flush_interval_s: float,
+        touch_debounce_s: float,
+    ) -> None:
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.touch_debounce_s = touch_debounce_s
+        self._events: deque[dict] = deque()
+        self._pending_touches: set[str] = set()
+        self._last_touch: dict[str, float] = {}
+        self._wakeup: asyncio.Event | None = None
+        self._service: Client | None = None
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def record(self, event: dict) -> None:
+        if len(self._events) >= self.max_buffer:
+            record_machine_audit_events("dropped", 1)
+            return
+        self._events.append(event)
+        if len(self._events) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def touch_key(self, api_key_id: str) -> None:
+        """Debounced per key: at most one last_used_at write per key every touch_debounce_s."""
+        now = time.monotonic()
+        last = self._last_touch.get(api_key_id)
+        if last is not None and now - last < self.touch_debounce_s:
+            return
+        self._last_touch[api_key_id] = now
+        self._pending_touches.add(api_key_id)
+
+    def _client(self) -> Client:
+        if self._service is None:
+            self._service = create_service_role_client()
+        return self._service
+
+    def _write(self, rows: list[dict], touched: list[str]) -> None:
+        service = self._client()
+        if rows:
+            try:
+                service.table("machine_api_audit").insert(rows).execute()
+                record_machine_audit_events("written", len(rows))
+            except Exception as exc:
+                record_machine_audit_events("failed", len(rows))
+                logger.warning("machine_api_audit_insert_failed", rows=len(rows), error=str(exc))
+        if touched:
+            try:
+                ts = datetime.now(timezone.utc).isoformat()
+                service.table("machine_api_keys").update({"last_used_at": ts}).in_("id", touched).execute()
+            except Exception as exc:
+                logger.warning("machine_api_key_touch_failed", keys=len(touched), error=str(exc))
+
+    async def flush(self) -> None:
+        while self._events or self._pending_touches:
+            rows = [self._events.popleft() for _ in range(min(self.batch_size, len(self._events)))]
+            touched = sorted(self._pending_touches)
+            self._pending_touches.clear()
+            await asyncio.to_thread(self._write, rows, touched)
+
+    async def run(self) -> None:
+        """Lifespan task: flush on a timer, or early when a full batch is buffered."""
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as exc:
+                logger.warning("machine_api_audit_flush_failed", error=str(exc))
+
+    async def aclose(self) -> None:
+        try:
+            await self.flush()
+        except Exception as exc:
+            logger.warning("machine_api_audit_flush_failed", error=str(exc))
+
+
+audit_writer = MachineAuditWriter(
+    max_buffer=settings.MACHINE_AUDIT_BUFFER_MAX,
+    batch_size=settings.MACHINE_AUDIT_BATCH_SIZE,
+    flush_interval_s=settings.MACHINE_AUDIT_FLUSH_INTERVAL_MS / 1000,
+    touch_debounce_s=settings.API_KEY_TOUCH_DEBOUNCE_SECONDS,
+)
+
+
+def record_machine_request(request: Request, status_code: int) -> None:
+    """Queue the audit row for an authenticated machine request (no-op for other routes)."""
+    if not getattr(request.state, "machine_audit", False):
+        return
+    kid = getattr(request.state, "machine_api_key_id", None)
+    legacy = bool(getattr(request.state, "machine_auth_legacy", False))
+    audit_writer.record(
+        {
+            "api_key_id": kid,
+            "legacy_auth": legacy,
+            "route": request.url.path,
+            "method": request.method,
+            "client_ip": (request.client.host if request.client else "") or None,
+            "status_code": status_code,
+        }
+    )
+    if kid and not legacy:
+        audit_writer.touch_key(kid)
@@ -1,11 +1,21 @@
 # app/services/azure_invoice_agent.py
 
+import time
 from typing import Optional
 
+import openai
+import pydantic
+import structlog
 from openai import AzureOpenAI
+from opentelemetry.trace import SpanKind, Status, StatusCode, get_current_span
 from pydantic import BaseModel
 
 from app.config import settings  # <-- use Settings instead of os.environ
+from app.metrics import record_llm_call
+from app.services.llm_usage import current_llm_principal, llm_usage
+from app.tracing import tracer
+
+logger = structlog.get_logger(__name__)
 
 
 # Azure OpenAI client configured with endpoint + api_key from settings
@@ -18,6 +28,43 @@ client = AzureOpenAI(
 DEPLOYMENT_NAME = settings.AZURE_OPENAI_DEPLOYMENT
 
 
+class LLMExtractionError(RuntimeError):
+    """
+    The LLM step failed; `outcome` says how (refusal, schema_error, content_filter, timeout,
+    rate_limited, api_error, error). Callers fall back to regex parsing and label the fallback with it.
+    """
+
+    def __init__(self, outcome: str, message: str) -> None:
+        super().__init__(message)
+        self.outcome = outcome
+
+
+def _failure_outcome(exc: Exception) -> str:
+    if isinstance(exc, openai.ContentFilterFinishReasonError):
+        return "content_filter"
+    if isinstance(exc, (openai.LengthFinishReasonError, pydantic.ValidationError, ValueError)):
+        # Truncated or non-conforming JSON: the structured output did not match InvoiceInfo.
+        return "schema_error"
+    if isinstance(exc, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(exc, openai.RateLimitError):
+        return "rate_limited"
+    if isinstance(exc, openai.APIError):
+        return "api_error"
+    return "error"
+
+
+def _failed_retries(exc: Exception) -> int | None:
+    # The SDK stamps every attempt with x-stainless-retry-count; the error carries the last request sent.
+    request = getattr(exc, "request", None) if isinstance(exc, openai.APIError) else None
+    if request is None:
+        return None
+    try:
+        return int(request.headers.get("x-stainless-retry-count", 0))
+    except ValueError:
+        return None
+
+
 class InvoiceInfo(BaseModel):
     """Structured output model for invoice information extracted from emails."""
     vendor: Optional[str]
@@ -33,42 +80,112 @@ def extract_invoice_from_email(email_text: str) -> dict:
     Use Azure OpenAI with structured outputs to extract invoice information
     from raw email text.
     """
+    with tracer.start_as_current_span(
+        f"chat {DEPLOYMENT_NAME}",
+        kind=SpanKind.CLIENT,
+        attributes={"gen_ai.system": "az.ai.openai", "gen_ai.request.model": DEPLOYMENT_NAME},
+    ):
+        return _extract(email_text)
+
+
+def _extract(email_text: str) -> dict:
+    start = time.perf_counter()
+    outcome = "error"
+    retries = 0
+    usage = None
+    try:
+        try:
+            # with_raw_response exposes retries_taken (the SDK retries 429/5xx/timeouts internally).
+            raw = client.beta.chat.completions.with_raw_response.parse(
+                model=DEPLOYMENT_NAME,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": (
+                            "You are an assistant that reads invoice emails and extracts structured invoice data. "
+                            "You MUST return only the fields defined in the schema: "
+                            "vendor (supplier name), total (numeric amount), currency (e.g. 'USD'), "
+                            "invoice_date (invoice date in YYYY-MM-DD if possible), "
+                            "sender_email (email address of the sender if available), "
+                            "invoice_number (invoice or reference number if visible). "
+                            "If a value is missing or not clear, set it to null."
+                        ),
+                    },
+                    {
+                        "role": "user",
+                        "content": (
+                            "Read the following email and extract the invoice fields:\n\n"
+                            f"{email_text}"
+                        ),
+                    },
+                ],
+                response_format=InvoiceInfo,
+            )
+            retries = raw.retries_taken
+            completion = raw.parse()
+        except Exception as exc:
+            outcome = _failure_outcome(exc)
+            failed_retries = _failed_retries(exc)
+            if failed_retries is not None:
+                retries = failed_retries
+            usage = getattr(getattr(exc, "completion", None), "usage", None)
+            raise LLMExtractionError(outcome, f"LLM extraction failed: {type(exc).__name__}") from exc
+        usage = completion.usage
+
+        message = completion.choices[0].message
+
+        if message.refusal is not None:
+            outcome = "refusal"
+            raise LLMExtractionError(outcome, f"Model refused the request: {message.refusal}")
+
+        parsed: InvoiceInfo = message.parsed
+        if parsed is None:
+            outcome = "schema_error"
+            raise LLMExtractionError(outcome, "Model returned no parsed InvoiceInfo")
+        outcome = "ok"
+    finally:
+        _record_call(outcome=outcome, duration_s=time.perf_counter() - start, retries=retries, usage=usage)
 
-    completion = client.beta.chat.completions.parse(
-        model=DEPLOYMENT_NAME,
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "You are an assistant that reads invoice emails and extracts structured invoice data. "
-                    "You MUST return only the fields defined in the schema: "
-                    "vendor (supplier name), total (numeric amount), currency (e.g. 'USD'), "
-                    "invoice_date (invoice date in YYYY-MM-DD if possible), "
-                    "sender_email (email address of the sender if available), "
-                    "invoice_number (invoice or reference number if visible). "
-                    "If a value is missing or not clear, set it to null."
-                ),
-            },
-            {
-                "role": "user",
-                "content": (
-                    "Read the following email and extract the invoice fields:\n\n"
-                    f"{email_text}"
-                ),
-            },
-        ],
-        response_format=InvoiceInfo,
-    )
-
-    message = completion.choices[0].message
-
-    if message.refusal is not None:
-        raise RuntimeError(f"Model refused the request: {message.refusal}")
-
-    parsed: InvoiceInfo = message.parsed
     data = parsed.model_dump(exclude_none=True)
 
     if "currency" not in data or data.get("currency") is None:
         data["currency"] = "USD"
 
-    return data
\ No newline at end of file
+    return data
+
+
+def _record_call(*, outcome: str, duration_s: float, retries: int, usage) -> None:
+    prompt_tokens = int(getattr(usage, "prompt_tokens", 0) or 0)
+    completion_tokens = int(getattr(usage, "completion_tokens", 0) or 0)
+    record_llm_call(
+        deployment=DEPLOYMENT_NAME,
+        outcome=outcome,
+        duration_s=duration_s,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        retries=retries,
+    )
+    span = get_current_span()
+    span.set_attributes(
+        {
+            "gen_ai.usage.input_tokens": prompt_tokens,
+            "gen_ai.usage.output_tokens": completion_tokens,
+            "app.llm.outcome": outcome,
+            "app.llm.retries": retries,
+        }
+    )
+    if outcome != "ok":
+        span.set_status(Status(StatusCode.ERROR, outcome))
+    if usage is not None:
+        llm_usage.add(deployment=DEPLOYMENT_NAME, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    log = logger.info if outcome == "ok" else logger.warning
+    log(
+        "llm_extraction",
+        deployment=DEPLOYMENT_NAME,
+        outcome=outcome,
+        duration_ms=round(duration_s * 1000, 2),
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        retries=retries,
+        principal=current_llm_principal(),
+    )
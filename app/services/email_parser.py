@@ -1,5 +1,6 @@
 # app/services/email_parser.py
 
+import io
 import re
 import email
 import quopri
@@ -8,9 +9,13 @@ from datetime import datetime
 from typing import Any, Dict, Optional
 
 import extract_msg
+import structlog
 from pypdf import PdfReader
 
-from app.services.azure_invoice_agent import extract_invoice_from_email
+from app.metrics import record_parse_fallback, time_stage
+from app.services.azure_invoice_agent import LLMExtractionError, extract_invoice_from_email
+
+logger = structlog.get_logger(__name__)
 
 
 def _extract_sender_email_from_text(text: str) -> Optional[str]:
@@ -91,15 +96,24 @@ def parse_msg_invoice(filepath: str) -> Dict[str, Any]:
     If the file is not a valid .msg (e.g. a plain text file renamed with .msg),
     fall back to reading it as plain text.
     """
+    return _parse_msg(filepath)
+
+
+def _parse_msg(source: str | bytes) -> Dict[str, Any]:
+    # extract_msg takes either a path or the raw file bytes.
     try:
-        msg = extract_msg.Message(filepath)
-        body = msg.body or ""
-        sender = msg.sender or None
+        with time_stage("text_extract"):
+            msg = extract_msg.Message(source)
+            body = msg.body or ""
+            sender = msg.sender or None
         return parse_text_to_fields(body, fallback_sender=sender)
     except Exception:
         # Fallback: treat the file as a simple text file
         try:
-            content = Path(filepath).read_text(encoding="utf-8", errors="ignore")
+            if isinstance(source, bytes):
+                content = source.decode("utf-8", errors="ignore")
+            else:
+                content = Path(source).read_text(encoding="utf-8", errors="ignore")
         except Exception:
             content = ""
         return parse_text_to_fields(content)
@@ -110,37 +124,42 @@ def parse_eml_invoice(filepath: str) -> Dict[str, Any]:
     Parse an .eml file and extract invoice fields using Azure OpenAI.
     """
     with open(filepath, "rb") as f:
-        msg = email.message_from_bytes(f.read())
-
-    body_parts: list[str] = []
-
-    # Collect all text/plain parts
-    if msg.is_multipart():
-        for part in msg.walk():
-            content_type = part.get_content_type()
-            if content_type == "text/plain":
-                charset = part.get_content_charset() or "utf-8"
-                payload = part.get_payload(decode=True)
-                if payload:
-                    body_parts.append(
-                        payload.decode(charset, errors="ignore")
-                    )
-    else:
-        payload = msg.get_payload(decode=True)
-        if isinstance(payload, bytes):
-            charset = msg.get_content_charset() or "utf-8"
-            body_parts.append(payload.decode(charset, errors="ignore"))
-        elif isinstance(payload, str):
-            body_parts.append(payload)
-
-    body = "\n".join(body_parts)
-
-    # Try to decode quoted-printable if needed
-    try:
-        body = quopri.decodestring(body).decode("utf-8", errors="ignore")
-    except Exception:
-        # If decoding fails, keep the original body
-        pass
+        return _parse_eml_bytes(f.read())
+
+
+def _parse_eml_bytes(raw: bytes) -> Dict[str, Any]:
+    with time_stage("text_extract"):
+        msg = email.message_from_bytes(raw)
+
+        body_parts: list[str] = []
+
+        # Collect all text/plain parts
+        if msg.is_multipart():
+            for part in msg.walk():
+                content_type = part.get_content_type()
+                if content_type == "text/plain":
+                    charset = part.get_content_charset() or "utf-8"
+                    payload = part.get_payload(decode=True)
+                    if payload:
+                        body_parts.append(
+                            payload.decode(charset, errors="ignore")
+                        )
+        else:
+            payload = msg.get_payload(decode=True)
+            if isinstance(payload, bytes):
+                charset = msg.get_content_charset() or "utf-8"
+                body_parts.append(payload.decode(charset, errors="ignore"))
+            elif isinstance(payload, str):
+                body_parts.append(payload)
+
+        body = "\n".join(body_parts)
+
+        # Try to decode quoted-printable if needed
+        try:
+            body = quopri.decodestring(body).decode("utf-8", errors="ignore")
+        except Exception:
+            # If decoding fails, keep the original body
+            pass
 
     sender = msg.get("From")
 
@@ -161,19 +180,40 @@ def parse_pdf_invoice(filepath: str) -> Dict[str, Any]:
     Parse a .pdf invoice by extracting text from all pages and then reusing
     the same invoice-field extraction pipeline.
     """
+    return _parse_pdf(filepath)
+
+
+def _parse_pdf(source: str | io.BytesIO) -> Dict[str, Any]:
     try:
-        reader = PdfReader(filepath)
-        pages_text = []
-        for page in reader.pages:
-            page_text = page.extract_text() or ""
-            pages_text.append(page_text)
-        content = "\n".join(pages_text).strip()
+        with time_stage("text_extract"):
+            reader = PdfReader(source)
+            pages_text = []
+            for page in reader.pages:
+                page_text = page.extract_text() or ""
+                pages_text.append(page_text)
+            content = "\n".join(pages_text).strip()
     except Exception:
         content = ""
 
     return parse_text_to_fields(content, fallback_sender=_extract_sender_email_from_text(content))
 
 
+def parse_invoice_bytes(content: bytes, kind: str) -> Dict[str, Any]:
+    """
+    Parse an in-memory document of a sniffed kind (txt, eml, msg, pdf) exactly like the
+    parse_* functions above parse the same bytes from a file, without writing a temp file.
+    """
+    if kind == "txt":
+        return parse_text_to_fields(content.decode("utf-8", errors="ignore"))
+    if kind == "eml":
+        return _parse_eml_bytes(content)
+    if kind == "msg":
+        return _parse_msg(content)
+    if kind == "pdf":
+        return _parse_pdf(io.BytesIO(content))
+    raise ValueError(f"Unsupported document kind: {kind}")
+
+
 def parse_text_to_fields(
     text: str,
     fallback_sender: Optional[str] = None,
@@ -192,7 +232,8 @@ def parse_text_to_fields(
 
     # First, try Azure OpenAI structured output
     try:
-        data = extract_invoice_from_email(text)
+        with time_stage("llm"):
+            data = extract_invoice_from_email(text)
 
         # ---------- VENDOR ----------
         if not data.get("vendor"):
@@ -290,8 +331,11 @@ def parse_text_to_fields(
 
         return data
 
-    except Exception:
+    except Exception as exc:
         # Fallback: legacy regex-only parsing if Azure fails for any reason
+        reason = exc.outcome if isinstance(exc, LLMExtractionError) else "error"
+        record_parse_fallback(reason)
+        logger.warning("invoice_parse_fallback", reason=reason, error_type=type(exc).__name__)
         vendor_match = re.search(
             r"(Vendor|From|Supplier|Billed\s*To|Company|Sender):?\s*(.+)",
             text,
@@ -0,0 +1,188 @@
+"""
+Idempotent response replay for machine POST routes (Idempotency-Key header).
+
+The first request for a (principal, key) pair claims the key, runs the handler and stores the
+JSON response; retries replay it without re-reading, re-parsing or re-querying Supabase.
+Reusing a key with a different request body/route returns 409, as does a retry while the first
+request is still in flight. Redis (REDIS_URL) shares records across workers with a TTL; otherwise
+a bounded in-process store is used (per worker only).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Literal
+
+import redis.asyncio as redis_async
+import structlog
+from fastapi import Request
+
+from app.config import settings
+
+log = structlog.get_logger(__name__)
+
+IdempotencyState = Literal["claimed", "replay", "conflict", "in_progress"]
+
+_LOCK = Lock()
+_MEMORY_STATE: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+
+
+@dataclass(frozen=True)
+class IdempotencyOutcome:
+    state: IdempotencyState
+    status_code: int = 200
+    body: Any = None
+
+
+def idempotency_key_from_request(request: Request) -> str | None:
+    raw = request.headers.get("Idempotency-Key") or request.headers.get("X-Idempotency-Key")
+    if not isinstance(raw, str) or not raw.strip():
+        return None
+    return raw.strip()[:256]
+
+
+def request_fingerprint(request: Request, body: bytes = b"") -> str:
+    """Method + route + body hash: a key reused for a different payload is a conflict, not a replay."""
+    h = hashlib.sha256()
+    h.update(request.method.encode("ascii"))
+    h.update(b"\n")
+    h.update(request.url.path.encode("utf-8"))
+    h.update(b"\n")
+    h.update(body)
+    return h.hexdigest()
+
+
+def _store_key(principal: str, key: str) -> str:
+    key_digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return f"{settings.IDEMPOTENCY_REDIS_KEY_PREFIX}:{principal}:{key_digest}"
+
+
+def _outcome_for_record(record: dict[str, Any], fingerprint: str) -> IdempotencyOutcome:
+    if record.get("fingerprint") != fingerprint:
+        return IdempotencyOutcome(state="conflict")
+    if record.get("state") != "done":
+        return IdempotencyOutcome(state="in_progress")
+    return IdempotencyOutcome(
+        state="replay",
+        status_code=int(record.get("status_code") or 200),
+        body=record.get("body"),
+    )
+
+
+def _memory_get(store_key: str, now: float) -> dict[str, Any] | None:
+    entry = _MEMORY_STATE.get(store_key)
+    if entry is None:
+        return None
+    expires_at, record = entry
+    if expires_at <= now:
+        del _MEMORY_STATE[store_key]
+        return None
+    return record
+
+
+def _memory_put(store_key: str, record: dict[str, Any], ttl_seconds: int, now: float) -> None:
+    _MEMORY_STATE[store_key] = (now + ttl_seconds, record)
+    _MEMORY_STATE.move_to_end(store_key)
+    while len(_MEMORY_STATE) > settings.IDEMPOTENCY_MEMORY_MAX_ENTRIES:
+        _MEMORY_STATE.popitem(last=False)
+
+
+def _memory_begin(store_key: str, fingerprint: str) -> IdempotencyOutcome:
+    now = time.monotonic()
+    with _LOCK:
+        record = _memory_get(store_key, now)
+        if record is not None:
+            return _outcome_for_record(record, fingerprint)
+        _memory_put(
+            store_key,
+            {"state": "pending", "fingerprint": fingerprint},
+            settings.IDEMPOTENCY_PENDING_TTL_SECONDS,
+            now,
+        )
+    return IdempotencyOutcome(state="claimed")
+
+
+def _memory_complete(store_key: str, record: dict[str, Any]) -> None:
+    with _LOCK:
+        _memory_put(store_key, record, settings.IDEMPOTENCY_TTL_SECONDS, time.monotonic())
+
+
+def _memory_release(store_key: str) -> None:
+    with _LOCK:
+        record = _memory_get(store_key, time.monotonic())
+        if record is not None and record.get("state") == "pending":
+            del _MEMORY_STATE[store_key]
+
+
+async def _redis_begin(redis_client: redis_async.Redis, store_key: str, fingerprint: str) -> IdempotencyOutcome:
+    pending = json.dumps({"state": "pending", "fingerprint": fingerprint})
+    claimed = await redis_client.set(store_key, pending, nx=True, ex=settings.IDEMPOTENCY_PENDING_TTL_SECONDS)
+    if claimed:
+        return IdempotencyOutcome(state="claimed")
+    raw = await redis_client.get(store_key)
+    if raw is None:
+        # Expired between SET NX and GET; claim again (one more round trip, rare).
+        claimed = await redis_client.set(store_key, pending, nx=True, ex=settings.IDEMPOTENCY_PENDING_TTL_SECONDS)
+        return IdempotencyOutcome(state="claimed" if claimed else "in_progress")
+    return _outcome_for_record(json.loads(raw), fingerprint)
+
+
+async def begin_idempotent_request(
+    request: Request,
+    *,
+    principal: str,
+    key: str,
+    fingerprint: str,
+) -> IdempotencyOutcome:
+    """
+    Claim `key` for `principal` (API key id or legacy marker), or report replay / conflict / in-progress.
+    Callers that get `claimed` must call complete_idempotent_request or release_idempotent_request.
+    """
+    store_key = _store_key(principal, key)
+    redis_client = getattr(request.app.state, "redis", None)
+    if redis_client is not None:
+        try:
+            return await _redis_begin(redis_client, store_key, fingerprint)
+        except Exception:
+            log.warning("idempotency_redis_fallback", op="begin", exc_info=True)
+    return _memory_begin(store_key, fingerprint)
+
+
+async def complete_idempotent_request(
+    request: Request,
+    *,
+    principal: str,
+    key: str,
+    fingerprint: str,
+    status_code: int,
+    body: Any,
+) -> None:
+    """Store the final JSON response so retries within IDEMPOTENCY_TTL_SECONDS replay it."""
+    store_key = _store_key(principal, key)
+    record = {"state": "done", "fingerprint": fingerprint, "status_code": status_code, "body": body}
+    redis_client = getattr(request.app.state, "redis", None)
+    if redis_client is not None:
+        try:
+            await redis_client.set(store_key, json.dumps(record, default=str), ex=settings.IDEMPOTENCY_TTL_SECONDS)
+            return
+        except Exception:
+            log.warning("idempotency_redis_fallback", op="complete", exc_info=True)
+    _memory_complete(store_key, record)
+
+
+async def release_idempotent_request(request: Request, *, principal: str, key: str) -> None:
+    """Drop a pending claim after a failure so the client can retry (errors are never replayed)."""
+    store_key = _store_key(principal, key)
+    redis_client = getattr(request.app.state, "redis", None)
+    if redis_client is not None:
+        try:
+            await redis_client.delete(store_key)
+            return
+        except Exception:
+            log.warning("idempotency_redis_fallback", op="release", exc_info=True)
+    _memory_release(store_key)
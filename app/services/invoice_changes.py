@@ -0,0 +1,116 @@
+"""
+Invoice change feed (GET /invoices/changes): rows after a monotonic cursor, with long-polling.
+
+The cursor is invoices.change_seq (migration 20261019120000_invoice_change_seq.sql), a sequence
+value assigned on insert. Reads go through the invoice_changes() SQL function (security invoker, so
+RLS scopes rows exactly like GET /invoices) which only returns rows older than
+CHANGE_FEED_SETTLE_SECONDS: a sequence value is taken before its transaction commits, so a fresh row
+with a lower change_seq could otherwise become visible after a reader has already moved past it.
+
+Long-polling: a request with nothing new waits on InvoiceChangeNotifier instead of re-querying. A
+save announces itself with notify(): over Redis pub/sub (CHANGE_FEED_CHANNEL, fanned out to every
+worker by run_invoice_change_listener) when REDIS_URL is set, otherwise to waiters in this process.
+Waiters also re-check every CHANGE_FEED_RECHECK_SECONDS, so inserts the notifier cannot see (other
+replicas without Redis, rows written outside the app) still arrive, just later.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+
+import redis.asyncio as redis_async
+import structlog
+from supabase import Client
+
+from app.config import settings
+
+logger = structlog.get_logger(__name__)
+
+
+def list_invoice_changes(*, client: Client, after: int, limit: int) -> list[dict[str, Any]]:
+    """Up to `limit` settled rows with change_seq > after, oldest first."""
+    resp = client.rpc(
+        "invoice_changes",
+        {"after_seq": after, "max_rows": limit, "settle_seconds": settings.CHANGE_FEED_SETTLE_SECONDS},
+    ).execute()
+    return resp.data or []
+
+
+class InvoiceChangeNotifier:
+    """Wakes long-polling change-feed requests in this process when an invoice is created."""
+
+    def __init__(self) -> None:
+        self._event: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.waiters = 0
+
+    def _current(self) -> asyncio.Event:
+        loop = asyncio.get_running_loop()
+        if self._event is None or self._loop is not loop:
+            self._event, self._loop = asyncio.Event(), loop
+        return self._event
+
+    def wake(self) -> None:
+        """Release every current waiter; later waiters wait for the next change."""
+        if self._event is not None:
+            self._event.set()
+            self._event = None
+
+    async def wait(self, timeout: float) -> bool:
+        """True when woken by a change, False on timeout."""
+        event = self._current()
+        self.waiters += 1
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiters -= 1
+
+    def notify(self, redis_client: redis_async.Redis | None) -> None:
+        """An invoice was created: tell every worker (Redis) or this one (no Redis)."""
+        if redis_client is None:
+            self.wake()
+            return
+        task = asyncio.get_running_loop().create_task(self._publish(redis_client))
+        _pending.add(task)
+        task.add_done_callback(_pending.discard)
+
+    async def _publish(self, redis_client: redis_async.Redis) -> None:
+        try:
+            await redis_client.publish(settings.CHANGE_FEED_CHANNEL, "created")
+        except Exception as exc:
+            logger.warning("invoice_change_publish_failed", error=str(exc))
+            self.wake()
+
+
+_pending: set[asyncio.Task] = set()
+invoice_change_notifier = InvoiceChangeNotifier()
+
+
+async def run_invoice_change_listener(redis_client: redis_async.Redis) -> None:
+    """Lifespan task: wake this worker's change-feed waiters on every CHANGE_FEED_CHANNEL message."""
+    backoff = 1.0
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(settings.CHANGE_FEED_CHANNEL)
+            backoff = 1.0
+            # Anything published while disconnected: let waiters re-check.
+            invoice_change_notifier.wake()
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    invoice_change_notifier.wake()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("invoice_change_listener_error", error=str(exc), retry_in_s=backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
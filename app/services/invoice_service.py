@@ -7,6 +7,7 @@ from typing import Any, Literal, TypedDict
 from supabase import Client
 
 from app.config import settings
+from app.metrics import record_save_outcome, time_stage
 
 ALLOWED_INVOICE_ROW_KEYS = frozenset(
     {
@@ -67,6 +68,31 @@ def _find_by_content_hash(client: Client, *, user_id: str | None, h: str) -> dic
     return None
 
 
+_HASH_LOOKUP_CHUNK = 100
+
+
+def find_invoices_by_content_hash(client: Client, *, user_id: str | None, hashes: list[str]) -> dict[str, dict[str, Any]]:
+    """
+    source_content_hash -> {id, created_at} for the hashes already saved in this dedupe scope (the
+    user's rows, or user_id IS NULL for machine / legacy saves), served by the unique hash indexes.
+    """
+    found: dict[str, dict[str, Any]] = {}
+    unique = list(dict.fromkeys(hashes))
+    for i in range(0, len(unique), _HASH_LOOKUP_CHUNK):
+        q = (
+            client.table("invoices")
+            .select("id,created_at,source_content_hash")
+            .in_("source_content_hash", unique[i : i + _HASH_LOOKUP_CHUNK])
+        )
+        if user_id:
+            q = q.eq("user_id", user_id)
+        else:
+            q = q.is_("user_id", "null")
+        for row in q.execute().data or []:
+            found[row["source_content_hash"]] = {"id": str(row["id"]), "created_at": row.get("created_at")}
+    return found
+
+
 def _find_by_invoice_ref(client: Client, *, user_id: str | None, ref: str) -> dict[str, Any] | None:
     if not user_id or not ref:
         return None
@@ -130,14 +156,20 @@ def save_invoice(
         row["idempotency_key"] = idempotency_key.strip()[:256]
 
     existing = None
-    if row.get("idempotency_key"):
-        existing = _find_by_idempotency_key(client, user_id=user_id, key=row["idempotency_key"])
-    if not existing and row.get("source_content_hash"):
-        existing = _find_by_content_hash(client, user_id=user_id, h=row["source_content_hash"])
-    if not existing and row.get("invoice_ref") and user_id:
-        existing = _find_by_invoice_ref(client, user_id=user_id, ref=row["invoice_ref"])
+    matched_by = "created"
+    with time_stage("dedupe_lookup"):
+        if row.get("idempotency_key"):
+            existing = _find_by_idempotency_key(client, user_id=user_id, key=row["idempotency_key"])
+            matched_by = "idempotency_key"
+        if not existing and row.get("source_content_hash"):
+            existing = _find_by_content_hash(client, user_id=user_id, h=row["source_content_hash"])
+            matched_by = "content_hash"
+        if not existing and row.get("invoice_ref") and user_id:
+            existing = _find_by_invoice_ref(client, user_id=user_id, ref=row["invoice_ref"])
+            matched_by = "invoice_ref"
 
     if existing:
+        record_save_outcome(matched_by)
         return {
             "status": "duplicate",
             "id": str(existing["id"]),
@@ -148,7 +180,8 @@ def save_invoice(
     try:
         # postgrest-py 0.16+: insert() returns SyncQueryRequestBuilder (no .select() chain).
         # Default returning=representation still returns the inserted row in the response.
-        ins = client.table("invoices").insert(insert_payload).execute()
+        with time_stage("insert"):
+            ins = client.table("invoices").insert(insert_payload).execute()
     except Exception as exc:
         msg = str(exc).lower()
         if "duplicate" in msg or "unique" in msg or "23505" in msg:
@@ -159,6 +192,7 @@ def save_invoice(
             if not existing and row.get("idempotency_key"):
                 existing = _find_by_idempotency_key(client, user_id=user_id, key=row["idempotency_key"])
             if existing:
+                record_save_outcome("insert_conflict")
                 return {
                     "status": "duplicate",
                     "id": str(existing["id"]),
@@ -166,6 +200,7 @@ def save_invoice(
                 }
         raise
 
+    record_save_outcome("created")
     created = (ins.data or [None])[0]
     if not created or not isinstance(created, dict):
         return {
@@ -207,3 +242,51 @@ def list_invoices(
     items = resp.data or []
     total = resp.count if getattr(resp, "count", None) is not None else len(items)
     return {"items": items, "total": int(total), "limit": limit, "offset": offset}
+
+
+class InvoiceDataVersion(TypedDict):
+    latest_created_at: str | None
+    count: int
+
+
+def get_invoice_data_version(*, client: Client) -> InvoiceDataVersion:
+    """
+    Newest created_at and row count visible to this client (RLS applies): changes whenever a row
+    is inserted or deleted, without fetching a page. Used to answer If-None-Match / If-Modified-Since
+    before listing; a request without them takes the version from its listing instead
+    (invoice_data_version_from_page), so it pays for one exact count, not two.
+    """
+    resp = (
+        client.table("invoices")
+        .select("created_at", count="exact")
+        .order("created_at", desc=True)
+        .limit(1)
+        .execute()
+    )
+    rows = resp.data or []
+    latest = rows[0].get("created_at") if rows else None
+    count = resp.count if getattr(resp, "count", None) is not None else len(rows)
+    return {"latest_created_at": str(latest) if latest else None, "count": int(count)}
+
+
+def get_latest_invoice_created_at(*, client: Client) -> str | None:
+    """Newest created_at visible to this client: one LIMIT 1 read on the created_at order, no count."""
+    resp = client.table("invoices").select("created_at").order("created_at", desc=True).limit(1).execute()
+    rows = resp.data or []
+    latest = rows[0].get("created_at") if rows else None
+    return str(latest) if latest else None
+
+
+def invoice_data_version_from_page(page: ListInvoicesPage, *, client: Client) -> InvoiceDataVersion:
+    """
+    The version get_invoice_data_version() reports, taken from a page just listed: the count is the
+    listing's own exact count and page one already starts with the newest row; later pages add a
+    get_latest_invoice_created_at() lookup.
+    """
+    if page["offset"] == 0 or not page["total"]:
+        items = page["items"]
+        latest = items[0].get("created_at") if items else None
+        latest = str(latest) if latest else None
+    else:
+        latest = get_latest_invoice_created_at(client=client)
+    return {"latest_created_at": latest, "count": int(page["total"])}
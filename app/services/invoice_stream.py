@@ -0,0 +1,134 @@
+"""
+Streamed invoice pages for GET /invoices with Accept: application/x-ndjson.
+
+supabase-py buffers the whole PostgREST response and decodes it into one list before the route sees
+a row. Here the same query goes to PostgREST over the shared httpx client (app.http_client) as a
+streamed response, and rows are decoded incrementally from the JSON array as network chunks arrive,
+so memory holds one chunk plus at most one partial row regardless of page size. The total comes from
+PostgREST's Content-Range (Prefer: count=exact), which arrives with the response headers.
+"""
+
+from __future__ import annotations
+
+import codecs
+import json
+from collections.abc import AsyncIterator
+from typing import Any
+
+import httpx
+
+from app.config import settings
+from app.http_client import get_http_client
+
+_WHITESPACE = " \t\r\n"
+
+
+class InvoiceStreamError(RuntimeError):
+    """PostgREST refused the query or the stream broke off."""
+
+
+class JsonArrayRows:
+    """Incremental decoder for one top-level JSON array: feed() bytes, get the elements completed so far."""
+
+    def __init__(self) -> None:
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._started = False
+        self._expect_value = True
+        self.done = False
+
+    def feed(self, chunk: bytes, *, final: bool = False) -> list[Any]:
+        self._buf += self._utf8.decode(chunk, final)
+        buf, pos, items = self._buf, 0, []
+        while not self.done:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos >= len(buf):
+                break
+            char = buf[pos]
+            if not self._started:
+                if char != "[":
+                    raise InvoiceStreamError("expected a JSON array from PostgREST")
+                self._started = True
+                pos += 1
+            elif char == "]":
+                self.done = True
+                pos += 1
+            elif not self._expect_value:
+                if char != ",":
+                    raise InvoiceStreamError(f"unexpected {char!r} between rows")
+                self._expect_value = True
+                pos += 1
+            else:
+                try:
+                    item, pos = self._decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    break  # row not complete yet; wait for the next chunk
+                items.append(item)
+                self._expect_value = False
+        self._buf = buf[pos:]
+        if final and not self.done:
+            raise InvoiceStreamError("PostgREST response ended mid-array")
+        return items
+
+
+def _total_from_content_range(value: str | None) -> int | None:
+    # "0-199/5321", "*/0"; "*" total when the count was not requested.
+    if not value or "/" not in value:
+        return None
+    total = value.rsplit("/", 1)[1]
+    return int(total) if total.isdigit() else None
+
+
+class InvoiceRowStream:
+    """An open PostgREST response: total known up front, rows decoded as they arrive. Always aclose()."""
+
+    def __init__(self, response: httpx.Response) -> None:
+        self._response = response
+        self.total = _total_from_content_range(response.headers.get("content-range"))
+
+    async def batches(self) -> AsyncIterator[list[dict[str, Any]]]:
+        """Rows completed by each network chunk (one list per chunk, possibly empty lists skipped)."""
+        decoder = JsonArrayRows()
+        try:
+            async for chunk in self._response.aiter_bytes():
+                rows = decoder.feed(chunk)
+                if rows:
+                    yield rows
+            rows = decoder.feed(b"", final=True)
+        except httpx.HTTPError as exc:
+            raise InvoiceStreamError(f"PostgREST stream failed: {exc}") from exc
+        if rows:
+            yield rows
+
+    async def aclose(self) -> None:
+        await self._response.aclose()
+
+
+async def open_invoice_row_stream(*, api_key: str, limit: int, offset: int) -> InvoiceRowStream:
+    """
+    Start the newest-first page query (same order as list_invoices) and return once PostgREST has
+    answered with headers, so the route can still fail with a proper status before streaming.
+    """
+    client = get_http_client()
+    request = client.build_request(
+        "GET",
+        f"{settings.SUPABASE_URL.rstrip('/')}/rest/v1/invoices",
+        params={"select": "*", "order": "created_at.desc", "offset": str(offset), "limit": str(limit)},
+        headers={
+            "apikey": api_key,
+            "Authorization": f"Bearer {api_key}",
+            "Accept": "application/json",
+            "Prefer": "count=exact",
+        },
+    )
+    try:
+        response = await client.send(request, stream=True)
+    except httpx.HTTPError as exc:
+        raise InvoiceStreamError(f"PostgREST request failed: {exc}") from exc
+    if response.status_code >= 400:
+        detail = (await response.aread())[:200]
+        await response.aclose()
+        raise InvoiceStreamError(f"PostgREST returned {response.status_code}: {detail!r}")
+    return InvoiceRowStream(response)
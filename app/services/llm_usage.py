@@ -0,0 +1,114 @@
+"""
+Per-caller LLM token usage: summed in memory per (principal, deployment) and appended to
+public.llm_token_usage by a background task every LLM_USAGE_FLUSH_SECONDS (one row per caller per window).
+
+The principal is a contextvar set where the caller is known: require_machine_scopes ("key:<id>" /
+"legacy") and the UI routes ("user:<uuid>" / "web"). Anything else is recorded as "unknown".
+"""
+
+from __future__ import annotations
+
+import asyncio
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from threading import Lock
+
+import structlog
+from supabase import Client
+
+from app.config import settings
+from app.db import create_service_role_client
+
+logger = structlog.get_logger(__name__)
+
+_principal: ContextVar[str] = ContextVar("llm_principal", default="unknown")
+
+
+def set_llm_principal(principal: str) -> None:
+    _principal.set(principal)
+
+
+def current_llm_principal() -> str:
+    return _principal.get()
+
+
+class LlmUsageRecorder:
+    """Thread-safe accumulator (parsers may run off the event loop) + periodic bulk insert."""
+
+    def __init__(self, *, flush_interval_s: float, max_principals: int) -> None:
+        self.flush_interval_s = flush_interval_s
+        self.max_principals = max_principals
+        self._lock = Lock()
+        self._usage: dict[tuple[str, str], list[int]] = {}
+        self._window_start = datetime.now(timezone.utc)
+        self._service: Client | None = None
+
+    def add(self, *, deployment: str, prompt_tokens: int, completion_tokens: int, principal: str | None = None) -> None:
+        key = (principal or current_llm_principal(), deployment)
+        with self._lock:
+            totals = self._usage.get(key)
+            if totals is None:
+                if len(self._usage) >= self.max_principals:
+                    key = ("overflow", deployment)
+                    totals = self._usage.setdefault(key, [0, 0, 0])
+                else:
+                    totals = self._usage[key] = [0, 0, 0]
+            totals[0] += 1
+            totals[1] += prompt_tokens
+            totals[2] += completion_tokens
+
+    def drain(self) -> list[dict]:
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            usage, self._usage = self._usage, {}
+            start, self._window_start = self._window_start, now
+        return [
+            {
+                "principal": principal,
+                "deployment": deployment,
+                "requests": requests,
+                "prompt_tokens": prompt,
+                "completion_tokens": completion,
+                "window_start": start.isoformat(),
+                "window_end": now.isoformat(),
+            }
+            for (principal, deployment), (requests, prompt, completion) in usage.items()
+        ]
+
+    def _client(self) -> Client:
+        if self._service is None:
+            self._service = create_service_role_client()
+        return self._service
+
+    def _write(self, rows: list[dict]) -> None:
+        try:
+            self._client().table("llm_token_usage").insert(rows).execute()
+        except Exception as exc:
+            # Dropped rather than re-queued: usage is for capacity planning, Prometheus keeps the totals.
+            logger.warning("llm_token_usage_insert_failed", rows=len(rows), error=str(exc))
+
+    async def flush(self) -> None:
+        rows = self.drain()
+        if rows:
+            await asyncio.to_thread(self._write, rows)
+
+    async def run(self) -> None:
+        """Lifespan task."""
+        while True:
+            await asyncio.sleep(self.flush_interval_s)
+            try:
+                await self.flush()
+            except Exception as exc:
+                logger.warning("llm_token_usage_flush_failed", error=str(exc))
+
+    async def aclose(self) -> None:
+        try:
+            await self.flush()
+        except Exception as exc:
+            logger.warning("llm_token_usage_flush_failed", error=str(exc))
+
+
+llm_usage = LlmUsageRecorder(
+    flush_interval_s=settings.LLM_USAGE_FLUSH_SECONDS,
+    max_principals=settings.LLM_USAGE_MAX_PRINCIPALS,
+)
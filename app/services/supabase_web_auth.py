@@ -1,8 +1,7 @@
 from typing import Any
 
-import httpx
-
 from app.config import settings
+from app.http_client import get_http_client
 
 
 async def sign_in_with_email_password(email: str, password: str) -> dict[str, Any] | None:
@@ -16,14 +15,12 @@ async def sign_in_with_email_password(email: str, password: str) -> dict[str, An
         "apikey": settings.SUPABASE_ANON_KEY,
         "Content-Type": "application/json",
     }
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            url,
-            params={"grant_type": "password"},
-            headers=headers,
-            json={"email": email.strip(), "password": password},
-            timeout=20.0,
-        )
+    response = await get_http_client().post(
+        url,
+        params={"grant_type": "password"},
+        headers=headers,
+        json={"email": email.strip(), "password": password},
+    )
     if response.status_code != 200:
         return None
     return response.json()
@@ -39,5 +36,34 @@ async def sign_out_with_access_token(access_token: str) -> None:
         "apikey": settings.SUPABASE_ANON_KEY,
         "Authorization": f"Bearer {access_token}",
     }
-    async with httpx.AsyncClient() as client:
-        await client.post(url, headers=headers, timeout=15.0)
+    await get_http_client().post(url, headers=headers)
+
+
+async def refresh_session(refresh_token: str) -> dict[str, Any] | None:
+    """
+    Exchange a refresh token for a new access/refresh pair (Supabase rotates refresh tokens: the old one
+    stops working after its reuse interval). Returns the token payload, or None when the session is dead.
+    """
+    base = settings.SUPABASE_URL.rstrip("/")
+    url = f"{base}/auth/v1/token"
+    headers = {
+        "apikey": settings.SUPABASE_ANON_KEY,
+        "Content-Type": "application/json",
+    }
+    response = await get_http_client().post(
+        url,
+        params={"grant_type": "refresh_token"},
+        headers=headers,
+        json={"refresh_token": refresh_token},
+    )
+    if response.status_code != 200:
+        return None
+    return response.json()
+
+
+async def fetch_jwks() -> dict[str, Any]:
+    """Supabase Auth's public signing keys (asymmetric JWT signing keys)."""
+    url = settings.SUPABASE_JWKS_URL or f"{settings.SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json"
+    response = await get_http_client().get(url, headers={"apikey": settings.SUPABASE_ANON_KEY})
+    response.raise_for_status()
+    return response.json()
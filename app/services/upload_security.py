@@ -1,16 +1,27 @@
 from __future__ import annotations
 
+import hashlib
 import os
 import secrets
 import shlex
 import subprocess
 import tempfile
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
 from pathlib import PurePath
 
 from fastapi import UploadFile
 
 OLE_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
 ALLOWED_EXTENSIONS = frozenset({"txt", "eml", "msg", "pdf"})
+# sniff_content_kind never looks past this many leading bytes.
+SNIFF_HEAD_BYTES = 16384
+RAW_BODY_CONTENT_TYPES = {
+    "application/pdf": "pdf",
+    "message/rfc822": "eml",
+    "application/vnd.ms-outlook": "msg",
+    "text/plain": "txt",
+}
 
 
 def extension_from_upload_filename(filename: str | None) -> tuple[str | None, str | None]:
@@ -47,7 +58,7 @@ def sniff_content_kind(data: bytes) -> str:
         return "pdf"
     if len(data) >= len(OLE_MAGIC) and data[: len(OLE_MAGIC)] == OLE_MAGIC:
         return "msg"
-    head = data[: 16384]
+    head = data[:SNIFF_HEAD_BYTES]
     lowered = head.lower()
     if b"mime-version:" in lowered or head.lstrip().startswith(b"From "):
         return "eml"
@@ -105,6 +116,62 @@ async def read_upload_with_size_limit(file: UploadFile, max_bytes: int) -> tuple
     return b"".join(chunks), None
 
 
+def extension_from_content_type(content_type: str | None) -> tuple[str | None, str | None]:
+    """
+    Declared extension for a raw-body upload from its Content-Type (parameters such as charset ignored).
+    Returns (ext, None) or (None, "unsupported").
+    """
+    media_type = (content_type or "").split(";", 1)[0].strip().lower()
+    ext = RAW_BODY_CONTENT_TYPES.get(media_type)
+    return (ext, None) if ext else (None, "unsupported")
+
+
+@dataclass(frozen=True)
+class StreamedUpload:
+    content: bytes
+    sha256: str
+    ext: str
+
+
+async def read_stream_with_size_limit(
+    chunks: AsyncIterator[bytes],
+    max_bytes: int,
+    *,
+    declared_ext: str,
+) -> tuple[StreamedUpload | None, str | None]:
+    """
+    Consume a raw request body with a hard size cap, hashing it as chunks arrive and sniffing/reconciling
+    the kind as soon as SNIFF_HEAD_BYTES are in, so an oversized or mislabeled body is rejected without
+    reading the rest. Returns (upload, None) or (None, error_code).
+    """
+    parts: list[bytes] = []
+    digest = hashlib.sha256()
+    total = 0
+    canonical_ext: str | None = None
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        total += len(chunk)
+        if total > max_bytes:
+            return None, "file_too_large"
+        digest.update(chunk)
+        parts.append(chunk)
+        if canonical_ext is None and total >= SNIFF_HEAD_BYTES:
+            head = b"".join(parts)
+            parts = [head]
+            canonical_ext, kind_error = reconcile_extension(declared_ext=declared_ext, sniffed=sniff_content_kind(head))
+            if kind_error:
+                return None, kind_error
+    if total == 0:
+        return None, "empty_file"
+    content = b"".join(parts)
+    if canonical_ext is None:
+        canonical_ext, kind_error = reconcile_extension(declared_ext=declared_ext, sniffed=sniff_content_kind(content))
+        if kind_error:
+            return None, kind_error
+    return StreamedUpload(content=content, sha256=digest.hexdigest(), ext=canonical_ext), None
+
+
 def build_safe_temp_path(ext: str) -> str:
     """
     Random name under the system temp dir (never uses client-supplied path segments).
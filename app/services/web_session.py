@@ -0,0 +1,185 @@
+"""
+Dashboard sessions under WEB_AUTH_PROVIDER=supabase: the access token in the session cookie is
+verified locally on each dashboard request (HS256 with SUPABASE_JWT_SECRET, or the project's JWKS,
+cached in memory) and refreshed with the refresh token once it is within
+SESSION_TOKEN_REFRESH_MARGIN_SECONDS of expiry, updating the session in place. A session that can
+no longer be refreshed is cleared and the request is turned away before any upload, parse or LLM work.
+
+Refreshes are single-flight per refresh token: concurrent requests from one browser share one call
+to Supabase Auth, and the result is remembered briefly so a request still carrying the old cookie
+gets the rotated tokens instead of spending an already-used refresh token.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any
+
+import jwt
+import structlog
+from starlette.requests import Request
+
+from app.config import settings
+from app.metrics import record_web_session_check
+from app.services.supabase_web_auth import fetch_jwks, refresh_session
+from app.session_store import load_session
+
+logger = structlog.get_logger(__name__)
+
+_JWKS_MIN_REFETCH_SECONDS = 30.0
+_RECENT_REFRESH_TTL_SECONDS = 30.0
+_RECENT_REFRESH_MAX = 1024
+_ASYMMETRIC_ALGS = frozenset({"RS256", "ES256", "EdDSA"})
+
+
+class _KeysUnavailable(Exception):
+    pass
+
+
+class JwksCache:
+    """kid -> verification key, refetched after cache_seconds or (rate-limited) on an unknown kid."""
+
+    def __init__(self, *, cache_seconds: float) -> None:
+        self.cache_seconds = cache_seconds
+        self._keys: dict[str, Any] = {}
+        self._fetched_at = 0.0
+        self._inflight: asyncio.Task | None = None
+
+    async def _refresh(self) -> None:
+        task = self._inflight
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = self._inflight = asyncio.get_running_loop().create_task(fetch_jwks())
+        try:
+            document = await asyncio.shield(task)
+        except Exception as exc:
+            raise _KeysUnavailable(str(exc)) from exc
+        keys = {}
+        for jwk in document.get("keys", ()):
+            try:
+                keys[jwk.get("kid", "")] = jwt.PyJWK(jwk).key
+            except jwt.PyJWTError:
+                continue
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+
+    async def key(self, kid: str) -> Any:
+        age = time.monotonic() - self._fetched_at
+        if age > self.cache_seconds or (kid not in self._keys and age > _JWKS_MIN_REFETCH_SECONDS):
+            await self._refresh()
+        try:
+            return self._keys[kid]
+        except KeyError:
+            raise _KeysUnavailable(f"unknown signing key {kid!r}") from None
+
+
+_jwks = JwksCache(cache_seconds=settings.SUPABASE_JWKS_CACHE_SECONDS)
+_refreshing: dict[str, asyncio.Task] = {}
+_recent_refreshes: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+
+async def _claims(token: str) -> dict[str, Any]:
+    """Verified claims (expiry checked by the caller). Raises jwt.PyJWTError or _KeysUnavailable."""
+    header = jwt.get_unverified_header(token)
+    alg = header.get("alg")
+    if alg == "HS256":
+        if not settings.SUPABASE_JWT_SECRET:
+            raise _KeysUnavailable("HS256 token but SUPABASE_JWT_SECRET is not set")
+        key: Any = settings.SUPABASE_JWT_SECRET
+    elif alg in _ASYMMETRIC_ALGS:
+        key = await _jwks.key(header.get("kid", ""))
+    else:
+        raise jwt.InvalidAlgorithmError(f"unexpected alg {alg!r}")
+    return jwt.decode(
+        token,
+        key,
+        algorithms=[alg],
+        audience="authenticated",
+        options={"verify_exp": False, "require": ["exp", "sub"]},
+    )
+
+
+def _token_key(refresh_token: str) -> str:
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+
+async def _refresh_once(refresh_token: str) -> dict | None:
+    key = _token_key(refresh_token)
+    now = time.monotonic()
+    recent = _recent_refreshes.get(key)
+    if recent is not None and recent[0] > now:
+        return recent[1]
+    task = _refreshing.get(key)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = _refreshing[key] = asyncio.get_running_loop().create_task(refresh_session(refresh_token))
+        task.add_done_callback(lambda _t: _refreshing.pop(key, None))
+    try:
+        payload = await asyncio.shield(task)
+    except Exception as exc:
+        logger.warning("web_session_refresh_error", error=str(exc))
+        return None
+    if payload and payload.get("access_token"):
+        _recent_refreshes[key] = (time.monotonic() + _RECENT_REFRESH_TTL_SECONDS, payload)
+        while len(_recent_refreshes) > _RECENT_REFRESH_MAX:
+            _recent_refreshes.popitem(last=False)
+        return payload
+    return None
+
+
+def _clear_tokens(request: Request) -> None:
+    for name in ("auth_user_id", "user_email", "supabase_access_token", "supabase_refresh_token"):
+        request.session.pop(name, None)
+
+
+async def ensure_web_session(request: Request) -> str | None:
+    """
+    None when the dashboard session may proceed (tokens refreshed in place if needed), else the
+    login error code to redirect with. Legacy provider: the session flag only.
+    """
+    await load_session(request)
+    if settings.WEB_AUTH_PROVIDER == "legacy":
+        return None if request.session.get("authenticated") else "auth_required"
+    access = request.session.get("supabase_access_token")
+    if not request.session.get("auth_user_id") or not isinstance(access, str) or not access:
+        return "auth_required"
+
+    try:
+        try:
+            claims = await _claims(access)
+            verified = True
+        except _KeysUnavailable as exc:
+            # Cannot verify here; fall back to the token's own expiry and let PostgREST enforce the signature.
+            logger.warning("web_session_keys_unavailable", error=str(exc))
+            claims = jwt.decode(access, options={"verify_signature": False})
+            verified = False
+    except jwt.PyJWTError:
+        record_web_session_check("invalid")
+        _clear_tokens(request)
+        return "session_expired"
+    if verified and claims.get("sub") != request.session.get("auth_user_id"):
+        record_web_session_check("invalid")
+        _clear_tokens(request)
+        return "session_expired"
+
+    remaining = float(claims.get("exp", 0)) - time.time()
+    if remaining > settings.SESSION_TOKEN_REFRESH_MARGIN_SECONDS:
+        record_web_session_check("valid" if verified else "unverified")
+        return None
+
+    refresh = request.session.get("supabase_refresh_token")
+    payload = await _refresh_once(refresh) if isinstance(refresh, str) and refresh else None
+    if payload is not None:
+        request.session["supabase_access_token"] = payload["access_token"]
+        request.session["supabase_refresh_token"] = payload.get("refresh_token") or refresh
+        record_web_session_check("refreshed")
+        return None
+    if remaining > settings.SESSION_TOKEN_LEEWAY_SECONDS:
+        # Still usable; the next request retries the refresh.
+        record_web_session_check("refresh_failed")
+        return None
+    record_web_session_check("expired")
+    logger.info("web_session_expired", user_id=request.session.get("auth_user_id"))
+    _clear_tokens(request)
+    return "session_expired"
@@ -0,0 +1,256 @@
+"""
+Session middlewares (SESSION_BACKEND).
+
+cookie (default): Starlette's signed cookie holding the whole session. redis: the cookie holds only
+an opaque random session id and the session lives in Redis (REDIS_URL) under
+SESSION_REDIS_KEY_PREFIX, so browsers send ~60 bytes instead of the tokens, and the per-request work
+is one GETEX instead of an HMAC over several KB.
+
+The cookie backend leaves the session alone on SESSION_STORE_SKIP_PATHS (health checks, metrics,
+machine API routes): those requests get an empty, unsaved session and no cookie signature check.
+
+The Redis backend loads on demand instead: scope["session"] is a RedisSession that stays unloaded
+until a route awaits load_session(request) (request.session is synchronous, so the store cannot be
+read on first touch), and reading it before that raises. Routes that never load it, whatever
+their path, cost no Redis round trip and leave the cookie as it is. The load is a GETEX that also slides the key's TTL to SESSION_MAX_AGE_SECONDS,
+matching the cookie's Max-Age, which is re-sent on every response like the cookie backend does. The
+session is written back only when a route changed it, and deleted (cookie expired) when a route
+cleared it. Signing in or out issues a new session id (no fixation of a pre-login id). When Redis is
+unreachable, requests see an empty session (dashboard routes redirect to login); the outage is logged
+once and counted in session_store_operations_total{outcome="error"}.
+"""
+
+from __future__ import annotations
+
+import re
+import secrets
+from collections.abc import Awaitable, Callable, Iterator, MutableMapping
+from typing import Any
+
+import orjson
+import redis.asyncio as redis_async
+import structlog
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+from app.metrics import record_session_store_operation
+from app.tracing import TracedSessionMiddleware, tracer
+
+logger = structlog.get_logger(__name__)
+
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{43}$")
+# A change in these keys is a sign-in or sign-out: the session gets a new id.
+_PRINCIPAL_KEYS = ("authenticated", "auth_user_id")
+_EXPIRED_COOKIE = "null; path=/; expires=Thu, 01 Jan 1970 00:00:00 GMT"
+
+_store_down = False
+
+
+def session_skipped(path: str) -> bool:
+    for prefix in settings.SESSION_STORE_SKIP_PATHS:
+        base = prefix.rstrip("/")
+        if path == base or path.startswith(base + "/"):
+            return True
+    return False
+
+
+def _store_failed(op: str, exc: Exception) -> None:
+    global _store_down
+    record_session_store_operation(op, "error")
+    if not _store_down:
+        _store_down = True
+        logger.warning("session_store_unavailable", op=op, error=str(exc))
+
+
+def _store_ok(op: str, outcome: str) -> None:
+    global _store_down
+    record_session_store_operation(op, outcome)
+    if _store_down:
+        _store_down = False
+        logger.info("session_store_recovered", op=op)
+
+
+class RedisSession(MutableMapping[str, Any]):
+    """scope["session"] for SESSION_BACKEND=redis: fetched from the store by load_session(), not before."""
+
+    def __init__(self, loader: Callable[[], Awaitable[dict[str, Any]]]) -> None:
+        self._loader = loader
+        self._data: dict[str, Any] | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._data is not None
+
+    async def load(self) -> None:
+        if self._data is None:
+            self._data = await self._loader()
+
+    def _session(self) -> dict[str, Any]:
+        if self._data is None:
+            raise RuntimeError("Session not loaded: await load_session(request) before using request.session")
+        return self._data
+
+    def __getitem__(self, key: str) -> Any:
+        return self._session()[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._session()[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self._session()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._session())
+
+    def __len__(self) -> int:
+        return len(self._session())
+
+
+async def load_session(request: HTTPConnection) -> None:
+    """Make request.session usable: fetches it from Redis on that backend (once), no-op for cookies."""
+    session = request.scope.get("session")
+    if isinstance(session, RedisSession):
+        await session.load()
+
+
+class CookieSessionMiddleware(TracedSessionMiddleware):
+    """Signed-cookie sessions, bypassed on SESSION_STORE_SKIP_PATHS."""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] in ("http", "websocket") and session_skipped(scope["path"]):
+            scope["session"] = {}
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+class RedisSessionMiddleware:
+    """Opaque session id cookie; session dict stored as JSON in Redis."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        max_age: int,
+        same_site: str = "lax",
+        https_only: bool = False,
+        key_prefix: str = "session:v1",
+        session_cookie: str = "session",
+        redis: redis_async.Redis | None = None,
+    ) -> None:
+        self.app = app
+        self.max_age = max_age
+        self.key_prefix = key_prefix
+        self.session_cookie = session_cookie
+        self._redis = redis
+        self.security_flags = "httponly; samesite=" + same_site
+        if https_only:
+            self.security_flags += "; secure"
+
+    def _client(self, scope: Scope) -> redis_async.Redis | None:
+        if self._redis is not None:
+            return self._redis
+        app = scope.get("app")
+        return getattr(getattr(app, "state", None), "redis", None)
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.key_prefix}:{session_id}"
+
+    async def _load(self, client: redis_async.Redis | None, session_id: str) -> tuple[bool, str | bytes | None]:
+        """(reached the store, stored JSON or None)."""
+        if client is None:
+            _store_failed("load", RuntimeError("Redis client not initialised"))
+            return False, None
+        with tracer.start_as_current_span("session.load"):
+            try:
+                raw = await client.getex(self._key(session_id), ex=self.max_age)
+            except Exception as exc:
+                _store_failed("load", exc)
+                return False, None
+        _store_ok("load", "hit" if raw is not None else "miss")
+        return True, raw
+
+    async def _save(self, client: redis_async.Redis | None, session_id: str, payload: bytes) -> bool:
+        if client is None:
+            _store_failed("save", RuntimeError("Redis client not initialised"))
+            return False
+        try:
+            await client.set(self._key(session_id), payload, ex=self.max_age)
+        except Exception as exc:
+            _store_failed("save", exc)
+            return False
+        _store_ok("save", "ok")
+        return True
+
+    async def _delete(self, client: redis_async.Redis | None, session_id: str) -> None:
+        if client is None:
+            return
+        try:
+            await client.delete(self._key(session_id))
+        except Exception as exc:
+            _store_failed("delete", exc)
+            return
+        _store_ok("delete", "ok")
+
+    def _cookie(self, value: str, *, expire: bool = False) -> str:
+        if expire:
+            return f"{self.session_cookie}={_EXPIRED_COOKIE}; {self.security_flags}"
+        return f"{self.session_cookie}={value}; path=/; Max-Age={self.max_age}; {self.security_flags}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        client = self._client(scope)
+        cookie = HTTPConnection(scope).cookies.get(self.session_cookie)
+        session_id = cookie if cookie and _SESSION_ID_RE.match(cookie) else None
+        reached = True
+        loaded: dict[str, Any] = {}
+        principal: tuple[Any, ...] = ()
+
+        async def load() -> dict[str, Any]:
+            nonlocal session_id, reached, loaded, principal
+            raw = None
+            if session_id:
+                reached, raw = await self._load(client, session_id)
+            if raw is not None:
+                try:
+                    loaded = orjson.loads(raw)
+                except orjson.JSONDecodeError:
+                    loaded = {}
+            if not isinstance(loaded, dict) or not loaded:
+                loaded, session_id = {}, None
+            principal = tuple(loaded.get(k) for k in _PRINCIPAL_KEYS)
+            return dict(loaded)
+
+        session = RedisSession(load)
+        scope["session"] = session
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal session_id
+            if message["type"] == "http.response.start" and session.loaded:
+                headers = MutableHeaders(scope=message)
+                if session:
+                    payload = orjson.dumps(dict(session))
+                    if session_id is not None and tuple(session.get(k) for k in _PRINCIPAL_KEYS) != principal:
+                        await self._delete(client, session_id)
+                        session_id = None
+                    if session_id is None:
+                        new_id = secrets.token_urlsafe(32)
+                        if await self._save(client, new_id, payload):
+                            session_id = new_id
+                    elif dict(session) != loaded:
+                        await self._save(client, session_id, payload)
+                    if session_id is not None:
+                        headers.append("Set-Cookie", self._cookie(session_id))
+                elif cookie and reached:
+                    # Keep the cookie through a store outage so the session survives it.
+                    if session_id is not None:
+                        await self._delete(client, session_id)
+                    headers.append("Set-Cookie", self._cookie("", expire=True))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,119 @@
+"""
+OpenTelemetry tracing (off unless TRACING_ENABLED=true).
+
+Spans: one server span per HTTP request (ObservabilityMiddleware, continues an incoming W3C
+traceparent), session.decode, rate_limit.check, every time_stage() block (invoice.read, invoice.av_scan,
+invoice.parse, invoice.llm, ...), the Azure OpenAI call, and one client span per outbound httpx request
+(PostgREST queries, Supabase Auth, Azure OpenAI retries) with traceparent injected into its headers.
+
+Exporters: otlp (OTLP/HTTP; TRACING_OTLP_ENDPOINT or the standard OTEL_EXPORTER_OTLP_* env vars),
+console (stdout) or file (one JSON span per line in TRACING_FILE_PATH, for offline inspection).
+While disabled, the OpenTelemetry API hands out no-op spans, so the call sites cost next to nothing.
+"""
+
+from __future__ import annotations
+
+import sys
+from typing import Any
+
+import httpx
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import Span
+from starlette.middleware.sessions import SessionMiddleware
+
+# app.metrics imports this module, so settings are read lazily (metrics must import without app env).
+tracer = trace.get_tracer("app")
+
+_provider: TracerProvider | None = None
+
+
+def _build_exporter() -> SpanExporter:
+    from app.config import settings
+
+    if settings.TRACING_EXPORTER == "console":
+        return ConsoleSpanExporter(out=sys.stdout)
+    if settings.TRACING_EXPORTER == "file":
+        return ConsoleSpanExporter(
+            out=open(settings.TRACING_FILE_PATH, "a", encoding="utf-8"),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+    return OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT)
+
+
+def _httpx_request_hook(span: Span, request: Any) -> None:
+    """Name client spans "POST /rest/v1/invoices" and keep PostgREST filters (vendor, invoice numbers) out of attributes."""
+    if not span.is_recording():
+        return
+    url = httpx.URL(request.url)
+    method = request.method.decode() if isinstance(request.method, bytes) else str(request.method)
+    span.update_name(f"{method} {url.path}")
+    attributes = getattr(span, "attributes", None) or {}
+    for key in ("http.url", "url.full"):
+        if key in attributes:
+            span.set_attribute(key, str(url.copy_with(query=None)))
+
+
+def configure_tracing(exporter: SpanExporter | None = None) -> None:
+    """Install the global tracer provider and httpx instrumentation once; `exporter` overrides the configured one (tests)."""
+    global _provider
+    from app.config import settings
+
+    if _provider is not None or not (settings.TRACING_ENABLED or exporter is not None):
+        return
+    from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+
+    _provider = TracerProvider(
+        resource=Resource.create({"service.name": settings.TRACING_SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATIO)),
+    )
+    _provider.add_span_processor(BatchSpanProcessor(exporter or _build_exporter()))
+    trace.set_tracer_provider(_provider)
+    HTTPXClientInstrumentor().instrument(request_hook=_httpx_request_hook)
+
+
+def shutdown_tracing() -> None:
+    """Flush queued spans (lifespan shutdown)."""
+    if _provider is not None:
+        _provider.force_flush()
+
+
+def current_trace_id() -> str | None:
+    ctx = trace.get_current_span().get_span_context()
+    return format(ctx.trace_id, "032x") if ctx.is_valid else None
+
+
+def trace_exemplar() -> dict[str, str] | None:
+    """
+    Exemplar labels for a histogram observation inside a sampled span. Exported only on OpenMetrics
+    scrapes, and dropped by prometheus_client in multiprocess mode.
+    """
+    ctx = trace.get_current_span().get_span_context()
+    if not (ctx.is_valid and ctx.trace_flags.sampled):
+        return None
+    return {"trace_id": format(ctx.trace_id, "032x"), "span_id": format(ctx.span_id, "016x")}
+
+
+class _TracedSigner:
+    def __init__(self, signer: Any) -> None:
+        self._signer = signer
+
+    def unsign(self, value: bytes, max_age: int | None = None) -> bytes:
+        with tracer.start_as_current_span("session.decode"):
+            return self._signer.unsign(value, max_age=max_age)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._signer, name)
+
+
+class TracedSessionMiddleware(SessionMiddleware):
+    """Starlette SessionMiddleware with the session cookie's signature check in a session.decode span."""
+
+    def __init__(self, app: Any, **kwargs: Any) -> None:
+        super().__init__(app, **kwargs)
+        self.signer = _TracedSigner(self.signer)
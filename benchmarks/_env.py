@@ -0,0 +1,36 @@
+"""
+Offline settings for benchmark scripts (same shape as tests/conftest.py); import before any `app.*` module.
+Real values already present in the environment win.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+
+_ROOT = Path(__file__).resolve().parents[1]
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+os.chdir(_ROOT)
+
+_ANON_JWT = (
+    "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9."
+    "eyJpc3MiOiJzdXBhYmFzZS1kZW1vIiwicm9sZSI6ImFub24iLCJleHAiOjE5ODM4MTI5OTZ9."
+    "CRXP1A7WOeoJeXxjNni43kdQwgnWNReilDMblYTn_I0"
+)
+
+for _key, _val in {
+    "SESSION_SECRET": "0" * 40,
+    "APP_PASSWORD": "bench-app-password",
+    "SUPABASE_URL": "https://benchproject.supabase.co",
+    "SUPABASE_ANON_KEY": _ANON_JWT,
+    "AUTH_PASSWORD": "bench-login-password",
+    "AZURE_OPENAI_ENDPOINT": "https://bench.openai.azure.com",
+    "AZURE_OPENAI_API_KEY": "bench-azure-key",
+    "AZURE_OPENAI_DEPLOYMENT": "gpt-4o-mini",
+    "REDIS_URL": "",
+    "OBSERVABILITY_ACCESS_LOG": "false",
+    "LOG_LEVEL": "WARNING",
+}.items():
+    os.environ.setdefault(_key, _val)
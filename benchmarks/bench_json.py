@@ -0,0 +1,83 @@
+"""
+Serialization time and bytes on the wire for one GET /invoices page of 200 PostgREST-shaped rows.
+
+    pip install -r requirements.txt
+    python benchmarks/bench_json.py [--rows 200] [--iterations 300]
+
+Compares the default FastAPI path (jsonable_encoder walk + stdlib json via JSONResponse) with
+FastJSONResponse given JSON-native rows, then each negotiated encoding at the configured levels
+(compression time per page and compressed size). Pure CPU, no app startup; compare runs on the
+same machine only.
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+import uuid
+
+import _env  # noqa: F401
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from app.compression import available_encodings, compress_body  # noqa: E402
+from app.responses import FastJSONResponse  # noqa: E402
+
+
+def _rows(n: int) -> list[dict]:
+    return [
+        {
+            "id": str(uuid.UUID(int=i)),
+            "created_at": f"2026-10-{1 + i % 28:02d}T12:{i % 60:02d}:00.{i:06d}+00:00",
+            "vendor": f"Vendor {i % 37} GmbH",
+            "total": round(100 + i * 3.17, 2),
+            "currency": "EUR" if i % 3 else "USD",
+            "invoice_date": f"2026-09-{1 + i % 28:02d}",
+            "sender_email": f"billing{i % 37}@vendor.example",
+            "invoice_number": f"INV-{10_000 + i}",
+            "source_content_hash": uuid.UUID(int=i * 7919).hex * 2,
+            "invoice_ref": f"vendor {i % 37}|inv-{10_000 + i}|2026-09-{1 + i % 28:02d}",
+            "idempotency_key": None,
+            "user_id": str(uuid.UUID(int=i % 5)),
+        }
+        for i in range(n)
+    ]
+
+
+def _median_us(fn, iterations: int) -> float:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=300)
+    args = parser.parse_args()
+
+    page = {"invoices": _rows(args.rows), "total": 5_000, "page": 1, "limit": args.rows, "offset": 0}
+    stdlib_us = _median_us(lambda: JSONResponse(jsonable_encoder(page)), args.iterations)
+    orjson_us = _median_us(lambda: FastJSONResponse(page), args.iterations)
+    body = FastJSONResponse(page).body
+    assert body == FastJSONResponse(jsonable_encoder(page)).body
+
+    print(f"{args.rows} rows, median of {args.iterations}")
+    print(f"{'serializer':<34} {'us/page':>10}")
+    print(f"{'jsonable_encoder + json (default)':<34} {stdlib_us:>10.0f}")
+    print(f"{'FastJSONResponse (orjson)':<34} {orjson_us:>10.0f}")
+    print()
+    print(f"{'encoding':<10} {'bytes':>10} {'ratio':>8} {'us/page':>10}")
+    print(f"{'identity':<10} {len(body):>10} {1.0:>8.2f} {0:>10}")
+    for encoding in available_encodings():
+        size = len(compress_body(encoding, body))
+        us = _median_us(lambda e=encoding: compress_body(e, body), args.iterations)
+        print(f"{encoding:<10} {size:>10} {len(body) / size:>8.2f} {us:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
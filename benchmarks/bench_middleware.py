@@ -0,0 +1,76 @@
+"""
+Per-request middleware overhead: requests/sec through the full app stack with an in-process client.
+
+    pip install -r requirements.txt -r requirements-dev.txt
+    python benchmarks/bench_middleware.py [--requests 1000]
+
+Hits GET /health (no auth, tiny JSON) and GET /invoices (machine auth via the legacy header, Supabase
+stubbed with a fixed page) so the numbers are dominated by routing + middleware, not I/O. Security
+headers are on (the default) and access logging is off. httpx.AsyncClient with ASGITransport drives
+the app on one event loop (Starlette's TestClient adds a thread hop per request that would swamp the
+difference); compare runs on the same machine only.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import _env  # noqa: F401
+
+os.environ.setdefault("API_KEY_DEFAULT_RATE_LIMIT_PER_SECOND", "0")
+os.environ.setdefault("OBSERVABILITY_METRICS_ENABLED", "true")
+
+import httpx  # noqa: E402
+
+import app.main as main  # noqa: E402
+
+_ROWS = [
+    {"id": str(i), "vendor": f"Vendor {i}", "invoice_number": f"INV-{i}", "total": 100 + i}
+    for i in range(20)
+]
+
+
+def _fake_list_invoices(*, client, limit: int = 50, offset: int = 0) -> dict:
+    return {"items": _ROWS[offset : offset + limit], "total": len(_ROWS), "limit": limit, "offset": offset}
+
+
+async def _run(client: httpx.AsyncClient, path: str, headers: dict[str, str], n: int, rounds: int) -> float:
+    for _ in range(min(200, n)):
+        await client.get(path, headers=headers)
+    rates = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(n):
+            r = await client.get(path, headers=headers)
+        rates.append(n / (time.perf_counter() - start))
+        assert r.status_code == 200, r.text
+    return statistics.median(rates)
+
+
+async def _bench(n: int, rounds: int) -> None:
+    machine = {"X-App-Password": main.settings.APP_PASSWORD}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'route':<10} {'req/s (median of ' + str(rounds) + ')':>24}")
+        for path, headers in (("/health", {}), ("/invoices", machine)):
+            print(f"{path:<10} {await _run(client, path, headers, n, rounds):>24.0f}")
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    main.list_invoices = _fake_list_invoices
+    main.get_invoice_data_version = lambda *, client: {"latest_created_at": None, "count": len(_ROWS)}
+    main.get_supabase_for_api = lambda: None
+    asyncio.run(_bench(args.requests, args.rounds))
+
+
+if __name__ == "__main__":
+    main_()
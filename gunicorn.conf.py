@@ -0,0 +1,29 @@
+"""
+Optional multi-worker runner: gunicorn -c gunicorn.conf.py app.main:app
+(pip install gunicorn; not pinned in requirements.txt, the default image runs a single uvicorn process).
+
+With OBSERVABILITY_METRICS_ENABLED=true, set PROMETHEUS_MULTIPROC_DIR so /metrics aggregates all workers.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+
+def on_starting(server) -> None:
+    # Metric files from a previous run would be summed into the new one's counters.
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker) -> None:
+    from app.metrics import mark_worker_dead
+
+    mark_worker_dead(worker.pid)
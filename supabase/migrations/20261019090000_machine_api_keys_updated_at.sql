@@ -0,0 +1,32 @@
+-- Versioned machine API key cache: updated_at lets workers reload only rows changed since their last load.
+-- Apply after 20260430140000_invoice_idempotency_machine_api_keys.sql
+
+alter table public.machine_api_keys
+    add column if not exists updated_at timestamptz not null default now();
+
+create or replace function public.machine_api_keys_touch_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    -- last_used_at touches (every API call) must not make the key look changed to the caches.
+    if (to_jsonb(new) - 'last_used_at' - 'updated_at') = (to_jsonb(old) - 'last_used_at' - 'updated_at') then
+        new.updated_at := old.updated_at;
+    else
+        new.updated_at := now();
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists machine_api_keys_touch_updated_at on public.machine_api_keys;
+
+create trigger machine_api_keys_touch_updated_at
+    before update on public.machine_api_keys
+    for each row
+    execute function public.machine_api_keys_touch_updated_at();
+
+create index if not exists machine_api_keys_updated_at_idx
+    on public.machine_api_keys (updated_at);
+
+comment on column public.machine_api_keys.updated_at is 'Bumped on every change except last_used_at touches (revoke, re-scope); delta reload watermark for app key caches.';
@@ -0,0 +1,11 @@
+-- Per-key quotas for machine routes. NULL = use the app defaults
+-- (API_KEY_DEFAULT_RATE_LIMIT_PER_SECOND, API_KEY_DEFAULT_LLM_EXTRACTIONS_PER_DAY); 0 = unlimited.
+-- Apply after 20261019090000_machine_api_keys_updated_at.sql (app key caches select these columns
+-- together with updated_at; without them they fall back to full reloads with default quotas).
+
+alter table public.machine_api_keys
+    add column if not exists rate_limit_per_second int check (rate_limit_per_second >= 0),
+    add column if not exists llm_extractions_per_day int check (llm_extractions_per_day >= 0);
+
+comment on column public.machine_api_keys.rate_limit_per_second is 'Requests per second across all machine routes for this key; NULL = app default, 0 = unlimited.';
+comment on column public.machine_api_keys.llm_extractions_per_day is 'LLM-backed extractions (POST /process-mock-email, POST /api/invoices) per rolling 24h; NULL = app default, 0 = unlimited.';
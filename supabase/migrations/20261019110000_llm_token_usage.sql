@@ -0,0 +1,41 @@
+-- Per-caller LLM token usage for capacity planning against the Azure OpenAI TPM quota.
+-- The app appends one row per (principal, deployment) every LLM_USAGE_FLUSH_SECONDS; sum over windows.
+-- principal: key:<machine_api_keys.id>, legacy (shared X-App-Password), user:<auth.users.id>, web (legacy UI login).
+
+create table if not exists public.llm_token_usage (
+    id bigserial primary key,
+    principal text not null,
+    deployment text not null,
+    requests int not null,
+    prompt_tokens bigint not null,
+    completion_tokens bigint not null,
+    window_start timestamptz not null,
+    window_end timestamptz not null,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists llm_token_usage_principal_window_idx
+    on public.llm_token_usage (principal, window_start desc);
+
+create or replace view public.llm_token_usage_daily
+with (security_invoker = true) as
+select
+    principal,
+    deployment,
+    date_trunc('day', window_start) as day,
+    sum(requests) as requests,
+    sum(prompt_tokens) as prompt_tokens,
+    sum(completion_tokens) as completion_tokens
+from public.llm_token_usage
+group by principal, deployment, date_trunc('day', window_start);
+
+comment on table public.llm_token_usage is 'Append-only per-caller LLM token totals per flush window (written by the app with service_role).';
+
+alter table public.llm_token_usage enable row level security;
+
+revoke all on public.llm_token_usage from anon, authenticated;
+revoke all on public.llm_token_usage_daily from anon, authenticated;
+
+grant select, insert on public.llm_token_usage to service_role;
+grant usage, select on sequence public.llm_token_usage_id_seq to service_role;
+grant select on public.llm_token_usage_daily to service_role;
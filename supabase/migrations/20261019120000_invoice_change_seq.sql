@@ -0,0 +1,40 @@
+-- Monotonic change cursor for GET /invoices/changes (incremental sync for integrators).
+-- Apply after 20260430140000_invoice_idempotency_machine_api_keys.sql. Existing rows are numbered
+-- in physical order when the column is added (one table rewrite); new rows take the next value on insert.
+
+create sequence if not exists public.invoices_change_seq;
+
+alter table public.invoices
+    add column if not exists change_seq bigint not null default nextval('public.invoices_change_seq');
+
+alter sequence public.invoices_change_seq owned by public.invoices.change_seq;
+
+create unique index if not exists invoices_change_seq_uidx
+    on public.invoices (change_seq);
+
+comment on column public.invoices.change_seq is 'Insert order cursor for GET /invoices/changes; compare only, values have gaps.';
+
+-- Rows after a cursor, oldest first. security invoker: RLS applies exactly as for a direct select.
+-- Rows younger than settle_seconds are held back: change_seq is drawn before the inserting transaction
+-- commits, so a just-inserted row with a lower value could otherwise appear after a reader moved past it.
+create or replace function public.invoice_changes(
+    after_seq bigint,
+    max_rows int,
+    settle_seconds double precision default 2
+)
+returns setof public.invoices
+language sql
+stable
+security invoker
+set search_path = public
+as $$
+    select *
+    from public.invoices
+    where change_seq > after_seq
+      and created_at <= now() - make_interval(secs => settle_seconds)
+    order by change_seq
+    limit greatest(max_rows, 0)
+$$;
+
+revoke all on function public.invoice_changes(bigint, int, double precision) from public, anon;
+grant execute on function public.invoice_changes(bigint, int, double precision) to authenticated, service_role;
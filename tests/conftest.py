@@ -37,6 +37,7 @@ for _key, _val in _TEST_ENV.items():
     os.environ[_key] = _val
 
 from app.main import app  # noqa: E402
+from app.rate_limit import RateLimitDecision  # noqa: E402
 from app.services.invoice_service import build_invoice_ref  # noqa: E402
 
 _INVOICE_ROWS: list[dict] = []
@@ -76,6 +77,7 @@ def _fake_save_invoice(
             return {"status": "duplicate", "id": str(existing["id"]), "invoice": existing}
 
     row["id"] = str(len(_INVOICE_ROWS) + 1)
+    row["created_at"] = f"2026-01-01T00:00:{len(_INVOICE_ROWS):02d}+00:00"
     _INVOICE_ROWS.append(row)
     return {"status": "created", "id": row["id"], "invoice": row}
 
@@ -87,18 +89,28 @@ def _fake_list_invoices(*, client, limit: int = 50, offset: int = 0):
     return {"items": items, "total": total, "limit": limit, "offset": offset}
 
 
+def _fake_invoice_data_version(*, client):
+    latest = _INVOICE_ROWS[-1]["created_at"] if _INVOICE_ROWS else None
+    return {"latest_created_at": latest, "count": len(_INVOICE_ROWS)}
+
+
+def _fake_latest_created_at(*, client):
+    return _fake_invoice_data_version(client=client)["latest_created_at"]
+
+
 @pytest.fixture
 def client() -> TestClient:
     return TestClient(app)
 
 
-async def _rate_limit_disabled(*_a, **_k) -> bool:
-    return False
+async def _rate_limit_disabled(*_a, max_requests: int = 1, **_k) -> RateLimitDecision:
+    return RateLimitDecision(limited=False, limit=max_requests, remaining=max_requests, reset_seconds=0)
 
 
 @pytest.fixture(autouse=True)
 def disable_rate_limits_for_tests(monkeypatch: pytest.MonkeyPatch) -> None:
-    monkeypatch.setattr("app.main.check_rate_limited", _rate_limit_disabled)
+    monkeypatch.setattr("app.main.check_rate_limit", _rate_limit_disabled)
+    monkeypatch.setattr("app.services.api_key_auth.check_rate_limit", _rate_limit_disabled)
 
 
 @pytest.fixture(autouse=True)
@@ -106,6 +118,9 @@ def stub_invoice_persistence(monkeypatch: pytest.MonkeyPatch) -> None:
     _INVOICE_ROWS.clear()
     monkeypatch.setattr("app.main.save_invoice", _fake_save_invoice)
     monkeypatch.setattr("app.main.list_invoices", _fake_list_invoices)
+    monkeypatch.setattr("app.main.get_invoice_data_version", _fake_invoice_data_version)
+    monkeypatch.setattr("app.main.get_latest_invoice_created_at", _fake_latest_created_at)
+    monkeypatch.setattr("app.services.invoice_service.get_latest_invoice_created_at", _fake_latest_created_at)
 
 
 @pytest.fixture(autouse=True)
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import pytest
+
+from app.access_log import AccessLogSampler
+from app.config import settings
+
+
+@pytest.fixture
+def sampled(monkeypatch: pytest.MonkeyPatch) -> AccessLogSampler:
+    monkeypatch.setattr(settings, "ACCESS_LOG_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(settings, "ACCESS_LOG_MIN_PER_ROUTE", 2)
+    monkeypatch.setattr(settings, "ACCESS_LOG_SLOW_MS", 500.0)
+    monkeypatch.setattr(settings, "ACCESS_LOG_SLOW_MS_BY_ROUTE", {"/upload": 5000.0})
+    return AccessLogSampler()
+
+
+def _decide(sampler: AccessLogSampler, route: str = "/invoices", *, status: int = 200, ms: float = 10.0, limited: bool = False):
+    return sampler.decide(method="GET", route=route, status_code=status, duration_ms=ms, rate_limited=limited)
+
+
+def test_errors_slow_and_rate_limited_are_always_kept(sampled: AccessLogSampler) -> None:
+    assert [_decide(sampled) for _ in range(4)] == [("baseline", 1.0), ("baseline", 1.0), None, None]
+    assert _decide(sampled, status=503) == ("error", 1.0)
+    assert _decide(sampled, status=404) == ("error", 1.0)
+    assert _decide(sampled, status=303, limited=True) == ("rate_limited", 1.0)
+    assert _decide(sampled, ms=750.0) == ("slow", 1.0)
+
+
+def test_slow_threshold_is_per_route(sampled: AccessLogSampler) -> None:
+    for _ in range(2):
+        _decide(sampled, "/upload")
+    assert _decide(sampled, "/upload", ms=750.0) is None
+    assert _decide(sampled, "/upload", ms=6000.0) == ("slow", 1.0)
+
+
+def test_summary_counts_and_quantiles_reset_each_window(sampled: AccessLogSampler) -> None:
+    for ms in range(1, 101):
+        _decide(sampled, ms=float(ms))
+    _decide(sampled, status=500, ms=5.0)
+
+    [summary] = sampled.drain_summaries()
+    assert (summary["route"], summary["count"], summary["errors"], summary["logged"]) == ("/invoices", 101, 1, 3)
+    assert 49 <= summary["p50_ms"] <= 52
+    assert summary["p99_ms"] >= 98
+    assert summary["max_ms"] == 100.0
+    assert sampled.drain_summaries() == []
+    assert _decide(sampled) == ("baseline", 1.0)
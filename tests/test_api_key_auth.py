@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import asyncio
+
+import fakeredis
+import pytest
+from starlette.testclient import TestClient
+
+from app import rate_limit
+from app.config import settings
+from app.main import app
+from app.services import api_key_auth
+from app.services.api_key_auth import ApiKeyIndex, hash_api_secret, verify_api_key_plain
+
+
+@pytest.fixture
+def key_rows(monkeypatch: pytest.MonkeyPatch) -> dict:
+    state: dict = {"rows": [], "loads": 0, "deltas": []}
+
+    def _load() -> tuple[list[dict], bool]:
+        state["loads"] += 1
+        return list(state["rows"]), True
+
+    def _load_delta(since: str) -> list[dict]:
+        state["deltas"].append(since)
+        return [r for r in state["rows"] if r.get("updated_at", "") >= since]
+
+    monkeypatch.setattr(settings, "SUPABASE_SERVICE_ROLE_KEY", "service-role-test")
+    monkeypatch.setattr(api_key_auth, "_load_key_rows", _load)
+    monkeypatch.setattr(api_key_auth, "_load_key_delta", _load_delta)
+    api_key_auth.invalidate_api_key_cache()
+    api_key_auth._refresh_task = None
+    yield state
+    api_key_auth.invalidate_api_key_cache()
+    api_key_auth._refresh_task = None
+
+
+def _row(i: int, updated_at: str = "2026-01-01T00:00:00+00:00", revoked_at: str | None = None) -> dict:
+    return {
+        "id": f"id-{i}",
+        "name": f"k{i}",
+        "key_hash": hash_api_secret(f"secret-{i}"),
+        "scopes": ["invoices:read"],
+        "revoked_at": revoked_at,
+        "updated_at": updated_at,
+    }
+
+
+def test_lookup_among_thousands_of_keys_loads_once(key_rows: dict) -> None:
+    key_rows["rows"] = [_row(i) for i in range(3000)]
+
+    async def _run() -> list[dict | None]:
+        return [await verify_api_key_plain(f"secret-{i}") for i in (0, 1500, 2999)]
+
+    found = asyncio.run(_run())
+    assert [r["id"] for r in found if r] == ["id-0", "id-1500", "id-2999"]
+    assert key_rows["loads"] == 1
+
+
+def test_empty_key_table_is_cached(key_rows: dict) -> None:
+    async def _run() -> None:
+        await verify_api_key_plain("whatever")
+        for _ in range(5):
+            assert await verify_api_key_plain("whatever") is None
+
+    asyncio.run(_run())
+    assert key_rows["loads"] == 1
+
+
+def test_unknown_digest_is_negative_cached(key_rows: dict, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "API_KEY_MISS_REFRESH_SECONDS", 1)
+    monkeypatch.setattr(settings, "API_KEY_CACHE_SECONDS", 10**9)
+    api_key_auth._key_index = ApiKeyIndex(loaded_at=0.0, by_digest={})
+
+    async def _run() -> None:
+        for _ in range(20):
+            assert await verify_api_key_plain("stuffed-credential") is None
+        await api_key_auth._refresh_task
+
+    asyncio.run(_run())
+    assert key_rows["loads"] == 1
+
+
+def test_expired_index_is_served_while_refreshing(key_rows: dict, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "API_KEY_CACHE_SECONDS", 30)
+    old = _row(1)
+    api_key_auth._key_index = ApiKeyIndex(loaded_at=0.0, by_digest={old["key_hash"]: old})
+    key_rows["rows"] = [_row(2)]
+
+    async def _run() -> tuple[dict | None, dict | None]:
+        stale = await verify_api_key_plain("secret-1")
+        await api_key_auth._refresh_task
+        return stale, await verify_api_key_plain("secret-2")
+
+    stale, fresh = asyncio.run(_run())
+    assert stale is not None and stale["id"] == "id-1"
+    assert fresh is not None and fresh["id"] == "id-2"
+    assert key_rows["loads"] == 1
+
+
+def test_invalidation_message_applies_delta_on_every_subscriber(key_rows: dict) -> None:
+    key_rows["rows"] = [_row(1), _row(2)]
+
+    async def _run() -> tuple[ApiKeyIndex, dict | None, dict | None]:
+        redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await api_key_auth.schedule_api_key_refresh()
+        listener = asyncio.create_task(api_key_auth.run_api_key_invalidation_listener(redis_client))
+        while (await redis_client.pubsub_numsub(settings.API_KEY_INVALIDATION_CHANNEL))[0][1] == 0:
+            await asyncio.sleep(0.01)
+        key_rows["rows"] = [_row(1, "2026-02-01T00:00:00+00:00", revoked_at="2026-02-01T00:00:00+00:00"), _row(2)]
+        assert await api_key_auth.publish_api_key_invalidation(redis_client) == 1
+        for _ in range(200):
+            if api_key_auth._key_index.watermark == "2026-02-01T00:00:00+00:00":
+                break
+            await asyncio.sleep(0.01)
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+        return api_key_auth._key_index, await verify_api_key_plain("secret-1"), await verify_api_key_plain("secret-2")
+
+    index, revoked, active = asyncio.run(_run())
+    assert revoked is None
+    assert active is not None
+    assert key_rows["loads"] == 1
+    assert key_rows["deltas"][0] == "2025-12-31T23:59:30+00:00"
+    assert index.watermark == "2026-02-01T00:00:00+00:00"
+
+
+def test_revoke_runbook_publish_drops_the_revoked_digest(key_rows: dict, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "API_KEY_CACHE_SECONDS", 10**9)
+    key_rows["rows"] = [_row(1)]
+    digest = hash_api_secret("secret-1")
+
+    async def _run() -> tuple[dict | None, bool, dict | None]:
+        redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        before = await verify_api_key_plain("secret-1")
+        listener = asyncio.create_task(api_key_auth.run_api_key_invalidation_listener(redis_client))
+        while (await redis_client.pubsub_numsub(settings.API_KEY_INVALIDATION_CHANNEL))[0][1] == 0:
+            await asyncio.sleep(0.01)
+        await api_key_auth._refresh_task
+        key_rows["rows"] = [_row(1, "2026-02-01T00:00:00+00:00", revoked_at="2026-02-01T00:00:00+00:00")]
+        # The runbook's `redis-cli PUBLISH machine_api_keys:invalidate reload`.
+        await redis_client.publish(settings.API_KEY_INVALIDATION_CHANNEL, "reload")
+        for _ in range(200):
+            if digest not in api_key_auth._key_index.by_digest:
+                break
+            await asyncio.sleep(0.01)
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+        return before, digest in api_key_auth._key_index.by_digest, await verify_api_key_plain("secret-1")
+
+    before, still_indexed, after = asyncio.run(_run())
+    assert before is not None
+    assert not still_indexed
+    assert after is None
+    assert key_rows["loads"] == 1
+
+
+def test_delta_reload_catches_a_revocation_committed_behind_the_watermark(key_rows: dict) -> None:
+    key_rows["rows"] = [_row(1), _row(2, "2026-03-01T00:00:10+00:00")]
+
+    async def _run() -> tuple[dict | None, dict | None]:
+        await api_key_auth.schedule_api_key_refresh()
+        # Key 1's revoking transaction began (updated_at = now()) before key 2's change, committed after it.
+        key_rows["rows"][0] = _row(1, "2026-03-01T00:00:00+00:00", revoked_at="2026-03-01T00:00:00+00:00")
+        await api_key_auth.schedule_api_key_refresh(delta=True)
+        return await verify_api_key_plain("secret-1"), await verify_api_key_plain("secret-2")
+
+    revoked, active = asyncio.run(_run())
+    assert revoked is None
+    assert active is not None
+    assert api_key_auth._key_index.watermark == "2026-03-01T00:00:10+00:00"
+
+
+def test_watermark_compares_timestamps_not_strings() -> None:
+    rows = [
+        {"updated_at": "2026-03-01T10:00:00.5+00:00"},
+        {"updated_at": "2026-03-01T11:30:00+02:00"},
+        {"updated_at": "2026-03-01T10:00:00.123456+00:00"},
+    ]
+    assert api_key_auth._max_watermark(rows, "2026-03-01T09:59:59Z") == "2026-03-01T10:00:00.5+00:00"
+
+
+def test_per_key_quotas_return_429_with_reset_hints(
+    key_rows: dict, monkeypatch: pytest.MonkeyPatch, client: TestClient
+) -> None:
+    monkeypatch.setattr(api_key_auth, "check_rate_limit", rate_limit.check_rate_limit)
+    rate_limit._MEMORY_STORE.clear()
+    reader = {**_row(1), "rate_limit_per_second": 2}
+    writer = {**_row(2), "scopes": ["invoices:write"], "rate_limit_per_second": 0, "llm_extractions_per_day": 1}
+    key_rows["rows"] = [reader, writer]
+
+    reads = [client.get("/invoices", headers={"Authorization": "Bearer secret-1"}) for _ in range(3)]
+    assert [r.status_code for r in reads] == [200, 200, 429]
+    assert reads[0].headers["ratelimit-limit"] == "2"
+    assert reads[2].json() == {"detail": "API key quota exceeded"}
+    assert int(reads[2].headers["retry-after"]) >= 1
+
+    writes = [client.post("/process-mock-email", headers={"X-API-Key": "secret-2"}) for _ in range(2)]
+    assert [w.status_code for w in writes] == [200, 429]
+    assert writes[1].headers["ratelimit-limit"] == "1"
+    assert int(writes[1].headers["retry-after"]) > 3600
+
+
+def test_extraction_quota_is_exact_on_redis_and_skips_replays_and_rejections(
+    key_rows: dict, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(api_key_auth, "check_rate_limit", rate_limit.check_rate_limit)
+    rate_limit._LEASES.clear()
+    writer = {**_row(3), "scopes": ["invoices:write"], "rate_limit_per_second": 0, "llm_extractions_per_day": 3}
+    key_rows["rows"] = [writer]
+    auth = {"X-API-Key": "secret-3"}
+    redis_client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer(), decode_responses=True)
+
+    with TestClient(app) as client:
+        monkeypatch.setattr(client.app.state, "redis", redis_client)
+        replayed = {**auth, "Idempotency-Key": "quota-1"}
+        assert client.post("/process-mock-email", headers=replayed).status_code == 200
+        assert client.post("/process-mock-email", headers=replayed).headers["idempotent-replayed"] == "true"
+        assert client.post("/api/invoices", headers={**auth, "Content-Type": "image/png"}, content=b"x").status_code == 415
+        assert client.post("/api/invoices", headers={**auth, "Content-Type": "text/plain"}, content=b"").status_code == 400
+
+        key = f"{settings.RATE_LIMIT_REDIS_KEY_PREFIX}:sw:machine_llm_extractions:key:id-3"
+        assert client.portal.call(redis_client.zcard, key) == 1
+        statuses = [client.post("/process-mock-email", headers=auth).status_code for _ in range(3)]
+        assert statuses == [200, 200, 429]
+        assert client.portal.call(redis_client.zcard, key) == 3
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.config import settings
+from app.services import audit_writer as audit_module
+from app.services.audit_writer import MachineAuditWriter
+
+_SERVICE_JWT = (
+    "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9."
+    "eyJpc3MiOiJzdXBhYmFzZS1kZW1vIiwicm9sZSI6InNlcnZpY2Vfcm9sZSJ9."
+    "M2d2z4SFn5C7HlJlaSLfrzuYim9nbY_XI40uWFN3hEE"
+)
+
+
+def test_machine_request_audit_is_queued_with_real_status(monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    writer = MachineAuditWriter(max_buffer=100, batch_size=50, flush_interval_s=60, touch_debounce_s=60)
+    monkeypatch.setattr(audit_module, "audit_writer", writer)
+    monkeypatch.setattr(settings, "SUPABASE_SERVICE_ROLE_KEY", _SERVICE_JWT)
+    headers = {"X-App-Password": "test-app-password", "Idempotency-Key": "audit-1"}
+    assert client.post("/process-mock-email", headers=headers, content=b"a").status_code == 200
+    assert client.post("/process-mock-email", headers=headers, content=b"b").status_code == 409
+    assert client.get("/health").status_code == 200
+    assert [e["status_code"] for e in writer._events] == [200, 409]
+    assert all(e["legacy_auth"] and e["route"] == "/process-mock-email" for e in writer._events)
+
+
+def test_flush_bulk_inserts_in_batches_and_debounces_touches(monkeypatch: pytest.MonkeyPatch) -> None:
+    writer = MachineAuditWriter(max_buffer=5, batch_size=2, flush_interval_s=60, touch_debounce_s=60)
+    writes: list[tuple[int, list[str]]] = []
+    monkeypatch.setattr(writer, "_write", lambda rows, touched: writes.append((len(rows), touched)))
+    for i in range(7):
+        writer.record({"status_code": 200, "n": i})
+        writer.touch_key("key-a")
+    writer.touch_key("key-b")
+    assert len(writer) == 5
+    asyncio.run(writer.flush())
+    assert [n for n, _ in writes] == [2, 2, 1]
+    assert writes[0][1] == ["key-a", "key-b"]
+    assert all(not touched for _, touched in writes[1:])
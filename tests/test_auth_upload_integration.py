@@ -3,6 +3,7 @@ from __future__ import annotations
 import re
 from pathlib import Path
 
+from prometheus_client import REGISTRY
 from starlette.testclient import TestClient
 
 
@@ -134,3 +135,60 @@ def test_upload_unsupported_extension_redirects(client: TestClient) -> None:
     )
     assert up.status_code == 302
     assert "unsupported" in (up.headers.get("location") or "")
+
+
+def _stage_count(stage: str, kind: str) -> float:
+    value = REGISTRY.get_sample_value(
+        "invoice_pipeline_stage_duration_seconds_count", {"stage": stage, "kind": kind}
+    )
+    return value or 0.0
+
+
+def test_upload_records_stage_timings_and_fallback(client: TestClient) -> None:
+    stages = ("read", "sniff", "spool", "av_scan", "parse", "llm", "save")
+    before = {stage: _stage_count(stage, "txt") for stage in stages}
+    fallbacks = REGISTRY.get_sample_value("invoice_parse_fallbacks_total", {"kind": "txt", "reason": "error"}) or 0.0
+    r = client.get("/")
+    client.post(
+        "/login",
+        data={"csrf_token": _csrf_token(r.text), "password": "test-login-password"},
+        follow_redirects=True,
+    )
+    raw = (Path(__file__).resolve().parents[1] / "examples" / "sample_invoice_email.txt").read_bytes()
+    up = client.post(
+        "/upload-invoice",
+        data={"csrf_token": _csrf_token(client.get("/dashboard").text)},
+        files={"file": ("invoice.txt", raw, "text/plain")},
+        follow_redirects=False,
+    )
+    assert "success=uploaded" in (up.headers.get("location") or "")
+    assert all(_stage_count(stage, "txt") == before[stage] + 1 for stage in stages)
+    assert REGISTRY.get_sample_value("invoice_parse_fallbacks_total", {"kind": "txt", "reason": "error"}) == fallbacks + 1
+
+
+def test_csrf_token_is_masked_per_render(client: TestClient) -> None:
+    r = client.get("/")
+    client.post(
+        "/login",
+        data={"csrf_token": _csrf_token(r.text), "password": "test-login-password"},
+        follow_redirects=True,
+    )
+    first, second = _csrf_token(client.get("/dashboard").text), _csrf_token(client.get("/dashboard").text)
+    assert first != second
+    raw = (Path(__file__).resolve().parents[1] / "examples" / "sample_invoice_email.txt").read_bytes()
+    for token in (first, second):
+        up = client.post(
+            "/upload-invoice",
+            data={"csrf_token": token},
+            files={"file": ("invoice.txt", raw, "text/plain")},
+            follow_redirects=False,
+        )
+        assert "success=" in (up.headers.get("location") or "")
+    tampered = first[:-2] + ("AA" if first[-2:] != "AA" else "BB")
+    up = client.post(
+        "/upload-invoice",
+        data={"csrf_token": tampered},
+        files={"file": ("invoice.txt", raw, "text/plain")},
+        follow_redirects=False,
+    )
+    assert "csrf_invalid" in (up.headers.get("location") or "")
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import json
+from decimal import Decimal
+
+import pytest
+import zstandard
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.compression import CompressionMiddleware, negotiate_encoding
+from app.config import settings
+from app.responses import FastJSONResponse
+
+_AUTH = {"X-App-Password": "test-app-password"}
+
+
+def test_negotiation_prefers_server_order_and_honours_q() -> None:
+    assert negotiate_encoding("gzip, deflate, br, zstd") == "zstd"
+    assert negotiate_encoding("gzip, br;q=0.5") == "br"
+    assert negotiate_encoding("zstd;q=0, gzip") == "gzip"
+    assert negotiate_encoding("*") == "zstd"
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding(None) is None
+
+
+def test_invoice_page_is_compressed_and_small_bodies_are_not(monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    rows = [{"id": str(i), "vendor": f"Vendor {i}", "total": i} for i in range(200)]
+    monkeypatch.setattr(
+        "app.main.list_invoices",
+        lambda *, client, limit, offset: {"items": rows[:limit], "total": len(rows), "limit": limit, "offset": offset},
+    )
+    monkeypatch.setattr("app.main.get_invoice_data_version", lambda *, client: {"latest_created_at": None, "count": len(rows)})
+    r = client.get("/invoices", headers={**_AUTH, "Accept-Encoding": "zstd"}, params={"limit": 200})
+    assert r.headers["content-encoding"] == "zstd"
+    assert r.headers["vary"] == "Accept, Accept-Encoding"
+    assert int(r.headers["content-length"]) == len(r.content)
+    body = json.loads(zstandard.ZstdDecompressor().decompressobj().decompress(r.content))
+    assert len(body["invoices"]) == 200
+
+    health = client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in health.headers
+
+    etag = client.get("/invoices", headers=_AUTH).headers["etag"]
+    cached = client.get("/invoices", headers={**_AUTH, "If-None-Match": etag, "Accept-Encoding": "gzip"})
+    assert cached.status_code == 304
+    assert "content-encoding" not in cached.headers
+
+
+def test_streamed_bodies_are_compressed_per_chunk(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "COMPRESSION_ENCODINGS", ["gzip"])
+
+    async def stream(_request):
+        async def lines():
+            for i in range(3):
+                yield f'{{"n": {i}}}\n'.encode()
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    async def image(_request):
+        return PlainTextResponse("x" * 5000, media_type="image/png")
+
+    app = Starlette(routes=[Route("/stream", stream), Route("/image", image)])
+    app.add_middleware(CompressionMiddleware)
+    client = TestClient(app)
+    r = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert "content-length" not in r.headers
+    assert r.text.splitlines() == ['{"n": 0}', '{"n": 1}', '{"n": 2}']
+
+    raw = client.get("/image", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in raw.headers
+    assert raw.content == b"x" * 5000
+
+
+def test_fast_json_response_falls_back_for_non_native_types() -> None:
+    body = FastJSONResponse({"total": Decimal("1.50"), 1: "a"}).body
+    assert json.loads(body) == {"total": 1.5, "1": "a"}
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import json
+import re
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.config import settings
+
+_AUTH = {"X-App-Password": "test-app-password"}
+
+
+def _login(client: TestClient) -> None:
+    token = re.search(r'name="csrf_token"\s+value="([^"]+)"', client.get("/").text).group(1)
+    client.post("/login", data={"csrf_token": token, "password": "test-login-password"}, follow_redirects=False)
+
+
+def test_invoices_etag_returns_304_until_data_changes(client: TestClient) -> None:
+    first = client.get("/invoices", headers=_AUTH)
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    again = client.get("/invoices", headers={**_AUTH, "If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["etag"] == etag
+    assert client.get("/invoices", headers={**_AUTH, "If-None-Match": etag}, params={"limit": 5}).status_code == 200
+
+    assert client.post("/process-mock-email", headers=_AUTH).status_code == 200
+    changed = client.get("/invoices", headers={**_AUTH, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()["total"] == 1
+    assert "last-modified" in changed.headers
+    stale = client.get("/invoices", headers={**_AUTH, "If-Modified-Since": changed.headers["last-modified"]})
+    assert stale.status_code == 304
+
+
+def test_dashboard_304_keeps_cached_nonce_policy(monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    monkeypatch.setattr(settings, "SECURITY_CSP_USE_NONCES", True)
+    monkeypatch.setattr(settings, "SECURITY_CSP", None)
+    _login(client)
+    page = client.get("/dashboard")
+    assert page.status_code == 200
+    assert "nonce-" in page.headers["content-security-policy"]
+
+    cached = client.get("/dashboard", headers={"If-None-Match": page.headers["etag"]})
+    assert cached.status_code == 304
+    assert "content-security-policy" not in cached.headers
+    assert cached.headers["x-content-type-options"] == "nosniff"
+
+    flash = client.get("/dashboard?success=uploaded", headers={"If-None-Match": page.headers["etag"]})
+    assert flash.status_code == 200
+
+
+def test_invoice_rows_fragment(client: TestClient) -> None:
+    assert client.get("/dashboard/invoice-rows").status_code == 401
+    _login(client)
+    empty = client.get("/dashboard/invoice-rows")
+    assert empty.status_code == 200
+    assert "No invoices yet." in empty.text
+    assert empty.headers["x-invoice-total"] == "0"
+
+    assert client.post("/process-mock-email", headers=_AUTH).status_code == 200
+    rows = client.get("/dashboard/invoice-rows", headers={"If-None-Match": empty.headers["etag"]})
+    assert rows.status_code == 200
+    assert "<html" not in rows.text
+    assert rows.headers["x-invoice-total"] == "1"
+    data = re.search(r"data-invoice='([^']+)'", rows.text).group(1)
+    assert json.loads(data)["id"] == "1"
+    assert client.get("/dashboard/invoice-rows", headers={"If-None-Match": rows.headers["etag"]}).status_code == 304
+
+
+def test_plain_gets_take_the_version_from_the_listing(monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    import app.main as main
+
+    assert client.post("/process-mock-email", headers=_AUTH).status_code == 200
+
+    version_queries: list[int] = []
+    real_version = main.get_invoice_data_version
+
+    def counting_version(*, client):
+        version_queries.append(1)
+        return real_version(client=client)
+
+    monkeypatch.setattr("app.main.get_invoice_data_version", counting_version)
+    # Page one carries the newest row itself; later pages look it up without a count.
+    for params in ({}, {"page": 2, "limit": 1}):
+        plain = client.get("/invoices", headers=_AUTH, params=params)
+        assert plain.status_code == 200
+        assert "Accept" in plain.headers["vary"].split(", ")
+        assert version_queries == []
+
+        cached = client.get("/invoices", headers={**_AUTH, "If-None-Match": plain.headers["etag"]}, params=params)
+        assert cached.status_code == 304
+        assert cached.headers["vary"] == "Accept"
+        assert len(version_queries) == 1
+        version_queries.clear()
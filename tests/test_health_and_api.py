@@ -48,6 +48,18 @@ def test_csp_uses_script_nonce_when_enabled(monkeypatch: pytest.MonkeyPatch, cli
     assert "unsafe-inline" not in script_src_segment
 
 
+def test_security_headers_follow_runtime_settings(monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    r = client.get("/health", headers={"X-Request-ID": "req-123"})
+    assert r.headers["x-request-id"] == "req-123"
+    assert r.json()["correlation_id"] == "req-123"
+    assert r.headers.get_list("x-content-type-options") == ["nosniff"]
+    monkeypatch.setattr(settings, "SECURITY_CSP", "default-src 'none'")
+    monkeypatch.setattr(settings, "SECURITY_ENABLE_HSTS", True)
+    r = client.get("/health")
+    assert r.headers.get_list("content-security-policy") == ["default-src 'none'"]
+    assert r.headers["strict-transport-security"].startswith("max-age=")
+
+
 def test_process_mock_email_requires_app_password(client: TestClient) -> None:
     r = client.post("/process-mock-email")
     assert r.status_code == 401
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app import http_client
+from app.config import settings
+from app.services.supabase_web_auth import sign_in_with_email_password, sign_out_with_access_token
+
+
+class _GoTrue(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        body = json.dumps({"access_token": "a", "user": {"id": "u1"}}).encode() if self.path.startswith("/auth/v1/token") else b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_args) -> None:
+        pass
+
+
+@pytest.fixture
+def gotrue(monkeypatch: pytest.MonkeyPatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _GoTrue)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(settings, "SUPABASE_URL", f"http://127.0.0.1:{server.server_port}")
+    yield
+    server.shutdown()
+    server.server_close()
+
+
+def _requests(kind: str) -> float:
+    return REGISTRY.get_sample_value("http_client_requests_total", {"host": "127.0.0.1", "connection": kind}) or 0.0
+
+
+def test_auth_calls_share_one_pooled_connection(gotrue) -> None:
+    new_before, reused_before = _requests("new"), _requests("reused")
+    connects_before = REGISTRY.get_sample_value(
+        "http_client_connect_duration_seconds_count", {"host": "127.0.0.1", "phase": "tcp"}
+    ) or 0.0
+
+    async def _run() -> dict | None:
+        try:
+            payload = await sign_in_with_email_password("a@example.com", "pw")
+            await sign_in_with_email_password("a@example.com", "pw")
+            await sign_out_with_access_token("a")
+            return payload
+        finally:
+            await http_client.close_http_client()
+
+    assert asyncio.run(_run()) == {"access_token": "a", "user": {"id": "u1"}}
+    assert _requests("new") == new_before + 1
+    assert _requests("reused") == reused_before + 2
+    assert REGISTRY.get_sample_value(
+        "http_client_connect_duration_seconds_count", {"host": "127.0.0.1", "phase": "tcp"}
+    ) == connects_before + 1
+    pooled = [REGISTRY.get_sample_value("http_client_pool_connections", {"state": s}) for s in ("active", "idle")]
+    assert sum(pooled) == 1.0
+
+
+def test_client_is_rebuilt_for_a_new_event_loop() -> None:
+    async def _get() -> object:
+        return http_client.get_http_client()
+
+    first = asyncio.run(_get())
+    second = asyncio.run(_get())
+    assert first is not second
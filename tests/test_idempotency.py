@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.services import idempotency
+
+_AUTH = {"X-App-Password": "test-app-password"}
+
+
+@pytest.fixture(autouse=True)
+def clear_idempotency_state() -> None:
+    idempotency._MEMORY_STATE.clear()
+
+
+def test_retry_with_same_key_replays_without_reparsing(monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    import app.main as main
+
+    calls: list[str] = []
+    real_parse = main.parse_mock_email
+
+    def _counting_parse(path: str) -> dict:
+        calls.append(path)
+        return real_parse(path)
+
+    monkeypatch.setattr("app.main.parse_mock_email", _counting_parse)
+    headers = {**_AUTH, "Idempotency-Key": "retry-1"}
+    first = client.post("/process-mock-email", headers=headers)
+    second = client.post("/process-mock-email", headers=headers)
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers.get("idempotent-replayed") == "true"
+    assert len(calls) == 1
+
+
+def test_same_key_different_payload_is_conflict(client: TestClient) -> None:
+    headers = {**_AUTH, "Idempotency-Key": "retry-2"}
+    assert client.post("/process-mock-email", headers=headers, content=b"a").status_code == 200
+    r = client.post("/process-mock-email", headers=headers, content=b"b")
+    assert r.status_code == 409
+
+
+def test_failed_request_releases_key(monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    import app.main as main
+
+    fake_save = main.save_invoice
+    fail = {"on": True}
+
+    def _flaky_save(*args, **kwargs):
+        if fail["on"]:
+            raise RuntimeError("db down")
+        return fake_save(*args, **kwargs)
+
+    monkeypatch.setattr("app.main.save_invoice", _flaky_save)
+    headers = {**_AUTH, "Idempotency-Key": "retry-3"}
+    failing = TestClient(client.app, raise_server_exceptions=False)
+    assert failing.post("/process-mock-email", headers=headers).status_code == 500
+    fail["on"] = False
+    assert client.post("/process-mock-email", headers=headers).status_code == 200
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.config import settings
+
+_AUTH = {"X-App-Password": "test-app-password"}
+_SAVED = "ab" * 32
+_OTHER = "cd" * 32
+
+
+@pytest.fixture
+def lookups(monkeypatch: pytest.MonkeyPatch) -> list[dict]:
+    calls: list[dict] = []
+
+    def fake_find(client, *, user_id, hashes):
+        calls.append({"user_id": user_id, "hashes": hashes})
+        return {h: {"id": "inv-1", "created_at": "2026-10-01T00:00:00+00:00"} for h in hashes if h == _SAVED}
+
+    monkeypatch.setattr("app.main.find_invoices_by_content_hash", fake_find)
+    return calls
+
+
+def test_single_hash_lookup(lookups: list[dict], client: TestClient) -> None:
+    r = client.get(f"/invoices/by-hash/{_SAVED.upper()}", headers=_AUTH)
+    assert r.status_code == 200
+    assert r.json() == {"sha256": _SAVED, "exists": True, "id": "inv-1", "created_at": "2026-10-01T00:00:00+00:00"}
+    assert lookups == [{"user_id": None, "hashes": [_SAVED]}]
+
+    assert client.head(f"/invoices/by-hash/{_OTHER}", headers=_AUTH).status_code == 404
+    assert client.get("/invoices/by-hash/not-a-hash", headers=_AUTH).status_code == 422
+    assert client.get(f"/invoices/by-hash/{_SAVED}").status_code == 401
+
+
+def test_batch_lookup(lookups: list[dict], monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    r = client.post("/invoices/by-hash", headers=_AUTH, json={"sha256": [_SAVED, _OTHER, _OTHER]})
+    assert r.status_code == 200
+    assert r.json() == {"existing": {_SAVED: {"id": "inv-1", "created_at": "2026-10-01T00:00:00+00:00"}}, "missing": [_OTHER]}
+
+    bad = client.post("/invoices/by-hash", headers=_AUTH, json={"sha256": [_SAVED, "xyz"]})
+    assert bad.status_code == 422
+    assert bad.json()["detail"]["invalid"] == ["xyz"]
+
+    monkeypatch.setattr(settings, "CONTENT_HASH_BATCH_MAX", 1)
+    assert client.post("/invoices/by-hash", headers=_AUTH, json={"sha256": [_SAVED, _OTHER]}).status_code == 413
+    assert len(lookups) == 1
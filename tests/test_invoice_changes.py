@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+import fakeredis
+import pytest
+from starlette.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.services.invoice_changes import invoice_change_notifier, run_invoice_change_listener
+
+_AUTH = {"X-App-Password": "test-app-password"}
+
+
+class _Feed:
+    def __init__(self) -> None:
+        self.rows: list[dict] = []
+        self.queries = 0
+
+    def list_changes(self, *, client, after: int, limit: int) -> list[dict]:
+        self.queries += 1
+        return [r for r in self.rows if r["change_seq"] > after][:limit]
+
+
+@pytest.fixture
+def feed(monkeypatch: pytest.MonkeyPatch) -> _Feed:
+    feed = _Feed()
+    monkeypatch.setattr("app.main.list_invoice_changes", feed.list_changes)
+    monkeypatch.setattr(settings, "CHANGE_FEED_SETTLE_SECONDS", 0.0)
+    return feed
+
+
+def test_changes_after_cursor(feed: _Feed, client: TestClient) -> None:
+    feed.rows.extend({"id": str(i), "change_seq": i * 10} for i in range(1, 4))
+    first = client.get("/invoices/changes", headers=_AUTH, params={"limit": 2}).json()
+    assert [r["id"] for r in first["changes"]] == ["1", "2"]
+    assert first["cursor"] == 20 and first["has_more"] is True
+
+    rest = client.get("/invoices/changes", headers=_AUTH, params={"cursor": first["cursor"]}).json()
+    assert [r["id"] for r in rest["changes"]] == ["3"]
+    assert rest["has_more"] is False
+
+    idle = client.get("/invoices/changes", headers=_AUTH, params={"cursor": 30}).json()
+    assert idle == {"changes": [], "cursor": 30, "has_more": False}
+
+
+def test_long_poll_wakes_on_new_invoice(feed: _Feed) -> None:
+    with TestClient(app) as client:
+        result: dict = {}
+
+        def poll() -> None:
+            started = time.monotonic()
+            result["body"] = client.get("/invoices/changes", headers=_AUTH, params={"wait": 10}).json()
+            result["elapsed"] = time.monotonic() - started
+
+        waiter = threading.Thread(target=poll)
+        waiter.start()
+        deadline = time.monotonic() + 5
+        while invoice_change_notifier.waiters == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert feed.queries == 1
+
+        async def insert() -> None:
+            feed.rows.append({"id": "new", "change_seq": 7})
+            invoice_change_notifier.notify(None)
+
+        client.portal.call(insert)
+        waiter.join(5)
+
+    assert result["body"]["changes"] == [{"id": "new", "change_seq": 7}]
+    assert result["body"]["cursor"] == 7
+    assert result["elapsed"] < 5
+
+
+def test_long_poll_times_out_and_saves_notify(feed: _Feed, monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    monkeypatch.setattr(settings, "CHANGE_FEED_MAX_WAIT_SECONDS", 0.2)
+    started = time.monotonic()
+    body = client.get("/invoices/changes", headers=_AUTH, params={"wait": 30}).json()
+    assert body["changes"] == []
+    assert 0.2 <= time.monotonic() - started < 2
+
+    notified: list[object] = []
+    monkeypatch.setattr(invoice_change_notifier, "notify", notified.append)
+    assert client.post("/process-mock-email", headers=_AUTH).json()["status"] == "created"
+    assert client.post("/process-mock-email", headers=_AUTH).json()["status"] == "duplicate"
+    assert notified == [None]
+
+
+def test_notifications_fan_out_over_redis() -> None:
+    async def scenario() -> bool:
+        redis_client = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+        listener = asyncio.create_task(run_invoice_change_listener(redis_client))
+        while (await redis_client.pubsub_numsub(settings.CHANGE_FEED_CHANNEL))[0][1] == 0:
+            await asyncio.sleep(0.01)
+        waiting = asyncio.create_task(invoice_change_notifier.wait(5))
+        await asyncio.sleep(0.05)
+        invoice_change_notifier.notify(redis_client)
+        woken = await waiting
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+        return woken
+
+    assert asyncio.run(scenario()) is True
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+from prometheus_client import REGISTRY
+
+from app.services.invoice_service import save_invoice
+
+
+class _FakeInvoicesTable:
+    """Just enough of the PostgREST builder chain for save_invoice: eq/is_ filters, limit, insert."""
+
+    def __init__(self, rows: list[dict]) -> None:
+        self.rows = rows
+        self.filters: list[tuple[str, object]] = []
+        self.payload: dict | None = None
+
+    def select(self, *_a, **_k) -> "_FakeInvoicesTable":
+        return self
+
+    def eq(self, column: str, value: object) -> "_FakeInvoicesTable":
+        self.filters.append((column, value))
+        return self
+
+    def is_(self, column: str, _value: str) -> "_FakeInvoicesTable":
+        self.filters.append((column, None))
+        return self
+
+    def limit(self, _n: int) -> "_FakeInvoicesTable":
+        return self
+
+    def insert(self, payload: dict) -> "_FakeInvoicesTable":
+        self.payload = payload
+        return self
+
+    def execute(self) -> SimpleNamespace:
+        if self.payload is not None:
+            row = {**self.payload, "id": str(len(self.rows) + 1)}
+            self.rows.append(row)
+            return SimpleNamespace(data=[row])
+        return SimpleNamespace(data=[r for r in self.rows if all(r.get(c) == v for c, v in self.filters)][:1])
+
+
+def _outcome(outcome: str) -> float:
+    return REGISTRY.get_sample_value("invoice_save_outcomes_total", {"outcome": outcome}) or 0.0
+
+
+def test_save_invoice_counts_dedupe_outcomes() -> None:
+    rows: list[dict] = []
+    client = SimpleNamespace(table=lambda _name: _FakeInvoicesTable(rows))
+    data = {"vendor": "Acme", "total": 10.0, "invoice_number": "INV-1", "invoice_date": "2026-01-02"}
+    before = {o: _outcome(o) for o in ("created", "content_hash", "invoice_ref", "idempotency_key")}
+
+    assert save_invoice(data, client=client, user_id="u1", source_content_hash="h1")["status"] == "created"
+    assert save_invoice(data, client=client, user_id="u1", source_content_hash="h1")["status"] == "duplicate"
+    assert save_invoice(data, client=client, user_id="u1", source_content_hash="h2")["status"] == "duplicate"
+    assert save_invoice(data, client=client, idempotency_key="k1")["status"] == "created"
+    assert save_invoice({**data, "vendor": "Other"}, client=client, idempotency_key="k1")["status"] == "duplicate"
+
+    assert _outcome("created") == before["created"] + 2
+    assert _outcome("content_hash") == before["content_hash"] + 1
+    assert _outcome("invoice_ref") == before["invoice_ref"] + 1
+    assert _outcome("idempotency_key") == before["idempotency_key"] + 1
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import json
+
+import httpx
+import pytest
+from starlette.testclient import TestClient
+
+from app.services.invoice_stream import InvoiceStreamError, JsonArrayRows
+
+_AUTH = {"X-App-Password": "test-app-password"}
+_NDJSON = {**_AUTH, "Accept": "application/x-ndjson"}
+
+
+class _Chunks(httpx.AsyncByteStream):
+    def __init__(self, chunks: list[bytes], fail_after: bool = False) -> None:
+        self.chunks = chunks
+        self.fail_after = fail_after
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+        if self.fail_after:
+            raise httpx.ReadError("connection reset")
+
+
+def _postgrest(monkeypatch: pytest.MonkeyPatch, handler) -> list[httpx.Request]:
+    seen: list[httpx.Request] = []
+
+    def record(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        return handler(request)
+
+    monkeypatch.setattr(
+        "app.services.invoice_stream.get_http_client",
+        lambda: httpx.AsyncClient(transport=httpx.MockTransport(record)),
+    )
+    return seen
+
+
+def test_json_array_rows_survive_any_chunking() -> None:
+    rows = [{"id": str(i), "vendor": "Café “Ünïcode”", "note": "a, b ] [ {"} for i in range(5)]
+    raw = b" [\n" + b" ,\n".join(json.dumps(r, ensure_ascii=False).encode() for r in rows) + b"\n] "
+    for size in (1, 2, 7, len(raw)):
+        decoder = JsonArrayRows()
+        out = []
+        for i in range(0, len(raw), size):
+            out.extend(decoder.feed(raw[i : i + size]))
+        out.extend(decoder.feed(b"", final=True))
+        assert out == rows
+
+    assert JsonArrayRows().feed(b"[]", final=True) == []
+    with pytest.raises(InvoiceStreamError):
+        JsonArrayRows().feed(b'[{"id": 1}', final=True)
+    with pytest.raises(InvoiceStreamError):
+        JsonArrayRows().feed(b'{"message": "nope"}')
+
+
+def test_ndjson_streams_rows_then_meta(monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    body = json.dumps([{"id": str(i), "total": i} for i in range(3)]).encode()
+    seen = _postgrest(
+        monkeypatch,
+        lambda _req: httpx.Response(
+            200,
+            headers={"Content-Range": "3-5/8"},
+            stream=_Chunks([body[i : i + 10] for i in range(0, len(body), 10)]),
+        ),
+    )
+    r = client.get("/invoices", headers=_NDJSON, params={"page": 2, "limit": 3})
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/x-ndjson"
+    assert "etag" in r.headers
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert [row["id"] for row in lines[:-1]] == ["0", "1", "2"]
+    assert lines[-1] == {"_meta": {"total": 8, "page": 2, "limit": 3, "offset": 3, "count": 3, "next_page": 3}}
+
+    params = dict(seen[0].url.params)
+    assert params == {"select": "*", "order": "created_at.desc", "offset": "3", "limit": "3"}
+    assert seen[0].headers["prefer"] == "count=exact"
+
+
+def test_ndjson_reports_truncation_and_upstream_errors(monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    _postgrest(
+        monkeypatch,
+        lambda _req: httpx.Response(200, headers={"Content-Range": "0-49/50"}, stream=_Chunks([b'[{"id": "1"},'], fail_after=True)),
+    )
+    lines = [json.loads(line) for line in client.get("/invoices", headers=_NDJSON).text.splitlines()]
+    assert lines == [{"id": "1"}, {"_meta": {"error": "upstream_stream_failed", "count": 1}}]
+
+    _postgrest(monkeypatch, lambda _req: httpx.Response(401, json={"message": "JWT expired"}))
+    assert client.get("/invoices", headers=_NDJSON).status_code == 502
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import json
+
+import httpx
+import pytest
+from openai import AzureOpenAI
+from prometheus_client import REGISTRY
+
+from app.services import azure_invoice_agent
+from app.services.azure_invoice_agent import LLMExtractionError, extract_invoice_from_email
+from app.services.llm_usage import LlmUsageRecorder, set_llm_principal
+
+
+def _completion(*, content: str | None, refusal: str | None = None) -> dict:
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-4o-mini",
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content, "refusal": refusal},
+            }
+        ],
+        "usage": {"prompt_tokens": 120, "completion_tokens": 30, "total_tokens": 150},
+    }
+
+
+@pytest.fixture
+def azure_responses(monkeypatch: pytest.MonkeyPatch) -> tuple[list[httpx.Response], LlmUsageRecorder]:
+    queue: list[httpx.Response] = []
+    transport = httpx.MockTransport(lambda _request: queue.pop(0))
+    fake = AzureOpenAI(
+        api_key="test",
+        api_version="2024-08-01-preview",
+        azure_endpoint="https://test.openai.azure.com",
+        http_client=httpx.Client(transport=transport),
+        max_retries=2,
+    )
+    recorder = LlmUsageRecorder(flush_interval_s=60, max_principals=10)
+    monkeypatch.setattr(azure_invoice_agent, "client", fake)
+    monkeypatch.setattr(azure_invoice_agent, "llm_usage", recorder)
+    return queue, recorder
+
+
+def _sample(name: str, labels: dict[str, str]) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_usage_retries_and_tokens_are_recorded(azure_responses) -> None:
+    queue, recorder = azure_responses
+    invoice = {"vendor": "Acme", "total": 12.5, "currency": None, "invoice_date": "2026-01-02", "sender_email": None}
+    queue.append(httpx.Response(429, headers={"retry-after-ms": "1"}, json={"error": {"message": "slow down"}}))
+    queue.append(httpx.Response(200, json=_completion(content=json.dumps(invoice))))
+    deployment = azure_invoice_agent.DEPLOYMENT_NAME
+    prompt_before = _sample("llm_tokens_total", {"deployment": deployment, "type": "prompt"})
+    retries_before = _sample("llm_retries_total", {"deployment": deployment})
+
+    set_llm_principal("key:abc")
+    data = extract_invoice_from_email("Invoice from Acme, total 12.50")
+
+    assert data == {"vendor": "Acme", "total": 12.5, "currency": "USD", "invoice_date": "2026-01-02"}
+    assert _sample("llm_tokens_total", {"deployment": deployment, "type": "prompt"}) == prompt_before + 120
+    assert _sample("llm_retries_total", {"deployment": deployment}) == retries_before + 1
+    [row] = recorder.drain()
+    assert (row["principal"], row["requests"], row["prompt_tokens"], row["completion_tokens"]) == ("key:abc", 1, 120, 30)
+
+
+def test_refusal_and_schema_errors_are_classified(azure_responses) -> None:
+    queue, _recorder = azure_responses
+    queue.append(httpx.Response(200, json=_completion(content=None, refusal="I can't help with that.")))
+    queue.append(httpx.Response(200, json=_completion(content='{"vendor": 42}')))
+    outcomes = []
+    for _ in range(2):
+        with pytest.raises(LLMExtractionError) as err:
+            extract_invoice_from_email("text")
+        outcomes.append(err.value.outcome)
+    assert outcomes == ["refusal", "schema_error"]
+
+
+def test_failed_call_records_sdk_retries(azure_responses) -> None:
+    queue, _recorder = azure_responses
+    queue.extend(
+        httpx.Response(503, headers={"retry-after-ms": "1"}, json={"error": {"message": "busy"}}) for _ in range(3)
+    )
+    deployment = azure_invoice_agent.DEPLOYMENT_NAME
+    retries_before = _sample("llm_retries_total", {"deployment": deployment})
+    failed_before = _sample("llm_requests_total", {"deployment": deployment, "outcome": "api_error"})
+
+    with pytest.raises(LLMExtractionError) as err:
+        extract_invoice_from_email("text")
+
+    assert err.value.outcome == "api_error"
+    assert _sample("llm_retries_total", {"deployment": deployment}) == retries_before + 2
+    assert _sample("llm_requests_total", {"deployment": deployment, "outcome": "api_error"}) == failed_before + 1
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import io
+import json
+import threading
+
+from prometheus_client import REGISTRY
+
+from app.logging_config import QueueLogSink, _json_renderer
+
+
+class _StalledStream(io.StringIO):
+    """stdout stuck behind backpressure until released."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.release = threading.Event()
+        self.writes = 0
+
+    def write(self, s: str) -> int:
+        self.release.wait(5)
+        self.writes += 1
+        return super().write(s)
+
+
+def _dropped() -> float:
+    return REGISTRY.get_sample_value("log_lines_dropped_total") or 0.0
+
+
+def test_sink_batches_lines_off_the_caller_thread() -> None:
+    stream = _StalledStream()
+    sink = QueueLogSink(stream, max_lines=100, batch_lines=50)
+    for i in range(20):
+        sink.put(f"line {i}")  # returns immediately although stdout is stalled
+    stream.release.set()
+    assert sink.flush(timeout=5)
+    assert stream.getvalue().splitlines() == [f"line {i}" for i in range(20)]
+    assert stream.writes <= 2
+
+
+def test_sink_drops_and_counts_when_full() -> None:
+    stream = _StalledStream()
+    sink = QueueLogSink(stream, max_lines=5, batch_lines=1)
+    before = _dropped()
+    sink.put("first")
+    for _ in range(30):
+        sink.put("x")
+    stream.release.set()
+    assert sink.flush(timeout=5)
+    written = stream.getvalue().splitlines()
+    assert sink.dropped == 31 - len(written)
+    assert sink.dropped >= 25
+    assert _dropped() == before + sink.dropped
+
+
+class _CountingSink(QueueLogSink):
+    writers = 0
+
+    def _run(self) -> None:
+        with _COUNT_LOCK:
+            type(self).writers += 1
+        super()._run()
+
+
+_COUNT_LOCK = threading.Lock()
+
+
+def test_concurrent_first_lines_start_one_writer() -> None:
+    for _ in range(10):
+        _CountingSink.writers = 0
+        stream = io.StringIO()
+        sink = _CountingSink(stream, max_lines=1000, batch_lines=50)
+        barrier = threading.Barrier(16)
+
+        def _log(i: int, sink: QueueLogSink = sink, barrier: threading.Barrier = barrier) -> None:
+            barrier.wait()
+            sink.put(f"line {i}")
+
+        threads = [threading.Thread(target=_log, args=(i,)) for i in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert sink.flush(timeout=5)
+        assert _CountingSink.writers == 1
+        assert sorted(stream.getvalue().splitlines()) == sorted(f"line {i}" for i in range(16))
+
+
+def test_forked_child_does_not_rewrite_the_parents_queued_lines() -> None:
+    stream = io.StringIO()
+    sink = QueueLogSink(stream, max_lines=100, batch_lines=50)
+    # State as inherited by a gunicorn worker: lines queued in the parent, writer started under another pid.
+    sink._pid = -1
+    sink._lines.extend(["parent 1", "parent 2"])
+    sink.put("child")
+    assert sink.flush(timeout=5)
+    assert stream.getvalue().splitlines() == ["child"]
+
+
+def test_orjson_renderer_matches_stdlib_output() -> None:
+    event = {"event": "http_request", "status_code": 200, "duration_ms": 1.5, "path": "/é", "obj": object()}
+    fast = json.loads(_json_renderer("orjson")(None, "info", dict(event)))
+    slow = json.loads(_json_renderer("stdlib")(None, "info", dict(event)))
+    assert fast == slow
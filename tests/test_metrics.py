@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+_WORKER = textwrap.dedent(
+    """
+    import os
+    import sys
+    from app import metrics
+
+    print(os.getpid())
+    metrics.record_save_outcome("created")
+    metrics.RATE_LIMIT_MEMORY_CLIENTS.set(int(sys.argv[1]))
+    with metrics.time_stage("read", kind="pdf"):
+        pass
+    """
+)
+
+_SCRAPE = textwrap.dedent(
+    """
+    import sys
+    from app import metrics
+
+    metrics.mark_worker_dead(int(sys.argv[1]))
+    sys.stdout.write(metrics.render_metrics_payload()[0].decode())
+    """
+)
+
+
+def _python(code: str, *args: str, env: dict[str, str]) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-c", code, *args],
+        env=env,
+        cwd=Path(__file__).resolve().parents[1],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def test_multiprocess_metrics_aggregate_across_workers(tmp_path: Path) -> None:
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+    dead_pid = _python(_WORKER, "3", env=env).stdout.strip()
+    _python(_WORKER, "5", env=env)
+
+    # Both workers exited without cleanup; marking one dead drops only its live gauge.
+    out = _python(_SCRAPE, dead_pid, env=env).stdout
+
+    assert 'invoice_save_outcomes_total{outcome="created"} 2.0' in out
+    assert 'invoice_pipeline_stage_duration_seconds_count{kind="pdf",stage="read"} 2.0' in out
+    assert "rate_limit_memory_tracked_clients 5.0" in out
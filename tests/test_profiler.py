@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+from starlette.testclient import TestClient
+
+from app import profiler
+from app.config import settings
+from app.main import app
+from app.profiler import sample_stacks
+
+_AUTH = {"Authorization": "Bearer profile-secret"}
+
+
+@pytest.fixture
+def profiler_on(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "PROFILER_ENABLED", True)
+    monkeypatch.setattr(settings, "METRICS_BEARER_TOKEN", "profile-secret")
+    monkeypatch.setattr(settings, "PROFILER_SAMPLE_HZ", 200)
+
+
+def _spin(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_profile_requires_flag_and_bearer(monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    monkeypatch.setattr(settings, "METRICS_BEARER_TOKEN", "profile-secret")
+    assert client.get("/admin/profile?seconds=0.01", headers=_AUTH).status_code == 404
+    monkeypatch.setattr(settings, "PROFILER_ENABLED", True)
+    monkeypatch.setattr(settings, "METRICS_BEARER_TOKEN", None)
+    assert client.get("/admin/profile?seconds=0.01", headers=_AUTH).status_code == 404
+    monkeypatch.setattr(settings, "METRICS_BEARER_TOKEN", "profile-secret")
+    assert client.get("/admin/profile?seconds=0.01", headers={"Authorization": "Bearer nope"}).status_code == 401
+
+
+def test_profile_returns_collapsed_and_speedscope(profiler_on, client: TestClient) -> None:
+    stop = threading.Event()
+    worker = threading.Thread(target=_spin, args=(stop,), name="spinner")
+    worker.start()
+    try:
+        collapsed = client.get("/admin/profile?seconds=0.2", headers=_AUTH)
+        speedscope = client.get("/admin/profile?seconds=0.2&format=speedscope", headers=_AUTH)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert collapsed.status_code == 200
+    spinner = [line for line in collapsed.text.splitlines() if line.startswith("spinner;")]
+    assert spinner and all("_spin (tests/test_profiler.py:" in line for line in spinner)
+    assert int(spinner[0].rsplit(" ", 1)[1]) > 0
+    doc = speedscope.json()
+    assert doc["profiles"][0]["type"] == "sampled"
+    names = [f["name"] for f in doc["shared"]["frames"]]
+    assert "spinner" in names
+    assert all(max(row) < len(names) for row in doc["profiles"][0]["samples"])
+
+
+def test_single_session_per_process(profiler_on, client: TestClient) -> None:
+    with profiler._SESSION_LOCK:
+        assert client.get("/admin/profile?seconds=0.01", headers=_AUTH).status_code == 409
+
+
+def test_route_filter_keeps_only_matching_requests(monkeypatch: pytest.MonkeyPatch) -> None:
+    def _slow_parse(_path: str) -> dict:
+        time.sleep(0.4)
+        return {"vendor": "Acme", "total": 1.0, "currency": "USD", "invoice_date": "2026-01-01"}
+
+    monkeypatch.setattr("app.main.parse_mock_email", _slow_parse)
+
+    def _sample_during_request(route: str) -> str:
+        caller = threading.Thread(
+            target=lambda: TestClient(app).post("/process-mock-email", headers={"X-App-Password": "test-app-password"})
+        )
+        caller.start()
+        time.sleep(0.1)
+        stacks, _ticks = sample_stacks(seconds=0.2, hz=200, route=route)
+        caller.join()
+        return profiler.to_collapsed(stacks)
+
+    assert "_slow_parse" in _sample_during_request("/process-mock-email")
+    assert "_slow_parse" not in _sample_during_request("/invoices")
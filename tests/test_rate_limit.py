@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from starlette.requests import Request
+from starlette.testclient import TestClient
+
+from app import rate_limit
+from app.rate_limit import check_rate_limit, rate_limit_headers
+from app.rate_limit_store import ShardedWindowStore
+
+
+def _request(redis_client=None, ip: str = "10.0.0.1") -> Request:
+    app = SimpleNamespace(state=SimpleNamespace(redis=redis_client))
+    return Request({"type": "http", "app": app, "headers": [], "client": (ip, 1234), "method": "POST", "path": "/"})
+
+
+@pytest.fixture(autouse=True)
+def clear_memory_limiter(monkeypatch: pytest.MonkeyPatch) -> None:
+    rate_limit._MEMORY_STORE.clear()
+    rate_limit._LEASES.clear()
+    monkeypatch.setattr(rate_limit, "_redis_retry_at", 0.0)
+
+
+def test_redis_sliding_window_limits_and_reports_quota() -> None:
+    async def _run() -> list:
+        redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        decisions = [await check_rate_limit(_request(redis_client), action="t", max_requests=3, window_seconds=60) for _ in range(4)]
+        ttl = await redis_client.pttl("rl:v1:sw:t:10.0.0.1")
+        return decisions + [ttl]
+
+    *decisions, ttl = asyncio.run(_run())
+    assert [d.limited for d in decisions] == [False, False, False, True]
+    assert [d.remaining for d in decisions] == [2, 1, 0, 0]
+    assert 0 < decisions[-1].reset_seconds <= 60
+    assert 0 < ttl <= 60_000
+
+
+def test_redis_check_is_one_round_trip() -> None:
+    async def _run() -> int:
+        redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await check_rate_limit(_request(redis_client), action="rt", max_requests=5, window_seconds=60, strict=True)
+        calls: list[tuple] = []
+        real = redis_client.execute_command
+
+        async def _counting(*args, **kwargs):
+            calls.append(args)
+            return await real(*args, **kwargs)
+
+        redis_client.execute_command = _counting
+        await check_rate_limit(_request(redis_client), action="rt", max_requests=5, window_seconds=60, strict=True)
+        return len(calls)
+
+    assert asyncio.run(_run()) == 1
+
+
+def test_memory_fallback_reports_quota() -> None:
+    async def _run() -> list:
+        return [await check_rate_limit(_request(), action="m", max_requests=2, window_seconds=30) for _ in range(3)]
+
+    decisions = asyncio.run(_run())
+    assert [d.limited for d in decisions] == [False, False, True]
+    headers = rate_limit_headers(decisions[-1])
+    assert headers["RateLimit-Limit"] == "2"
+    assert headers["RateLimit-Remaining"] == "0"
+    assert int(headers["Retry-After"]) >= 1
+
+
+def test_login_emits_rate_limit_headers(monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    monkeypatch.setattr("app.main.check_rate_limit", check_rate_limit)
+    token = re.search(r'name="csrf_token"\s+value="([^"]+)"', client.get("/").text).group(1)
+    responses = [
+        client.post("/login", data={"csrf_token": token, "password": "wrong"}, follow_redirects=False)
+        for _ in range(6)
+    ]
+    assert responses[0].headers["ratelimit-remaining"] == "4"
+    assert "retry-after" not in responses[0].headers
+    assert "rate_limited" in responses[-1].headers["location"]
+    assert int(responses[-1].headers["retry-after"]) >= 1
+
+
+def test_memory_store_is_bounded_and_swept() -> None:
+    store = ShardedWindowStore(max_keys=64, shards=4)
+    for i in range(1000):
+        store.hit(f"login:10.0.{i // 256}.{i % 256}", limit=5, window_seconds=60, now=100.0)
+    assert len(store) == 64
+    assert store.hit("login:fresh", limit=1, window_seconds=60, now=100.0)[0] is False
+    assert store.hit("login:fresh", limit=1, window_seconds=60, now=130.0)[0] is True
+    assert store.hit("login:fresh", limit=1, window_seconds=60, now=161.0)[0] is False
+    assert store.sweep(now=200.0) == 63
+    stats = store.stats()
+    assert stats.clients == 1
+    assert 0 < stats.bytes_total < 1024
+
+
+def test_leased_limit_spends_local_quota_and_stays_exact() -> None:
+    async def _run() -> tuple[list, int]:
+        redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        calls: list[tuple] = []
+        real = redis_client.execute_command
+
+        async def _counting(*args, **kwargs):
+            calls.append(args)
+            return await real(*args, **kwargs)
+
+        redis_client.execute_command = _counting
+        decisions = []
+        for _ in range(60):
+            decisions.append(await check_rate_limit(_request(redis_client), action="up", max_requests=50, window_seconds=60))
+            await asyncio.sleep(0)
+        return decisions, sum(1 for c in calls if c[0] == "EVALSHA")
+
+    decisions, evals = asyncio.run(_run())
+    assert sum(not d.limited for d in decisions) == 50
+    assert all(d.limited for d in decisions[50:])
+    # Two single-slot checks before the key is hot, then chunks of 5.
+    assert evals <= 14
+
+
+def test_keys_seen_twice_never_lease() -> None:
+    async def _run() -> list:
+        redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        calls: list[tuple] = []
+        real = redis_client.execute_command
+
+        async def _counting(*args, **kwargs):
+            calls.append(args)
+            return await real(*args, **kwargs)
+
+        redis_client.execute_command = _counting
+        for _ in range(2):
+            for i in range(20):
+                await check_rate_limit(_request(redis_client, ip=f"10.0.1.{i}"), action="up", max_requests=50, window_seconds=60)
+                await asyncio.sleep(0)
+        return [c[0] for c in calls]
+
+    commands = asyncio.run(_run())
+    # One slot per check, as with strict checks (the first EVALSHA is retried after SCRIPT LOAD).
+    assert commands.count("EVALSHA") - commands.count("SCRIPT LOAD") == 40
+    assert "ZREM" not in commands
+
+
+def test_expired_lease_returns_unspent_slots(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(rate_limit.settings, "RATE_LIMIT_LEASE_MAX_SECONDS", 0.05)
+
+    async def _run() -> list[int]:
+        redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        key = f"{rate_limit.settings.RATE_LIMIT_REDIS_KEY_PREFIX}:sw:daily:k1"
+        counted = []
+        # Window far longer than a lease: 3 spends per lease, then the lease lapses while idle.
+        for _ in range(4):
+            for _ in range(3):
+                d = await check_rate_limit(_request(redis_client), action="daily", max_requests=500, window_seconds=86400, identity="k1")
+                assert not d.limited
+            await asyncio.sleep(0.15)
+            counted.append(await redis_client.zcard(key))
+        return counted
+
+    assert asyncio.run(_run()) == [3, 6, 9, 12]
+
+
+def test_leased_slots_are_spent_before_they_leave_the_redis_window() -> None:
+    async def _run() -> int:
+        redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        key = f"{rate_limit.settings.RATE_LIMIT_REDIS_KEY_PREFIX}:sw:short:10.0.0.1"
+        checked = 0
+        # A 1 s window outlived by a steady trickle: refills must not keep the oldest slots alive.
+        for _ in range(16):
+            d = await check_rate_limit(_request(redis_client), action="short", max_requests=20, window_seconds=1)
+            assert not d.limited
+            await asyncio.sleep(0.15)
+            lease = rate_limit._LEASES.get("short:10.0.0.1")
+            if lease is None or time.monotonic() >= lease.expires_at:
+                continue
+            seconds, micros = await redis_client.time()
+            now_ms = seconds * 1000 + micros // 1000
+            for member in lease.members:
+                score = await redis_client.zscore(key, member)
+                assert score is not None and score + 1000 > now_ms
+                checked += 1
+        return checked
+
+    assert asyncio.run(_run()) > 0
+
+
+def test_redis_outage_trips_breaker_and_limits_locally() -> None:
+    class _DownRedis:
+        def __init__(self) -> None:
+            self.calls = 0
+
+        def register_script(self, _source: str):
+            async def _script(**_kwargs):
+                self.calls += 1
+                raise ConnectionError("redis down")
+
+            return _script
+
+    async def _run(redis_client: _DownRedis) -> list:
+        return [
+            await check_rate_limit(_request(redis_client), action="login", max_requests=2, window_seconds=60, strict=True)
+            for _ in range(3)
+        ]
+
+    redis_client = _DownRedis()
+    decisions = asyncio.run(_run(redis_client))
+    assert redis_client.calls == 1
+    assert [d.limited for d in decisions] == [False, False, True]
+
+
+def test_upload_limit_leases_instead_of_asking_redis_per_check() -> None:
+    from app.main import UPLOAD_RATE_LIMIT_MAX_REQUESTS, UPLOAD_RATE_LIMIT_WINDOW_SECONDS
+
+    async def _run() -> tuple[list, int]:
+        redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        calls: list[tuple] = []
+        real = redis_client.execute_command
+
+        async def _counting(*args, **kwargs):
+            calls.append(args)
+            return await real(*args, **kwargs)
+
+        redis_client.execute_command = _counting
+        decisions = []
+        for _ in range(UPLOAD_RATE_LIMIT_MAX_REQUESTS + 1):
+            decisions.append(
+                await check_rate_limit(
+                    _request(redis_client),
+                    action="upload",
+                    max_requests=UPLOAD_RATE_LIMIT_MAX_REQUESTS,
+                    window_seconds=UPLOAD_RATE_LIMIT_WINDOW_SECONDS,
+                )
+            )
+            await asyncio.sleep(0)
+        return decisions, sum(1 for c in calls if c[0] == "EVALSHA")
+
+    decisions, evals = asyncio.run(_run())
+    assert [d.limited for d in decisions] == [False] * UPLOAD_RATE_LIMIT_MAX_REQUESTS + [True]
+    assert evals < len(decisions)
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from pathlib import Path
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.config import settings
+from app.services.upload_security import SNIFF_HEAD_BYTES, read_stream_with_size_limit
+
+_AUTH = {"X-App-Password": "test-app-password"}
+_EXAMPLES = Path(__file__).resolve().parents[1] / "examples"
+
+
+def test_raw_pdf_body_is_parsed_from_memory(monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    def _no_spool(_ext: str) -> str:
+        raise AssertionError("raw-body ingestion must not write a temp file")
+
+    monkeypatch.setattr("app.main.build_safe_temp_path", _no_spool)
+    pdf = (_EXAMPLES / "sample_invoice.pdf").read_bytes()
+    headers = {**_AUTH, "Content-Type": "application/pdf"}
+
+    created = client.post("/api/invoices", headers=headers, content=pdf)
+    assert created.status_code == 201
+    body = created.json()
+    assert body["status"] == "created"
+    assert body["sha256"] == hashlib.sha256(pdf).hexdigest()
+    assert body["invoice"]["invoice_number"] == "INV-NPE-2847-Q1"
+
+    again = client.post("/api/invoices", headers=headers, content=pdf)
+    assert again.status_code == 200
+    assert again.json()["status"] == "duplicate"
+    assert client.post("/api/invoices", content=pdf, headers={"Content-Type": "application/pdf"}).status_code == 401
+
+
+def test_raw_body_rejections(monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    text = (_EXAMPLES / "sample_invoice_email.txt").read_bytes()
+
+    def post(content, content_type: str = "text/plain"):
+        return client.post("/api/invoices", headers={**_AUTH, "Content-Type": content_type}, content=content)
+
+    assert post(text, "application/octet-stream").status_code == 415
+    assert post(text, "application/pdf").json()["detail"] == "invalid_file_type"
+    assert post(b"", "text/plain").status_code == 400
+    assert post(text, "text/plain; charset=utf-8").status_code == 201
+
+    monkeypatch.setattr(settings, "MAX_UPLOAD_FILE_BYTES", 1024)
+    assert post(b"x" * 2048).status_code == 413
+
+    def chunked():  # no Content-Length: the cap is enforced while reading
+        for _ in range(10):
+            yield b"x" * 512
+
+    assert post(chunked()).json()["detail"] == "file_too_large"
+
+
+def test_raw_body_idempotency(client: TestClient) -> None:
+    text = (_EXAMPLES / "sample_invoice_email.txt").read_bytes()
+    headers = {**_AUTH, "Content-Type": "text/plain", "Idempotency-Key": "raw-1"}
+    first = client.post("/api/invoices", headers=headers, content=text)
+    replay = client.post("/api/invoices", headers=headers, content=text)
+    assert first.status_code == replay.status_code == 201
+    assert replay.json() == first.json()
+    assert replay.headers.get("idempotent-replayed") == "true"
+    assert client.post("/api/invoices", headers=headers, content=text + b"\n").status_code == 409
+
+
+def test_stream_reader_rejects_mislabeled_body_after_head() -> None:
+    consumed: list[int] = []
+
+    async def chunks():
+        for i in range(8):
+            consumed.append(i)
+            yield b"A" * (SNIFF_HEAD_BYTES // 2)
+
+    upload, error = asyncio.run(read_stream_with_size_limit(chunks(), 10 * 1024 * 1024, declared_ext="pdf"))
+    assert upload is None and error == "invalid_file_type"
+    assert len(consumed) == 2
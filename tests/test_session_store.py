@@ -0,0 +1,120 @@
+"""
+SESSION_BACKEND=redis: opaque id cookie, dirty-only writes, rotation on sign-in, load on demand.
+"""
+
+from __future__ import annotations
+
+import fakeredis
+import pytest
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.session_store import RedisSessionMiddleware, load_session
+
+
+class _CountingRedis(fakeredis.aioredis.FakeRedis):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.calls: list[str] = []
+
+    async def execute_command(self, *args, **options):
+        self.calls.append(str(args[0]).upper())
+        return await super().execute_command(*args, **options)
+
+
+def _app(store: fakeredis.aioredis.FakeRedis) -> Starlette:
+    async def login(request: Request) -> JSONResponse:
+        await load_session(request)
+        request.session["auth_user_id"] = request.query_params["user"]
+        return JSONResponse({"ok": True})
+
+    async def whoami(request: Request) -> JSONResponse:
+        await load_session(request)
+        return JSONResponse({"user": request.session.get("auth_user_id")})
+
+    async def logout(request: Request) -> JSONResponse:
+        await load_session(request)
+        request.session.clear()
+        return JSONResponse({"ok": True})
+
+    async def health(request: Request) -> JSONResponse:
+        return JSONResponse({"ok": True})
+
+    async def forgot_to_load(request: Request) -> JSONResponse:
+        return JSONResponse({"user": request.session.get("auth_user_id")})
+
+    app = Starlette(
+        routes=[
+            Route("/login", login),
+            Route("/whoami", whoami),
+            Route("/logout", logout),
+            Route("/health", health),
+            Route("/forgot", forgot_to_load),
+        ]
+    )
+    app.add_middleware(RedisSessionMiddleware, max_age=600, key_prefix="session:test", redis=store)
+    return app
+
+
+def _keys(client: TestClient, store: fakeredis.aioredis.FakeRedis) -> list[str]:
+    # The fake client is bound to the portal's event loop; query it there.
+    return client.portal.call(store.keys, "session:test:*")
+
+
+def test_session_lives_in_redis_behind_an_opaque_cookie() -> None:
+    store = _CountingRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    with TestClient(_app(store)) as client:
+        r = client.get("/login", params={"user": "u-1"})
+        session_id = r.cookies["session"]
+        assert len(session_id) == 43 and "u-1" not in session_id
+        assert "Max-Age=600" in r.headers["set-cookie"]
+        assert _keys(client, store) == [f"session:test:{session_id}"]
+        assert 0 < client.portal.call(store.ttl, f"session:test:{session_id}") <= 600
+
+        store.calls.clear()
+        assert client.get("/whoami").json() == {"user": "u-1"}
+        assert store.calls == ["GETEX"]  # read-only request: no write back
+
+
+def test_sign_in_rotates_id_and_logout_deletes_session() -> None:
+    store = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    with TestClient(_app(store)) as client:
+        first = client.get("/login", params={"user": "u-1"}).cookies["session"]
+        second = client.get("/login", params={"user": "u-2"}).cookies["session"]
+        assert second != first
+        assert _keys(client, store) == [f"session:test:{second}"]
+
+        r = client.get("/logout")
+        assert "session=null" in r.headers["set-cookie"]
+        assert _keys(client, store) == []
+        assert client.get("/whoami").json() == {"user": None}
+
+
+def test_unknown_or_malformed_cookie_is_a_fresh_session() -> None:
+    store = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    with TestClient(_app(store)) as client:
+        client.cookies.set("session", "x" * 43)
+        r = client.get("/whoami")
+        assert r.json() == {"user": None}
+        assert "session=null" in r.headers["set-cookie"]
+
+        client.cookies.set("session", "not a session id")
+        assert client.get("/whoami").json() == {"user": None}
+
+
+def test_routes_that_never_load_the_session_never_touch_the_store() -> None:
+    store = _CountingRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    with TestClient(_app(store)) as client:
+        client.get("/login", params={"user": "u-1"})
+
+        store.calls.clear()
+        r = client.get("/health")
+        assert r.json() == {"ok": True}
+        assert "set-cookie" not in r.headers
+        assert store.calls == []
+
+        with pytest.raises(RuntimeError, match="load_session"):
+            client.get("/forgot")
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import re
+
+import pytest
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from starlette.testclient import TestClient
+
+from app.config import settings
+from app.tracing import configure_tracing, shutdown_tracing
+
+_TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+
+@pytest.fixture(scope="module")
+def spans() -> InMemorySpanExporter:
+    exporter = InMemorySpanExporter()
+    configure_tracing(exporter=exporter)
+    return exporter
+
+
+def _finished(exporter: InMemorySpanExporter) -> list:
+    shutdown_tracing()
+    return list(exporter.get_finished_spans())
+
+
+def test_request_continues_traceparent_and_nests_pipeline_spans(spans, client: TestClient) -> None:
+    spans.clear()
+    r = client.post(
+        "/process-mock-email",
+        headers={"X-App-Password": "test-app-password", "traceparent": f"00-{_TRACE_ID}-00f067aa0ba902b7-01"},
+    )
+    assert r.status_code == 200
+
+    finished = {s.name: s for s in _finished(spans)}
+    server = finished["POST /process-mock-email"]
+    assert format(server.context.trace_id, "032x") == _TRACE_ID
+    assert server.attributes["http.response.status_code"] == 200
+    parse = finished["invoice.parse"]
+    assert parse.context.trace_id == server.context.trace_id
+    assert parse.attributes["invoice.kind"] == "txt"
+    assert finished["invoice.llm"].parent.span_id == parse.context.span_id
+    assert finished["invoice.save"].parent.span_id == server.context.span_id
+
+
+def test_session_cookie_decode_is_traced(spans, client: TestClient) -> None:
+    client.get("/")
+    spans.clear()
+    client.get("/")
+    assert "session.decode" in {s.name for s in _finished(spans)}
+
+
+def test_latency_histograms_carry_trace_exemplars(spans, monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    monkeypatch.setattr(settings, "OBSERVABILITY_METRICS_ENABLED", True)
+    monkeypatch.setattr(settings, "METRICS_BEARER_TOKEN", None)
+    client.get("/health", headers={"traceparent": f"00-{_TRACE_ID}-00f067aa0ba902b7-01"})
+
+    r = client.get("/metrics", headers={"Accept": "application/openmetrics-text; version=1.0.0"})
+    assert r.headers["content-type"].startswith("application/openmetrics-text")
+    assert re.search(rf'http_server_request_duration_seconds_bucket\{{[^}}]*route="/health"[^}}]*\}} \S+ # \{{span_id="[0-9a-f]{{16}}",trace_id="{_TRACE_ID}"\}}', r.text)
+    assert "# {" not in client.get("/metrics").text
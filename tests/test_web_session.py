@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+from starlette.testclient import TestClient
+
+from app.config import settings
+from app.services import web_session
+
+_SECRET = "super-secret-jwt-token-with-at-least-32-characters"
+_USER = "6f1d9c1e-0000-4000-8000-000000000001"
+
+
+def _token(exp_in: float, *, secret: str = _SECRET) -> str:
+    return jwt.encode({"sub": _USER, "aud": "authenticated", "exp": int(time.time() + exp_in)}, secret, algorithm="HS256")
+
+
+@pytest.fixture
+def supabase_auth(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    monkeypatch.setattr(settings, "WEB_AUTH_PROVIDER", "supabase")
+    monkeypatch.setattr(settings, "SUPABASE_JWT_SECRET", _SECRET)
+    monkeypatch.setattr("app.main.get_supabase_for_request", lambda _request: None)
+    web_session._recent_refreshes.clear()
+    refreshed: list[str] = []
+
+    async def _refresh(refresh_token: str) -> dict | None:
+        refreshed.append(refresh_token)
+        if refresh_token == "dead":
+            return None
+        return {"access_token": _token(3600), "refresh_token": f"{refresh_token}-next"}
+
+    monkeypatch.setattr(web_session, "refresh_session", _refresh)
+    return refreshed
+
+
+def _login(monkeypatch: pytest.MonkeyPatch, client: TestClient, access_token: str, refresh_token: str = "r1") -> None:
+    async def _sign_in(_email: str, _password: str) -> dict:
+        return {"access_token": access_token, "refresh_token": refresh_token, "user": {"id": _USER, "email": "a@example.com"}}
+
+    monkeypatch.setattr("app.main.sign_in_with_email_password", _sign_in)
+    csrf = re.search(r'name="csrf_token"\s+value="([^"]+)"', client.get("/").text).group(1)
+    r = client.post("/login", data={"csrf_token": csrf, "email": "a@example.com", "password": "pw"}, follow_redirects=False)
+    assert r.headers["location"] == "/dashboard"
+
+
+def test_valid_token_is_verified_locally(supabase_auth, monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    _login(monkeypatch, client, _token(3600))
+    assert client.get("/dashboard", follow_redirects=False).status_code == 200
+    assert supabase_auth == []
+
+
+def test_token_near_expiry_is_refreshed_once_in_place(supabase_auth, monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    _login(monkeypatch, client, _token(30))
+    assert client.get("/dashboard", follow_redirects=False).status_code == 200
+    assert client.get("/dashboard", follow_redirects=False).status_code == 200
+    assert supabase_auth == ["r1"]
+
+
+def test_dead_session_is_rejected_before_upload_work(supabase_auth, monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    async def _must_not_read(*_a, **_k):
+        raise AssertionError("upload read after the session was known to be dead")
+
+    monkeypatch.setattr("app.main.read_upload_with_size_limit", _must_not_read)
+    _login(monkeypatch, client, _token(-60), refresh_token="dead")
+    r = client.post("/upload-invoice", files={"file": ("a.txt", b"Total: 1")}, follow_redirects=False)
+    assert r.headers["location"] == "/?error=session_expired"
+    assert client.get("/dashboard", follow_redirects=False).headers["location"] == "/?error=auth_required"
+
+
+def test_forged_token_clears_session(supabase_auth, monkeypatch: pytest.MonkeyPatch, client: TestClient) -> None:
+    _login(monkeypatch, client, _token(3600, secret="x" * 40))
+    r = client.get("/dashboard", follow_redirects=False)
+    assert r.headers["location"] == "/?error=session_expired"
+    assert supabase_auth == []
+
+
+def test_asymmetric_tokens_use_cached_jwks(monkeypatch: pytest.MonkeyPatch) -> None:
+    private = ec.generate_private_key(ec.SECP256R1())
+    jwk = json.loads(jwt.algorithms.ECAlgorithm.to_jwk(private.public_key()))
+    fetches: list[int] = []
+
+    async def _fetch_jwks() -> dict:
+        fetches.append(1)
+        return {"keys": [{**jwk, "kid": "k1", "alg": "ES256"}]}
+
+    monkeypatch.setattr(web_session, "fetch_jwks", _fetch_jwks)
+    monkeypatch.setattr(web_session, "_jwks", web_session.JwksCache(cache_seconds=600))
+    token = jwt.encode({"sub": _USER, "aud": "authenticated", "exp": int(time.time()) + 60}, private, algorithm="ES256", headers={"kid": "k1"})
+
+    async def _run() -> list[dict]:
+        return [await web_session._claims(token) for _ in range(3)]
+
+    assert all(c["sub"] == _USER for c in asyncio.run(_run()))
+    assert fetches == [1]